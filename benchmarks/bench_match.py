@@ -0,0 +1,102 @@
+"""
+Benchmarks the match scoring engines on synthetic data.
+
+Generates environments with random package sets and a requirements list,
+then times `matcher.score_environments` with the pure-Python and NumPy
+engines and checks that both rank the environments identically.
+
+'first' is the first file scored against a package index (for NumPy this
+includes converting the index to arrays); 'next' is every further file
+scored against the same index, as in `envpilot match a.txt b.txt ...`.
+
+    python benchmarks/bench_match.py
+    python benchmarks/bench_match.py --envs 100 300 1000 --reqs 300
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envpilot import matcher
+
+def make_environments(count, vocabulary, rng, packages_per_env=150):
+    """Creates environment records with random {name: version} package maps."""
+    versions = ["1.0.0", "1.2.0", "1.4.2", "2.0.0", "2.1.0rc1", "2.3.1", "3.0.0", "0.9.8"]
+    environments = []
+    for i in range(count):
+        names = rng.sample(vocabulary, min(packages_per_env, len(vocabulary)))
+        environments.append({
+            "name": f"env{i}",
+            "path": f"/synthetic/env{i}",
+            "packages": {name: rng.choice(versions) for name in names},
+        })
+    return environments
+
+def make_requirements(count, vocabulary, rng):
+    """Creates a list of requirements with a mix of specifiers."""
+    specifiers = ["", ">=1.0", "==2.0.0", "<2", ">=1.2,<3", "!=1.4.2", "~=2.0"]
+    return [matcher.parse_requirement_line(name + rng.choice(specifiers)) for name in rng.sample(vocabulary, count)]
+
+def time_engine(engine, required_packages, environments, repeat):
+    """Returns the best (first, next) times over `repeat` runs and the ranking."""
+    best_first = best_next = None
+    ranking = None
+    for _ in range(repeat):
+        # Start cold: fresh index, empty parse caches
+        package_index = matcher.build_package_index(environments)
+        matcher.parse_version.cache_clear()
+        matcher.specifier_contains.cache_clear()
+
+        start = time.perf_counter()
+        matcher.score_environments(required_packages, environments, package_index, engine)
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, _, scores = matcher.score_environments(required_packages, environments, package_index, engine)
+        following = time.perf_counter() - start
+
+        best_first = first if best_first is None else min(best_first, first)
+        best_next = following if best_next is None else min(best_next, following)
+        ranking = sorted(range(len(scores)), key=lambda p: scores[p], reverse=True)
+    return best_first, best_next, ranking
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--envs", type=int, nargs="+", default=[10, 100, 1000], help="Environment counts to benchmark.")
+    parser.add_argument("--reqs", type=int, default=300, help="Number of requirements.")
+    parser.add_argument("--vocabulary", type=int, default=1000, help="Number of distinct package names.")
+    parser.add_argument("--packages", type=int, default=150, help="Packages installed per environment.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per engine; the best time is reported.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [f"package-{i}" for i in range(args.vocabulary)]
+    required_packages = make_requirements(min(args.reqs, args.vocabulary), vocabulary, rng)
+    engines = ["python"] + (["numpy"] if matcher._get_numpy() is not None else [])
+    if len(engines) == 1:
+        print("NumPy is not installed; only the Python engine is benchmarked.")
+
+    header = f"{'envs':>6} {'reqs':>6}"
+    for engine in engines:
+        header += f" {engine + ' first':>14} {engine + ' next':>14}"
+    print(header + "   (ms)")
+    for env_count in args.envs:
+        environments = make_environments(env_count, vocabulary, rng, args.packages)
+        row = f"{env_count:>6} {len(required_packages):>6}"
+        rankings = []
+        for engine in engines:
+            first, following, ranking = time_engine(engine, required_packages, environments, args.repeat)
+            rankings.append(ranking)
+            row += f" {first * 1000:>14.1f} {following * 1000:>14.1f}"
+        if any(ranking != rankings[0] for ranking in rankings[1:]):
+            print(f"Engines disagree for {env_count} environments", file=sys.stderr)
+            return 1
+        print(row)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+Benchmarks discovery, disk usage, matching and cleaning on synthetic home trees.
+
+For each environment count a fake home directory is generated: virtual
+environments with a pyvenv.cfg, a stub bin/python that is never run, and
+dist-info directories with module files, next to deep unrelated project
+trees. Some environments share package files through hardlinks, as after
+`envpilot dedupe`, and some share identical package sets. Nothing is
+downloaded and pip is never run. The environment and cache directories
+point into the temporary tree, so a real ~/.cache/envpilot or a running
+daemon is never touched.
+
+Results (best of --repeat runs, in seconds) can be written as JSON and
+compared between commits:
+
+    python benchmarks/bench_suite.py --envs 10 100 1000 --output before.json
+    python benchmarks/bench_suite.py --envs 10 100 1000 --output after.json --compare before.json
+    python benchmarks/bench_suite.py --compare before.json after.json
+
+A comparison exits with status 1 if any benchmark got slower than
+--threshold times its baseline. Linux and macOS only.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PYTHON_VERSION = "3.11.7"
+SITE_PACKAGES = os.path.join("lib", "python3.11", "site-packages")
+STUB_PYTHON = '#!/bin/sh\necho "Python %s"\n' % PYTHON_VERSION
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def make_package_templates(templates_dir, vocabulary, rng, files_per_package):
+    """
+    Writes one copy of every package's module files. Environments either
+    hardlink these (as deduplicated environments do) or copy them.
+    Returns {name: [(relative_path, template_path)]}.
+    """
+    templates = {}
+    for name in vocabulary:
+        files = []
+        for i in range(files_per_package):
+            relative_path = os.path.join(name.replace("-", "_"), f"module{i}.py")
+            template_path = os.path.join(templates_dir, relative_path)
+            write_file(template_path, os.urandom(rng.randint(512, 16 * 1024)))
+            files.append((relative_path, template_path))
+        templates[name] = files
+    return templates
+
+def make_environment(env_path, packages, templates, hardlink):
+    """Creates one fake virtual environment with the given {name: version} packages."""
+    write_file(os.path.join(env_path, "pyvenv.cfg"),
+               f"home = /usr/bin\ninclude-system-site-packages = false\nversion = {PYTHON_VERSION}\n".encode())
+    python_path = os.path.join(env_path, "bin", "python")
+    write_file(python_path, STUB_PYTHON.encode())
+    os.chmod(python_path, 0o755)
+
+    site_packages = os.path.join(env_path, SITE_PACKAGES)
+    for name, version in packages.items():
+        dist_info = os.path.join(site_packages, f"{name.replace('-', '_')}-{version}.dist-info")
+        write_file(os.path.join(dist_info, "METADATA"),
+                   f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n\n".encode())
+        record = []
+        for relative_path, template_path in templates[name]:
+            target = os.path.join(site_packages, relative_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if hardlink:
+                os.link(template_path, target)
+            else:
+                shutil.copyfile(template_path, target)
+            record.append(f"{relative_path},,")
+        write_file(os.path.join(dist_info, "RECORD"), "\n".join(record).encode())
+
+def make_noise(project_dir, rng, dirs, depth):
+    """Creates an unrelated directory tree that discovery has to walk past."""
+    for i in range(dirs):
+        path = os.path.join(project_dir, "src", *[f"d{rng.randrange(4)}" for _ in range(rng.randint(1, depth))])
+        write_file(os.path.join(path, f"file{i}.txt"), b"x" * rng.randint(10, 2000))
+    # Excluded by discovery, so it only costs the exclusion check
+    write_file(os.path.join(project_dir, "node_modules", "pkg", "index.js"), b"module.exports = {}\n")
+
+def make_tree(home, env_count, args, rng):
+    """
+    Generates a synthetic home directory with `env_count` environments.
+    Returns the path of a requirements file to match against.
+    """
+    vocabulary = [f"package-{i}" for i in range(args.vocabulary)]
+    versions = ["1.0.0", "1.2.0", "2.0.0", "2.1.3", "3.0.0"]
+    templates = make_package_templates(os.path.join(home, ".templates"), vocabulary, rng, args.files_per_package)
+
+    # A few package sets are reused so duplicate detection has work to do
+    base_sets = [{name: rng.choice(versions) for name in rng.sample(vocabulary, args.packages)} for _ in range(max(1, env_count // 10))]
+    for i in range(env_count):
+        if rng.random() < 0.3:
+            packages = dict(rng.choice(base_sets))
+        else:
+            packages = {name: rng.choice(versions) for name in rng.sample(vocabulary, args.packages)}
+        project_dir = os.path.join(home, "projects", f"group{i % 10}", f"project{i}")
+        env_path = os.path.join(project_dir, rng.choice([".venv", "venv", "env"]))
+        make_environment(env_path, packages, templates, hardlink=rng.random() < args.hardlinked)
+        if rng.random() < 0.5:
+            write_file(os.path.join(env_path, ".project"), project_dir.encode())
+        make_noise(project_dir, rng, args.noise_dirs, args.noise_depth)
+
+    requirements_path = os.path.join(home, "requirements.txt")
+    lines = [f"{name}>={rng.choice(versions)}" for name in rng.sample(vocabulary, min(30, len(vocabulary)))]
+    write_file(requirements_path, ("\n".join(lines) + "\n").encode())
+    return requirements_path
+
+def best_time(func, repeat, setup=None):
+    """Returns the best wall time of `func` over `repeat` runs, calling `setup` untimed before each."""
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_benchmarks(home, requirements_path, args):
+    """Times every subsystem against the tree at `home`. Returns {benchmark: seconds}."""
+    from envpilot import scanner, diskusage, matcher, cleaner, metadata
+
+    def clear_cache():
+        shutil.rmtree(metadata.get_cache_dir(), ignore_errors=True)
+
+    results = {}
+    path_fields = {"path"}
+    probe_fields = {"path", "version", "package_count"}
+    results["scan_walk"] = best_time(lambda: scanner.discover_environments(home, use_cache=False, jobs=args.jobs, fields=path_fields), args.repeat)
+    results["scan_cold"] = best_time(lambda: scanner.discover_environments(home, use_cache=False, jobs=args.jobs, fields=probe_fields), args.repeat)
+    results["scan_index_build"] = best_time(lambda: scanner.discover_environments(home, jobs=args.jobs, fields=probe_fields), args.repeat, setup=clear_cache)
+    results["scan_warm"] = best_time(lambda: scanner.discover_environments(home, jobs=args.jobs, fields=probe_fields), args.repeat)
+
+    env_paths = [env["path"] for env in scanner.discover_environments(home, fields=path_fields)]
+    results["size_cold"] = best_time(lambda: [diskusage.get_disk_usage(path, use_cache=False) for path in env_paths], args.repeat)
+    for path in env_paths:
+        # Fills the per-directory size cache
+        scanner.get_folder_size(path)
+    results["size_warm"] = best_time(lambda: [scanner.get_folder_size(path) for path in env_paths], args.repeat)
+
+    # Fills the index with package maps, so the match timings see a warm index
+    environments = scanner.discover_environments(home, jobs=args.jobs, fields={"path", "size", "packages"})
+    results["match"] = best_time(lambda: matcher.find_best_matches(requirements_path, top=10, jobs=args.jobs), args.repeat)
+    required_packages = matcher.parse_requirements(requirements_path)
+    results["match_score"] = best_time(lambda: matcher.rank_environments(required_packages, environments, top=10), args.repeat)
+
+    results["clean_orphans"] = best_time(lambda: cleaner.find_orphaned_environments(environments), args.repeat)
+    results["clean_duplicates"] = best_time(lambda: cleaner.find_duplicate_environments(environments), args.repeat)
+    total_mb = sum(env["size_mb"] for env in environments)
+    results["clean_budget_plan"] = best_time(lambda: cleaner.plan_eviction(environments, total_mb / 2), args.repeat)
+
+    # Destructive, so it runs last, removing a different tenth of the environments each time
+    victim_sets = iter([environments[offset::10] for offset in range(args.repeat)])
+    results["clean_remove"] = best_time(lambda: cleaner.remove_environments(next(victim_sets), args.jobs), args.repeat)
+    return results
+
+def print_results(results):
+    """Prints one row per benchmark and one column per environment count."""
+    env_counts = sorted(results, key=int)
+    print(f"{'benchmark':<18}" + "".join(f"{env_count + ' envs':>12}" for env_count in env_counts) + "   (ms)")
+    for name in results[env_counts[0]]:
+        print(f"{name:<18}" + "".join(f"{results[env_count][name] * 1000:>12.1f}" for env_count in env_counts))
+
+def get_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, threshold):
+    """Prints current timings against a baseline. Returns the list of regressions."""
+    regressions = []
+    print(f"\n{'envs':>6} {'benchmark':<18} {'baseline':>10} {'current':>10} {'ratio':>7}   (ms)")
+    for env_count, benchmarks in sorted(current["results"].items(), key=lambda item: int(item[0])):
+        base_benchmarks = baseline["results"].get(env_count, {})
+        for name, seconds in benchmarks.items():
+            base = base_benchmarks.get(name)
+            if not base:
+                continue
+            ratio = seconds / base
+            flag = "  <-- slower" if ratio > threshold else ""
+            print(f"{env_count:>6} {name:<18} {base * 1000:>10.1f} {seconds * 1000:>10.1f} {ratio:>7.2f}{flag}")
+            if ratio > threshold:
+                regressions.append((env_count, name, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--envs", type=int, nargs="+", default=[10, 100, 1000], help="Environment counts to benchmark.")
+    parser.add_argument("--vocabulary", type=int, default=400, help="Number of distinct package names.")
+    parser.add_argument("--packages", type=int, default=40, help="Packages installed per environment.")
+    parser.add_argument("--files-per-package", type=int, default=2)
+    parser.add_argument("--hardlinked", type=float, default=0.3, help="Fraction of environments whose files are hardlinks to shared copies.")
+    parser.add_argument("--noise-dirs", type=int, default=20, help="Unrelated files per project, spread over nested directories.")
+    parser.add_argument("--noise-depth", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the best time is reported.")
+    parser.add_argument("--jobs", "-j", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--root", help="Directory to generate the trees in (default: a temporary directory).")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated trees.")
+    parser.add_argument("--output", "-o", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", nargs="+", metavar="JSON", help="Compare against a baseline; with two files, compare them without running.")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Ratio over the baseline that counts as a regression.")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline and at most one result file.")
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        return 1 if compare(baseline, current, args.threshold) else 0
+
+    root = tempfile.mkdtemp(prefix="envpilot-bench-", dir=args.root)
+    output = {
+        "meta": {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "options": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "root", "keep")},
+        },
+        "results": {},
+    }
+    try:
+        for env_count in args.envs:
+            rng = random.Random(args.seed + env_count)
+            home = os.path.join(root, f"home-{env_count}")
+            # Keep envpilot's cache, trash and registry inside the tree
+            os.environ["HOME"] = home
+            os.environ["XDG_CACHE_HOME"] = os.path.join(root, f"cache-{env_count}")
+
+            start = time.perf_counter()
+            requirements_path = make_tree(home, env_count, args, rng)
+            print(f"Generated {env_count} environments in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+            output["results"][str(env_count)] = run_benchmarks(home, requirements_path, args)
+    finally:
+        if args.keep:
+            print(f"Trees kept in {root}", file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_results(output["results"])
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        return 1 if compare(baseline, output, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Checks that the CLI's startup paths stay cheap, using `python -X importtime`.
+
+The fast path behind `envpilot activate NAME` and `envpilot resolve NAME`
+(envpilot.launcher + envpilot.resolver) must not load click, rich or the
+discovery code, and must import within a time budget. Loading the click
+CLI itself (`envpilot --help`) must not pull in the command modules, which
+are imported by the commands that use them.
+
+Exits with status 1 on a regression, so it can run in CI:
+
+    python benchmarks/check_import_time.py
+    python benchmarks/check_import_time.py --budget-ms 30 --show 15
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Startup paths: (label, code to import, module prefixes it must not load)
+CHECKS = [
+    (
+        "activate/resolve fast path",
+        "import envpilot.launcher, envpilot.resolver",
+        ["click", "rich", "rich_click", "packaging", "subprocess", "concurrent",
+         "envpilot.cli", "envpilot.scanner", "envpilot.manager"],
+    ),
+    (
+        "click CLI",
+        "import envpilot.cli",
+        ["packaging", "numpy", "venv", "zipfile", "envpilot.scanner", "envpilot.matcher",
+         "envpilot.manager", "envpilot.syncer", "envpilot.cleaner", "envpilot.dedupe",
+         "envpilot.wheelhouse", "envpilot.installer", "envpilot.daemon", "envpilot.pool"],
+    ),
+]
+
+def import_times(code, repeat):
+    """
+    Runs `code` under -X importtime in fresh interpreters and returns
+    {module: best cumulative microseconds} over `repeat` runs.
+    """
+    best = {}
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, module = line[len("import time:"):].split("|")
+            if not cumulative.strip().isdigit():
+                # The header line
+                continue
+            module = module.strip()
+            best[module] = min(best.get(module, int(cumulative)), int(cumulative))
+    return best
+
+def is_forbidden(module, prefixes):
+    return any(module == prefix or module.startswith(prefix + ".") for prefix in prefixes)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=40.0, help="Maximum import time of the fast path (best of --repeat runs).")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--show", type=int, default=8, help="How many of the slowest top-level imports to list.")
+    args = parser.parse_args()
+
+    failures = []
+    for label, code, forbidden in CHECKS:
+        times = import_times(code, args.repeat)
+        targets = [module for module in code.replace("import ", "").split(", ")]
+        total_ms = max(times.get(module, 0) for module in targets) / 1000
+        print(f"{label}: {total_ms:.1f} ms")
+        for module, micros in sorted(times.items(), key=lambda item: item[1], reverse=True)[:args.show]:
+            print(f"  {micros / 1000:7.1f} ms  {module}")
+
+        loaded = sorted(module for module in times if is_forbidden(module, forbidden))
+        if loaded:
+            failures.append(f"{label} imports {', '.join(loaded)}")
+        if label.startswith("activate") and total_ms > args.budget_ms:
+            failures.append(f"{label} takes {total_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
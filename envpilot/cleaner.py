@@ -1,6 +1,12 @@
 import os
-import shutil
+import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from . import scanner
+from . import metadata
+from . import diskusage
+from . import utils
+from . import projects
 
 def find_orphaned_environments(environments):
     """
@@ -15,16 +21,346 @@ def find_orphaned_environments(environments):
             orphaned.append(env)
     return orphaned
 
-def remove_environments(environments):
+# MinHash signature length and LSH banding: 16 bands of 8 rows make two
+# environments likely candidates from a Jaccard similarity of about 0.7
+MINHASH_BINS = 128
+LSH_BANDS = 16
+
+def get_package_set(env):
+    """Returns an environment's installed packages as a set of 'name==version' strings."""
+    return {f"{name.lower()}=={version}" for name, version in env["packages"].items()}
+
+def fingerprint_packages(package_set):
+    """Returns a hash identifying an exact installed package set."""
+    return hashlib.sha1("\n".join(sorted(package_set)).encode("utf-8")).hexdigest()
+
+def minhash_signature(package_set):
+    """
+    Computes a MinHash signature with one-permutation hashing: every item is
+    hashed once, the hash picks one of MINHASH_BINS bins and the smallest
+    value per bin is kept. Empty bins borrow the value of the next non-empty
+    bin to their right, offset by the distance (rotation densification), so
+    signatures of similar sets still agree bin by bin. This costs one hash
+    per package instead of one per package and permutation.
+    """
+    bins = [None] * MINHASH_BINS
+    for item in package_set:
+        value = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+        position = value % MINHASH_BINS
+        value //= MINHASH_BINS
+        if bins[position] is None or value < bins[position]:
+            bins[position] = value
+    if all(value is None for value in bins):
+        return (0,) * MINHASH_BINS
+
+    signature = list(bins)
+    for position in range(MINHASH_BINS):
+        distance = 1
+        while signature[position] is None:
+            borrowed = bins[(position + distance) % MINHASH_BINS]
+            if borrowed is not None:
+                signature[position] = borrowed + distance * (1 << 64)
+            distance += 1
+    return tuple(signature)
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+def _find_root(parents, position):
+    while parents[position] != position:
+        parents[position] = parents[parents[position]]
+        position = parents[position]
+    return position
+
+def _pick_keeper(environments, package_sets):
+    """Suggests which environment of a cluster to keep: the one with the most packages, then the newest."""
+    def rank(position):
+        try:
+            mtime = os.stat(os.path.join(environments[position]["path"], "pyvenv.cfg")).st_mtime
+        except OSError:
+            mtime = 0
+        return (len(package_sets[position]), mtime)
+    return max(range(len(environments)), key=rank)
+
+def find_duplicate_environments(environments, threshold=0.8):
+    """
+    Groups environments with identical or nearly identical package sets.
+
+    Exact duplicates share a package-set fingerprint. Near-duplicates are
+    found with MinHash and locality-sensitive hashing: only environments
+    that collide in at least one LSH band are compared, so there is no
+    pairwise comparison of all environments. Candidates whose Jaccard
+    similarity reaches `threshold` are joined into clusters.
+
+    Returns a list of clusters, largest reclaimable space first, each a dict
+    with 'environments', the suggested environment to 'keep', 'exact'
+    (all package sets identical), the lowest 'similarity' to the kept one
+    and 'reclaimable_mb' for removing the others.
+    """
+    environments = [env for env in environments if env.get("packages")]
+    package_sets = [get_package_set(env) for env in environments]
+    parents = list(range(len(environments)))
+
+    def union(first, second):
+        first, second = _find_root(parents, first), _find_root(parents, second)
+        if first != second:
+            parents[second] = first
+
+    fingerprints = {}
+    for position, package_set in enumerate(package_sets):
+        fingerprint = fingerprint_packages(package_set)
+        if fingerprint in fingerprints:
+            union(fingerprints[fingerprint], position)
+        else:
+            fingerprints[fingerprint] = position
+
+    # Exact duplicates are already joined; one representative per fingerprint is enough
+    rows = MINHASH_BINS // LSH_BANDS
+    buckets = {}
+    for position in fingerprints.values():
+        signature = minhash_signature(package_sets[position])
+        for band in range(LSH_BANDS):
+            buckets.setdefault((band, signature[band * rows:(band + 1) * rows]), []).append(position)
+
+    compared = set()
+    for candidates in buckets.values():
+        for i, first in enumerate(candidates):
+            for second in candidates[i + 1:]:
+                if (first, second) in compared:
+                    continue
+                compared.add((first, second))
+                if jaccard(package_sets[first], package_sets[second]) >= threshold:
+                    union(first, second)
+
+    members = {}
+    for position in range(len(environments)):
+        members.setdefault(_find_root(parents, position), []).append(position)
+
+    clusters = []
+    for positions in members.values():
+        if len(positions) < 2:
+            continue
+        cluster_envs = [environments[position] for position in positions]
+        cluster_sets = [package_sets[position] for position in positions]
+        keep = _pick_keeper(cluster_envs, cluster_sets)
+        others = [i for i in range(len(positions)) if i != keep]
+        clusters.append({
+            "environments": cluster_envs,
+            "keep": cluster_envs[keep],
+            "exact": len({fingerprint_packages(package_set) for package_set in cluster_sets}) == 1,
+            "similarity": min(jaccard(cluster_sets[keep], cluster_sets[i]) for i in others),
+            "reclaimable_mb": sum(cluster_envs[i].get("reclaimable_mb", 0) for i in others),
+        })
+    clusters.sort(key=lambda cluster: cluster["reclaimable_mb"], reverse=True)
+    return clusters
+
+def get_last_used(env_path, usage):
+    """
+    Returns when an environment was last used: the later of envpilot's own
+    record (activate, match, clones) and the access time of its interpreter,
+    which running any script from the environment updates.
+    """
+    recorded = usage["last_used"].get(env_path, 0)
+    try:
+        accessed = os.lstat(scanner.get_python_executable(env_path)).st_atime
+    except OSError:
+        accessed = 0
+    return max(recorded, accessed)
+
+def plan_eviction(environments, budget_mb):
+    """
+    Picks the environments to remove so that the total 'size_mb' of
+    `environments` fits within `budget_mb`, least recently used first.
+    Pinned environments and the active one ($VIRTUAL_ENV) are never picked.
+
+    Every environment gets 'last_used' and 'pinned' keys. Returns
+    (evicted, total_mb, remaining_mb); remaining_mb can still exceed the
+    budget if the pinned environments alone do.
+    """
+    usage = metadata.load_usage()
+    pinned = set(usage["pinned"])
+    active = os.environ.get("VIRTUAL_ENV")
+    if active:
+        pinned.add(os.path.abspath(active))
+
+    for env in environments:
+        env["last_used"] = get_last_used(env["path"], usage)
+        env["pinned"] = env["path"] in pinned
+
+    total_mb = sum(env.get("size_mb", 0) for env in environments)
+    remaining_mb = total_mb
+    evicted = []
+    for env in sorted(environments, key=lambda env: env["last_used"]):
+        if remaining_mb <= budget_mb:
+            break
+        if env["pinned"]:
+            continue
+        evicted.append(env)
+        remaining_mb -= env.get("size_mb", 0)
+    return evicted, total_mb, remaining_mb
+
+def get_trash_registry_path():
+    """Returns the file listing every trash directory envpilot has used."""
+    return os.path.join(metadata.get_cache_dir(), "trash.json")
+
+def get_trash_dir(env_path):
+    """
+    Returns a trash directory on the same filesystem as `env_path`, so moving
+    the environment there is a single rename: ~/.envpilot-trash when possible,
+    otherwise a .envpilot-trash folder next to the environment.
+    """
+    home_trash = os.path.join(os.path.expanduser("~"), scanner.TRASH_DIR_NAME)
+    try:
+        if os.stat(os.path.expanduser("~")).st_dev == os.stat(env_path).st_dev:
+            return home_trash
+    except OSError:
+        pass
+    return os.path.join(os.path.dirname(os.path.abspath(env_path)), scanner.TRASH_DIR_NAME)
+
+def move_to_trash(env_path):
+    """
+    Renames an environment into the trash, which is atomic and instant.
+    Returns the new path, or raises OSError if it cannot be moved.
+    """
+    trash_dir = get_trash_dir(env_path)
+    os.makedirs(trash_dir, exist_ok=True)
+    trash_dirs = metadata.read_json(get_trash_registry_path(), [])
+    if trash_dir not in trash_dirs:
+        metadata.write_json(get_trash_registry_path(), trash_dirs + [trash_dir])
+
+    trashed_path = os.path.join(trash_dir, f"{os.path.basename(env_path)}-{uuid.uuid4().hex[:8]}")
+    os.rename(env_path, trashed_path)
+    return trashed_path
+
+def _remove_tree(path):
+    """
+    Deletes a directory tree (or a single file) without following symlinks.
+    Returns the bytes freed, counting only files whose last link was removed.
+    """
+    freed = 0
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return 0
+    if not os.path.isdir(path) or os.path.islink(path):
+        os.remove(path)
+        return utils.allocated_bytes(st) if st.st_nlink == 1 else 0
+
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            freed += _remove_tree(entry.path)
+        else:
+            entry_st = entry.stat(follow_symlinks=False)
+            os.remove(entry.path)
+            if entry_st.st_nlink == 1:
+                freed += utils.allocated_bytes(entry_st)
+    os.rmdir(path)
+    return freed + utils.allocated_bytes(st)
+
+def _split_work(path):
+    """
+    Splits a tree into independently deletable pieces so a large environment
+    is spread over several workers: the entries of each site-packages
+    directory, then everything else.
+    """
+    pieces = []
+    for site_packages in scanner.get_site_packages_dirs(path):
+        try:
+            pieces.extend(entry.path for entry in os.scandir(site_packages))
+        except OSError:
+            continue
+    return pieces
+
+def purge_paths(paths, jobs=None, on_progress=None):
+    """
+    Deletes trees on a pool of `jobs` threads. `on_progress(done, total,
+    freed_bytes)` is called as pieces finish.
+    Returns (freed_bytes, errors).
+    """
+    pieces = []
+    for path in paths:
+        pieces.extend(_split_work(path))
+    total = len(pieces) + len(paths)
+    done = 0
+    freed = 0
+    errors = []
+
+    def report():
+        if on_progress is not None:
+            on_progress(done, total, freed)
+
+    with ThreadPoolExecutor(max_workers=jobs or scanner.get_default_jobs()) as executor:
+        futures = {executor.submit(_remove_tree, piece): piece for piece in pieces}
+        for future in as_completed(futures):
+            try:
+                freed += future.result()
+            except OSError as e:
+                errors.append(f"Could not remove {futures[future]}: {e}")
+            done += 1
+            report()
+
+    # What is left of each tree is small: the skeleton, bin/ and the interpreter links
+    for path in paths:
+        try:
+            freed += _remove_tree(path)
+        except OSError as e:
+            errors.append(f"Could not remove {path}: {e}")
+        done += 1
+        report()
+    return freed, errors
+
+def list_trash():
+    """Returns the paths currently waiting in any known trash directory."""
+    paths = []
+    for trash_dir in metadata.read_json(get_trash_registry_path(), []):
+        try:
+            paths.extend(entry.path for entry in os.scandir(trash_dir))
+        except OSError:
+            continue
+    return paths
+
+def purge_trash(jobs=None, on_progress=None):
+    """
+    Deletes everything left in the trash, e.g. after an interrupted clean.
+    Returns (purged_paths, freed_bytes, errors).
+    """
+    paths = list_trash()
+    freed, errors = purge_paths(paths, jobs, on_progress)
+    for trash_dir in metadata.read_json(get_trash_registry_path(), []):
+        try:
+            os.rmdir(trash_dir)
+        except OSError:
+            pass
+    return [path for path in paths if not os.path.exists(path)], freed, errors
+
+def remove_environments(environments, jobs=None, on_progress=None):
     """
     Removes the specified list of environment directories.
+
+    Each environment is first renamed into the trash, so it disappears at
+    once and an interrupted run can be finished with `purge_trash`; the trees
+    are then deleted in parallel. Environments that cannot be renamed (e.g.
+    across filesystems) are deleted in place.
+    Returns (removed_paths, freed_bytes, errors).
     """
     removed_paths = []
+    to_delete = []
     errors = []
     for env in environments:
         try:
-            shutil.rmtree(env["path"])
-            removed_paths.append(env["path"])
-        except OSError as e:
-            errors.append(f"Could not remove {env['path']}: {e}")
-    return removed_paths, errors 
\ No newline at end of file
+            to_delete.append(move_to_trash(env["path"]))
+        except OSError:
+            if not os.path.isdir(env["path"]):
+                errors.append(f"Could not remove {env['path']}: it no longer exists")
+                continue
+            to_delete.append(env["path"])
+        removed_paths.append(env["path"])
+    metadata.unregister_environments(removed_paths)
+    metadata.forget_usage(removed_paths)
+    diskusage.forget_disk_usage(removed_paths)
+    projects.forget_environments(removed_paths)
+
+    freed, delete_errors = purge_paths(to_delete, jobs, on_progress)
+    return removed_paths, freed, errors + delete_errors
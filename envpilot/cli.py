@@ -1,12 +1,11 @@
 import os
+import re
+import sys
+import json
+import time
+from contextlib import contextmanager
 import rich_click as click
 from rich.console import Console
-from rich.table import Table
-from . import scanner
-from . import matcher
-from . import manager
-from . import cleaner
-from . import syncer
 
 @click.group(context_settings={"help_option_names": ["-h", "--help"]})
 def cli():
@@ -18,24 +17,23 @@ def cli():
     """
     pass
 
-@cli.command("list")
-def list_envs():
-    """Scans the system for Python environments and displays them in a table."""
-    console = Console()
-    
-    # In the future, this could be configurable. For now, scan home directory.
-    search_path = os.path.expanduser("~")
-    
-    with console.status(f"[bold green]Scanning for environments in {search_path}...") as status:
-        environments = scanner.discover_environments(search_path)
+def scan_options(func):
+    """Adds the options controlling environment discovery to a command."""
+    func = click.option("--no-cache", "no_cache", is_flag=True, help="Ignore the environment index and scan without updating it.")(func)
+    func = click.option("--refresh", is_flag=True, help="Force a full rescan and rebuild the environment index.")(func)
+    func = click.option("--jobs", "-j", type=click.IntRange(min=1), default=None, help="Number of environments to probe in parallel.")(func)
+    return func
 
-    if not environments:
-        console.print("No Python environments found.", style="bold yellow")
-        return
+def get_scan_options(refresh, no_cache, jobs):
+    """Translates the discovery flags into `scanner.discover_environments` arguments."""
+    return {"use_cache": not no_cache, "refresh": refresh, "jobs": jobs}
 
+def build_environments_table(environments, caption):
+    """Builds the `list` table for the environments found so far."""
+    from rich.table import Table
     table = Table(
         title="Discovered Python Environments",
-        caption=f"Found {len(environments)} environments",
+        caption=caption,
         show_header=True,
         header_style="bold magenta"
     )
@@ -43,39 +41,73 @@ def list_envs():
     table.add_column("Python Version", style="green")
     table.add_column("Packages", justify="right", style="yellow")
     table.add_column("Size (MB)", justify="right", style="red")
+    table.add_column("On Disk (MB)", justify="right", style="red")
     table.add_column("Path", style="blue", overflow="fold")
     
     # Sort environments by path for consistent ordering
-    environments.sort(key=lambda x: x['path'])
-
-    for env in environments:
+    for env in sorted(environments, key=lambda x: x['path']):
         table.add_row(
             env["name"],
             env["python_version"],
             str(env["package_count"]),
             f"{env['size_mb']:.2f}",
+            f"{env['disk_mb']:.2f}",
             env["path"]
         )
-    
-    console.print(table)
+    return table
 
-@cli.command("match")
-@click.argument("requirements_file", type=click.Path(exists=True, dir_okay=False))
-@click.option("--env", "env_name", help="Name of a specific environment to match against.")
-def match_reqs(requirements_file, env_name):
+def echo_json_lines(records):
     """
-    Finds the best-matching virtual environment for a given requirements file.
-    
-    Ranks all discovered environments by how well they match the packages
-    listed in the REQUIREMENTS_FILE.
+    Writes each record as one line of JSON as soon as it is available.
+    If the reader closes the pipe early (e.g. `| head`), scanning stops quietly.
     """
+    try:
+        for record in records:
+            sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # Point stdout at devnull so the interpreter's final flush doesn't fail again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+    finally:
+        records.close()
+
+@cli.command("list")
+@click.option("--json", "as_json", is_flag=True, help="Print one JSON object per environment (NDJSON) as soon as it is found.")
+@scan_options
+def list_envs(as_json, refresh, no_cache, jobs):
+    """Scans the system for Python environments and displays them in a table."""
+    from rich.live import Live
+    from rich.spinner import Spinner
+    from rich.text import Text
+    from . import scanner
+    # In the future, this could be configurable. For now, scan home directory.
+    search_path = os.path.expanduser("~")
+    records = scanner.iter_environments(search_path, **get_scan_options(refresh, no_cache, jobs))
+
+    if as_json:
+        echo_json_lines(records)
+        return
+
     console = Console()
+    environments = []
+    
+    # Rows are rendered as soon as each environment has been probed
+    with Live(Spinner("dots", text=f"[bold green]Scanning for environments in {search_path}..."), console=console) as live:
+        for env in records:
+            environments.append(env)
+            live.update(build_environments_table(environments, f"Scanning... found {len(environments)} so far"))
 
-    with console.status(f"[bold green]Scanning and matching for {os.path.basename(requirements_file)}...") as status:
-        matches, error = matcher.find_best_matches(requirements_file, env_name)
+        if environments:
+            live.update(build_environments_table(environments, f"Found {len(environments)} environments"))
+        else:
+            live.update(Text("No Python environments found.", style="bold yellow"))
 
+def print_match_results(console, requirements_file, matches, error):
+    """Prints the match table for one requirements file."""
+    from rich.table import Table
     if error:
-        console.print(f"Error: {error}", style="bold red")
+        console.print(f"Error ({os.path.basename(requirements_file)}): {error}", style="bold red")
         return
 
     if not matches:
@@ -110,23 +142,98 @@ def match_reqs(requirements_file, env_name):
         )
     
     console.print(table)
+
+def record_best_matches(results):
+    """
+    Passes (requirements_file, matches, error) results through, then records
+    each file's best match as a use of that environment for `clean --budget`.
+    """
+    from . import metadata
+    used = set()
+    for requirements_file, matches, error in results:
+        if matches and matches[0]["match_percentage"] > 0:
+            used.add(matches[0]["env"]["path"])
+        yield requirements_file, matches, error
+    metadata.record_use(used)
+
+def match_results_as_json(results):
+    """Turns (requirements_file, matches, error) results into JSON-ready records."""
+    for requirements_file, matches, error in results:
+        record = {"requirements_file": requirements_file, "error": error, "matches": []}
+        for match in matches or []:
+            record["matches"].append({
+                "name": match["env"]["name"],
+                "path": match["env"]["path"],
+                "match_percentage": match["match_percentage"],
+                "missing_packages": match["missing_packages"],
+                "extra_packages_count": match["extra_packages_count"],
+                "score": match["score"],
+            })
+        yield record
+
+@cli.command("match")
+@click.argument("requirements_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--env", "env_name", help="Name of a specific environment to match against.")
+@click.option("--top", "top", type=click.IntRange(min=1), default=None, help="Only show the N best-matching environments.")
+@click.option("--json", "as_json", is_flag=True, help="Print one JSON object per requirements file (NDJSON) as soon as it is matched.")
+@scan_options
+def match_reqs(requirements_files, env_name, top, as_json, refresh, no_cache, jobs):
+    """
+    Finds the best-matching virtual environment for one or more requirements files.
+    
+    Ranks all discovered environments by how well they match the packages
+    listed in each of the REQUIREMENTS_FILES. Environments are scanned once
+    and shared between all files.
+    """
+    from . import matcher
+    console = Console(stderr=as_json)
+
+    with console.status("[bold green]Scanning environments...") as status:
+        environments, error = matcher.load_environments_for_matching(env_name, **get_scan_options(refresh, no_cache, jobs))
+
+    if error:
+        console.print(f"Error: {error}", style="bold red")
+        return
+
+    results = record_best_matches(matcher.match_requirement_files(requirements_files, environments, top))
+    if as_json:
+        echo_json_lines(match_results_as_json(results))
+        return
+
+    for requirements_file, matches, error in results:
+        print_match_results(console, requirements_file, matches, error)
     console.print("\n💡 Tip: Reuse a high-ranking environment to save time and disk space.", style="italic dim")
 
 @cli.command("create")
 @click.argument("name", default="venv", required=False)
 @click.option("--requirements", "-r", "requirements_file", type=click.Path(exists=True, dir_okay=False), help="Path to a requirements.txt file to install packages from.")
 @click.option("--path", "-p", "creation_path", type=click.Path(file_okay=False, writable=True), help="The directory where the environment will be created. Defaults to the current directory.")
-def create_env(name, requirements_file, creation_path):
+@click.option("--from-best-match", is_flag=True, help="Clone the existing environment that best matches the requirements and install only the difference.")
+@click.option("--offline", is_flag=True, help="Install packages only from the local wheelhouse.")
+@scan_options
+def create_env(name, requirements_file, creation_path, from_best_match, offline, refresh, no_cache, jobs):
     """
     Creates a new Python virtual environment.
     
     By default, it creates a 'venv' in the current working directory.
     You can provide a NAME to customize the folder name of the environment.
     """
+    from . import manager
     console = Console()
-    
-    with console.status(f"[bold green]Creating environment '{name}'...") as status:
-        env_path, error = manager.create_environment(name, requirements_file, creation_path)
+
+    if from_best_match:
+        if not requirements_file:
+            console.print("Error: --from-best-match needs a requirements file (-r).", style="bold red")
+            return
+        with console.status(f"[bold green]Cloning the best match for '{name}'..."):
+            summary, error = manager.create_from_best_match(name, requirements_file, creation_path, offline, **get_scan_options(refresh, no_cache, jobs))
+        env_path = summary["env_path"] if summary else None
+        if summary and summary["source"]:
+            console.print(f"Cloned [cyan]{summary['source']}[/cyan] ({summary['match_percentage']:.1f}% match) using {summary['link_mode']}s.")
+            console.print(f"Installed {len(summary['installed'])} and removed {len(summary['removed'])} packages.", style="dim")
+    else:
+        with console.status(f"[bold green]Creating environment '{name}'...") as status:
+            env_path, error = manager.create_environment(name, requirements_file, creation_path, offline)
 
     if error:
         if env_path:
@@ -138,6 +245,30 @@ def create_env(name, requirements_file, creation_path):
 
     console.print(f"✅ Environment '{name}' created successfully at {env_path}", style="bold green")
 
+@cli.command("ensure")
+@click.option("--requirements", "-r", "requirements_file", required=True, type=click.Path(exists=True, dir_okay=False), help="Path to the requirements.txt file the environment must satisfy.")
+@click.option("--offline", is_flag=True, help="Install packages only from the local wheelhouse.")
+@click.option("--timeout", type=click.FloatRange(min=0), default=None, help="Seconds to wait for another job that is building the same environment (default: no limit).")
+def ensure_env(requirements_file, offline, timeout):
+    """
+    Prints the path of a shared environment for a requirements file, building it once if needed.
+
+    Environments live in ~/.envpilot-pool, keyed by a hash of the normalized
+    requirements, including nested -r/-c files and option lines. Parallel jobs asking for the same requirements wait for a
+    single build, so `source "$(envpilot ensure -r requirements.txt)/bin/activate"`
+    is safe to run concurrently.
+    """
+    from . import pool
+    console = Console(stderr=True)
+    with console.status("[bold green]Preparing environment..."):
+        env_path, built, error = pool.ensure_environment(requirements_file, offline, timeout)
+    if error:
+        console.print(f"Error: {error}", style="bold red")
+        sys.exit(1)
+    if built:
+        console.print(f"✅ Built {env_path}", style="bold green")
+    click.echo(env_path)
+
 @cli.command("activate")
 @click.argument("name")
 def activate_env(name):
@@ -146,15 +277,114 @@ def activate_env(name):
     
     Type 'exit' to leave the shell and return to your original session.
     """
+    from . import resolver
     console = Console()
-    error = manager.launch_shell(name)
+    error = resolver.launch_shell(name)
     if error:
         console.print(f"Error: {error}", style="bold red")
 
+@cli.command("resolve")
+@click.argument("name")
+def resolve_env(name):
+    """
+    Prints the path of the environment called NAME.
+
+    Like `activate`, this skips loading most of envpilot when called as
+    `envpilot resolve NAME`, so it is cheap enough for shell scripts and hooks.
+    """
+    from . import resolver
+    env_path, error = resolver.resolve_environment(name)
+    if error:
+        Console(stderr=True).print(f"Error: {error}", style="bold red")
+        sys.exit(1)
+    click.echo(env_path)
+
+@cli.command("hook")
+@click.argument("shell", type=click.Choice(["bash", "zsh"]))
+def hook_cmd(shell):
+    """
+    Prints a shell hook that activates linked environments on `cd`.
+
+    Add `eval "$(envpilot hook bash)"` to ~/.bashrc (or the zsh equivalent
+    to ~/.zshrc). Entering a project linked with `envpilot link` activates
+    its environment in the current shell; leaving it deactivates it again.
+    The hook only reads a small map file, without starting any process.
+    """
+    from . import projects
+    click.echo(projects.render_hook(shell), nl=False)
+
+@cli.command("link")
+@click.argument("env_name", required=False)
+@click.argument("project_dir", required=False, type=click.Path(exists=True, file_okay=False))
+@click.option("--rebuild", is_flag=True, help="Rebuild the project map from the .project files of all discovered environments.")
+@scan_options
+def link_env(env_name, project_dir, rebuild, refresh, no_cache, jobs):
+    """
+    Links ENV_NAME to PROJECT_DIR (default: the current directory).
+
+    The link is written to the environment's .project file, which also
+    keeps it from being treated as orphaned by `clean`, and to the map
+    the `hook` reads.
+    """
+    from . import projects
+    console = Console()
+    if rebuild:
+        from . import scanner
+        with console.status("[bold green]Scanning for all environments..."):
+            environments = scanner.discover_environments(os.path.expanduser("~"), fields={"path"}, **get_scan_options(refresh, no_cache, jobs))
+        mapping = projects.rebuild_project_map([env["path"] for env in environments])
+        console.print(f"✅ Linked {len(mapping)} projects to environments.", style="bold green")
+        return
+    if not env_name:
+        console.print("Error: Provide an environment name, or use --rebuild.", style="bold red")
+        return
+
+    env_paths = resolve_environment_names(console, [env_name])
+    if not env_paths:
+        return
+    project_dir = os.path.abspath(project_dir or os.getcwd())
+    try:
+        projects.link_project(env_paths[0], project_dir)
+    except OSError as e:
+        console.print(f"Error: Could not link {env_paths[0]}: {e}", style="bold red")
+        return
+    console.print(f"🔗 Linked {project_dir} to {env_paths[0]}", style="bold green")
+
+@cli.command("unlink")
+@click.argument("env_name")
+def unlink_env(env_name):
+    """Removes the project link of ENV_NAME."""
+    from . import projects
+    console = Console()
+    env_paths = resolve_environment_names(console, [env_name])
+    if not env_paths:
+        return
+    project_dir = projects.unlink_project(env_paths[0])
+    if project_dir:
+        console.print(f"Unlinked {env_paths[0]} from {project_dir}", style="bold green")
+    else:
+        console.print(f"{env_paths[0]} was not linked to a project.", style="bold yellow")
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+def parse_size_mb(ctx, param, value):
+    """Click callback turning a size such as '50G' or '512M' into megabytes."""
+    if value is None:
+        return None
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", value, flags=re.IGNORECASE)
+    if not match:
+        raise click.BadParameter(f"'{value}' is not a size like 50G or 800M.")
+    return float(match.group(1)) * SIZE_UNITS[match.group(2).upper()] / (1024 * 1024)
+
 @cli.command("clean")
 @click.option("--yes", is_flag=True, help="Skip the confirmation prompt and remove environments directly.")
 @click.option("--dry-run", is_flag=True, help="List environments that would be removed without actually deleting them.")
-def clean_envs(dry_run, yes):
+@click.option("--purge-trash", is_flag=True, help="Finish deleting environments left in the trash by an interrupted clean.")
+@click.option("--duplicates", is_flag=True, help="Find environments with identical or nearly identical package sets instead of orphans.")
+@click.option("--similarity", default=0.8, show_default=True, type=click.FloatRange(0, 1), help="With --duplicates, the Jaccard similarity from which package sets count as near-duplicates.")
+@click.option("--budget", "budget_mb", metavar="SIZE", callback=parse_size_mb, help="Evict the least recently used environments until all of them fit in SIZE (e.g. 50G, 800M). Pinned environments are kept.")
+@scan_options
+def clean_envs(dry_run, yes, purge_trash, duplicates, similarity, budget_mb, refresh, no_cache, jobs):
     """
     Scans for and removes orphaned environments to save disk space.
     
@@ -162,10 +392,27 @@ def clean_envs(dry_run, yes):
     linking it to a known project directory. This is a placeholder for a more
     robust check in the future.
     """
+    from rich.table import Table
+    from . import scanner
+    from . import cleaner
     console = Console()
+
+    if purge_trash:
+        with deletion_progress(console) as on_progress:
+            purged, freed, errors = cleaner.purge_trash(jobs, on_progress)
+        print_removal_results(console, purged, freed, errors)
+        return
+
+    if duplicates:
+        clean_duplicates(console, similarity, dry_run, yes, get_scan_options(refresh, no_cache, jobs))
+        return
+
+    if budget_mb is not None:
+        clean_to_budget(console, budget_mb, dry_run, yes, get_scan_options(refresh, no_cache, jobs))
+        return
     
     with console.status("[bold green]Scanning for all environments...") as status:
-        all_environments = scanner.discover_environments(os.path.expanduser("~"))
+        all_environments = scanner.discover_environments(os.path.expanduser("~"), **get_scan_options(refresh, no_cache, jobs))
 
     orphaned = cleaner.find_orphaned_environments(all_environments)
 
@@ -178,10 +425,11 @@ def clean_envs(dry_run, yes):
     table = Table(title="Orphaned Environments", show_header=True, header_style="bold magenta")
     table.add_column("Name", style="cyan")
     table.add_column("Size (MB)", justify="right", style="red")
+    table.add_column("Reclaimable (MB)", justify="right", style="red")
     table.add_column("Path", style="blue")
 
     for env in orphaned:
-        table.add_row(env["name"], f"{env['size_mb']:.2f}", env["path"])
+        table.add_row(env["name"], f"{env['size_mb']:.2f}", f"{env['reclaimable_mb']:.2f}", env["path"])
     
     console.print(table)
 
@@ -190,15 +438,224 @@ def clean_envs(dry_run, yes):
         return
     
     if yes or click.confirm("\nDo you want to remove these environments?"):
-        removed, errors = cleaner.remove_environments(orphaned)
-        if removed:
-            console.print("\n✅ Successfully removed:", style="bold green")
-            for path in removed:
-                console.print(f"- {path}")
-        if errors:
-            console.print("\n❌ Errors occurred:", style="bold red")
-            for error in errors:
-                console.print(f"- {error}")
+        with deletion_progress(console) as on_progress:
+            removed, freed, errors = cleaner.remove_environments(orphaned, jobs, on_progress)
+        print_removal_results(console, removed, freed, errors)
+
+def clean_duplicates(console, similarity, dry_run, yes, scan_options):
+    """Lists clusters of duplicate environments and removes all but the suggested one of each."""
+    from rich.table import Table
+    from . import scanner
+    from . import cleaner
+    with console.status("[bold green]Scanning for all environments..."):
+        all_environments = scanner.discover_environments(os.path.expanduser("~"), fields={"path", "size", "packages"}, **scan_options)
+        clusters = cleaner.find_duplicate_environments(all_environments, similarity)
+
+    if not clusters:
+        console.print("✨ No duplicate environments found.", style="bold green")
+        return
+
+    for number, cluster in enumerate(clusters, 1):
+        kind = "identical" if cluster["exact"] else f"{cluster['similarity'] * 100:.0f}% similar"
+        table = Table(title=f"Duplicates #{number} ({kind})", show_header=True, header_style="bold magenta")
+        table.add_column("Keep", justify="center", style="bold green")
+        table.add_column("Name", style="cyan")
+        table.add_column("Packages", justify="right", style="magenta")
+        table.add_column("Reclaimable (MB)", justify="right", style="red")
+        table.add_column("Path", style="blue")
+        for env in cluster["environments"]:
+            is_kept = env is cluster["keep"]
+            table.add_row(
+                "✔" if is_kept else "",
+                env["name"],
+                str(len(env["packages"])),
+                "-" if is_kept else f"{env['reclaimable_mb']:.2f}",
+                env["path"]
+            )
+        console.print(table)
+
+    to_remove = [env for cluster in clusters for env in cluster["environments"] if env is not cluster["keep"]]
+    total_mb = sum(cluster["reclaimable_mb"] for cluster in clusters)
+    console.print(f"Removing the {len(to_remove)} duplicates would reclaim about {total_mb:.2f} MB.", style="bold yellow")
+
+    if dry_run:
+        console.print("\nThis was a dry run. No environments were removed.", style="italic dim")
+        return
+
+    if yes or click.confirm("\nDo you want to remove the environments not marked to keep?"):
+        with deletion_progress(console) as on_progress:
+            removed, freed, errors = cleaner.remove_environments(to_remove, scan_options.get("jobs"), on_progress)
+        print_removal_results(console, removed, freed, errors)
+
+def clean_to_budget(console, budget_mb, dry_run, yes, scan_options):
+    """Shows and carries out the least-recently-used eviction plan for a disk budget."""
+    from rich.table import Table
+    from . import scanner
+    from . import cleaner
+    with console.status("[bold green]Scanning for all environments..."):
+        all_environments = scanner.discover_environments(os.path.expanduser("~"), fields={"path", "size"}, **scan_options)
+        evicted, total_mb, remaining_mb = cleaner.plan_eviction(all_environments, budget_mb)
+
+    console.print(f"Environments use {total_mb:.2f} MB of a {budget_mb:.2f} MB budget.")
+    if not evicted:
+        if remaining_mb > budget_mb:
+            console.print("⚠️  Over budget, but every environment is pinned or active.", style="bold yellow")
+        else:
+            console.print("✨ Within budget; nothing to evict.", style="bold green")
+        return
+
+    table = Table(title="Eviction Plan (least recently used first)", show_header=True, header_style="bold magenta")
+    table.add_column("Name", style="cyan")
+    table.add_column("Last Used", style="yellow")
+    table.add_column("Size (MB)", justify="right", style="red")
+    table.add_column("Path", style="blue")
+    for env in evicted:
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(env["last_used"])) if env["last_used"] else "never"
+        table.add_row(env["name"], last_used, f"{env['size_mb']:.2f}", env["path"])
+    console.print(table)
+
+    console.print(f"Evicting {len(evicted)} environments brings the total to {remaining_mb:.2f} MB.", style="bold yellow")
+    if remaining_mb > budget_mb:
+        console.print("⚠️  Pinned and active environments alone exceed the budget.", style="bold yellow")
+
+    if dry_run:
+        console.print("\nThis was a dry run. No environments were removed.", style="italic dim")
+        return
+
+    if yes or click.confirm("\nDo you want to remove these environments?"):
+        with deletion_progress(console) as on_progress:
+            removed, freed, errors = cleaner.remove_environments(evicted, scan_options.get("jobs"), on_progress)
+        print_removal_results(console, removed, freed, errors)
+
+@contextmanager
+def deletion_progress(console):
+    """Shows a progress bar for parallel deletions and yields the `on_progress` callback."""
+    from rich.progress import Progress, BarColumn, TextColumn
+    with Progress(
+        TextColumn("[bold green]Deleting"),
+        BarColumn(),
+        TextColumn("{task.completed}/{task.total}"),
+        TextColumn("[dim]{task.fields[freed]:.1f} MB freed"),
+        console=console,
+        transient=True,
+    ) as progress:
+        task = progress.add_task("delete", total=None, freed=0.0)
+
+        def on_progress(done, total, freed_bytes):
+            progress.update(task, completed=done, total=total, freed=freed_bytes / (1024 * 1024))
+        yield on_progress
+
+def print_removal_results(console, removed, freed, errors):
+    if removed:
+        console.print("\n✅ Successfully removed:", style="bold green")
+        for path in removed:
+            console.print(f"- {path}")
+        console.print(f"Freed {freed / (1024 * 1024):.2f} MB.", style="bold green")
+    elif not errors:
+        console.print("✨ Nothing to remove.", style="bold green")
+    if errors:
+        console.print("\n❌ Errors occurred:", style="bold red")
+        for error in errors:
+            console.print(f"- {error}")
+
+def resolve_environment_names(console, names):
+    """Resolves environment names or paths to single paths, printing an error for the rest."""
+    from . import scanner
+    env_paths = []
+    for name in names:
+        paths = scanner.find_environment_paths(name)
+        if not paths:
+            console.print(f"Error: Environment '{name}' not found.", style="bold red")
+        elif len(paths) > 1:
+            console.print(f"Error: Environment name '{name}' is ambiguous; use one of these paths:", style="bold red")
+            for path in paths:
+                console.print(f"  - {path}")
+        else:
+            env_paths.append(paths[0])
+    return env_paths
+
+@cli.command("pin")
+@click.argument("names", nargs=-1)
+def pin_envs(names):
+    """
+    Protects environments from `clean --budget` eviction.
+
+    Without NAMES, lists the pinned environments.
+    """
+    from . import metadata
+    console = Console()
+    if not names:
+        pinned = metadata.load_usage()["pinned"]
+        if not pinned:
+            console.print("No environments are pinned.", style="bold yellow")
+        for path in pinned:
+            console.print(f"📌 {path}")
+        return
+    for path in metadata.set_pinned(resolve_environment_names(console, names), True):
+        console.print(f"📌 Pinned {path}", style="bold green")
+
+@cli.command("unpin")
+@click.argument("names", nargs=-1, required=True)
+def unpin_envs(names):
+    """Lets `clean --budget` evict environments again."""
+    from . import metadata
+    console = Console()
+    for path in metadata.set_pinned(resolve_environment_names(console, names), False):
+        console.print(f"Unpinned {path}", style="bold green")
+
+@cli.command("dedupe")
+@click.option("--dry-run", is_flag=True, help="Estimate the savings without changing any files.")
+@click.option("--undo", is_flag=True, help="Give every deduplicated environment back its own copies.")
+@scan_options
+def dedupe_envs(dry_run, undo, refresh, no_cache, jobs):
+    """
+    Hardlinks identical site-packages files across environments.
+
+    Duplicate files are kept once in ~/.envpilot-store and linked into each
+    environment, largest environments first. Run with --undo to reverse it.
+    """
+    from rich.table import Table
+    from . import scanner
+    from . import dedupe
+    console = Console()
+    store_dir = dedupe.get_store_dir()
+
+    if undo:
+        with console.status("[bold green]Restoring private copies...") as status:
+            restored, errors = dedupe.undo_dedupe()
+        for env_path, count in restored.items():
+            console.print(f"- {env_path}: restored {count} files")
+        for error in errors:
+            console.print(f"❌ {error}", style="bold red")
+        console.print(f"✅ Restored {len(restored)} environments.", style="bold green")
+        return
+
+    with console.status("[bold green]Scanning for all environments...") as status:
+        environments = scanner.discover_environments(os.path.expanduser("~"), fields={"path", "size"}, **get_scan_options(refresh, no_cache, jobs))
+        garbage_bytes = 0 if dry_run else dedupe.collect_garbage(store_dir)
+        status.update("[bold green]Deduplicating site-packages...")
+        results = dedupe.dedupe_environments(environments, dry_run=dry_run, jobs=jobs)
+
+    table = Table(title="Deduplicated Environments", show_header=True, header_style="bold magenta")
+    table.add_column("Name", style="cyan")
+    table.add_column("Files Linked", justify="right")
+    table.add_column("Reclaimed (MB)", justify="right", style="green")
+    table.add_column("Path", style="blue")
+    total = garbage_bytes
+    for result in results:
+        if result["error"]:
+            console.print(f"⚠️  {result['error']}", style="yellow")
+        if result["linked"]:
+            table.add_row(result["env"]["name"], str(result["linked"]), f"{result['reclaimed_bytes'] / (1024 * 1024):.2f}", result["env"]["path"])
+        total += result["reclaimed_bytes"]
+    console.print(table)
+    if garbage_bytes:
+        console.print(f"Removed {garbage_bytes / (1024 * 1024):.2f} MB of unused store objects.", style="dim")
+
+    if dry_run:
+        console.print(f"\nThis was a dry run. About {total / (1024 * 1024):.2f} MB could be reclaimed.", style="italic dim")
+        return
+    console.print(f"✅ Reclaimed {total / (1024 * 1024):.2f} MB.", style="bold green")
 
 @click.group()
 def sync():
@@ -206,14 +663,34 @@ def sync():
     pass
 
 @sync.command("export")
-@click.argument("env_name")
-@click.option("--file", "-f", "output_file", default="envpilot-lock.json", help="The name for the output lock file.")
-def sync_export(env_name, output_file):
-    """Exports an environment's state to a lock file."""
+@click.argument("env_name", required=False)
+@click.option("--file", "-f", "output_file", default=None, help="The name for the output file. Defaults to envpilot-lock.json, or envpilot-bundle.json for bundles.")
+@click.option("--all", "export_all", is_flag=True, help="Export every discovered environment into one bundle.")
+@click.option("--glob", "pattern", help="Export the environments whose name or path matches PATTERN into one bundle.")
+@click.option("--hashes", "with_hashes", is_flag=True, help="Record the archive hashes pip recorded at install time; imports then check them.")
+@scan_options
+def sync_export(env_name, output_file, export_all, pattern, with_hashes, refresh, no_cache, jobs):
+    """Exports an environment's state to a lock file, or several into a bundle."""
+    from . import syncer
     console = Console()
+
+    if export_all or pattern:
+        output_file = output_file or "envpilot-bundle.json"
+        with console.status("[bold green]Exporting environments...") as status:
+            names, error = syncer.export_bundle(output_file, pattern, **get_scan_options(refresh, no_cache, jobs))
+        if error:
+            console.print(f"Error: {error}", style="bold red")
+            return
+        console.print(f"✅ Exported {len(names)} environments to {output_file}: {', '.join(names)}", style="bold green")
+        return
+
+    if not env_name:
+        console.print("Error: give an ENV_NAME, --all or --glob.", style="bold red")
+        return
+    output_file = output_file or "envpilot-lock.json"
     
     with console.status(f"[bold green]Exporting environment '{env_name}'...") as status:
-        path, error = syncer.export_environment(env_name, output_file)
+        path, error = syncer.export_environment(env_name, output_file, with_hashes, **get_scan_options(refresh, no_cache, jobs))
     
     if error:
         console.print(f"Error: {error}", style="bold red")
@@ -223,13 +700,43 @@ def sync_export(env_name, output_file):
 
 @sync.command("import")
 @click.argument("lock_file", type=click.Path(exists=True, dir_okay=False))
-@click.argument("new_env_name")
-def sync_import(lock_file, new_env_name):
-    """Creates a new environment from a lock file."""
+@click.argument("new_env_name", required=False)
+@click.option("--bundle", "is_bundle", is_flag=True, help="LOCK_FILE is a bundle; recreate its environments concurrently.")
+@click.option("--only", "only_names", multiple=True, help="With --bundle, restore only this environment. Can be repeated.")
+@click.option("--path", "-p", "base_path", type=click.Path(file_okay=False, writable=True), help="With --bundle, create the environments here instead of at their original paths.")
+@click.option("--offline", is_flag=True, help="Install packages only from the local wheelhouse.")
+@click.option("--wheels", "wheel_dirs", multiple=True, type=click.Path(exists=True, file_okay=False), help="Directory of wheels to install from directly (default: the local wheelhouse). Can be repeated.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=None, help="Number of wheels to unpack in parallel.")
+@click.option("--no-verify", is_flag=True, help="Do not check the lock file's signature.")
+def sync_import(lock_file, new_env_name, is_bundle, only_names, base_path, offline, wheel_dirs, jobs, no_verify):
+    """
+    Creates a new environment from a lock file, or all environments of a bundle.
+
+    Pinned packages with a matching wheel are unpacked directly, in
+    parallel and without a resolver; pip installs only the rest.
+    """
+    from . import syncer
     console = Console()
+
+    if is_bundle:
+        with console.status(f"[bold green]Restoring environments from '{lock_file}'...") as status:
+            results, error = syncer.import_bundle(lock_file, list(only_names) or None, base_path, offline, list(wheel_dirs) or None, jobs, not no_verify)
+        if error:
+            console.print(f"Error: {error}", style="bold red")
+            return
+        for name, path, error in results:
+            if error:
+                console.print(f"❌ {name}: {error}", style="bold red")
+            else:
+                console.print(f"✅ {name} restored at {path}", style="bold green")
+        return
+
+    if not new_env_name:
+        console.print("Error: give a NEW_ENV_NAME, or use --bundle.", style="bold red")
+        return
     
     with console.status(f"[bold green]Importing environment from '{lock_file}'...") as status:
-        path, error = syncer.import_environment(lock_file, new_env_name)
+        path, error = syncer.import_environment(lock_file, new_env_name, offline, list(wheel_dirs) or None, jobs, not no_verify)
         
     if error:
         if path:
@@ -241,7 +748,178 @@ def sync_import(lock_file, new_env_name):
         
     console.print(f"✅ Environment '{new_env_name}' imported and created successfully at {path}", style="bold green")
 
+@sync.command("apply")
+@click.argument("lock_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("env_name")
+@click.option("--dry-run", is_flag=True, help="Only print the plan.")
+@click.option("--offline", is_flag=True, help="Install packages only from the local wheelhouse.")
+@click.option("--wheels", "wheel_dirs", multiple=True, type=click.Path(exists=True, file_okay=False), help="Directory of wheels to install from directly (default: the local wheelhouse). Can be repeated.")
+@click.option("--no-verify", is_flag=True, help="Do not check the lock file's signature.")
+@scan_options
+def sync_apply(lock_file, env_name, dry_run, offline, wheel_dirs, no_verify, refresh, no_cache, jobs):
+    """
+    Updates an existing environment to match a lock file.
+
+    Only packages whose pins changed are installed, upgraded or removed.
+    """
+    from rich.table import Table
+    from . import syncer
+    console = Console()
+
+    with console.status(f"[bold green]Applying '{lock_file}' to '{env_name}'...") as status:
+        plan, error = syncer.apply_lock(lock_file, env_name, dry_run, offline, list(wheel_dirs) or None, not no_verify, **get_scan_options(refresh, no_cache, jobs))
+
+    if plan:
+        table = Table(title=f"Changes for {env_name}", show_header=True, header_style="bold magenta")
+        table.add_column("Action", style="cyan")
+        table.add_column("Package")
+        table.add_column("From", style="red")
+        table.add_column("To", style="green")
+        for name, version in plan["install"].items():
+            table.add_row("install", name, "", version)
+        for name, (old_version, new_version) in plan["upgrade"].items():
+            table.add_row("upgrade", name, old_version, new_version)
+        for name, version in plan["remove"].items():
+            table.add_row("remove", name, version, "")
+        if table.row_count:
+            console.print(table)
+        else:
+            console.print(f"✨ '{env_name}' already matches the lock file.", style="bold green")
+            return
+
+    if error:
+        console.print(f"Error: {error}", style="bold red")
+        return
+    if dry_run:
+        console.print("\nThis was a dry run. No packages were changed.", style="italic dim")
+        return
+    console.print(f"✅ '{env_name}' now matches {lock_file}", style="bold green")
+
+@sync.command("verify")
+@click.argument("lock_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("env_name")
+@click.option("--incremental", is_flag=True, help="Skip files whose size and mtime are unchanged since they last verified.")
+@scan_options
+def sync_verify(lock_file, env_name, incremental, refresh, no_cache, jobs):
+    """
+    Checks an environment against a lock file and its own RECORD hashes.
+
+    Exits with status 1 if the lock signature, any package version or any
+    installed file differs.
+    """
+    from . import syncer
+    console = Console()
+
+    with console.status(f"[bold green]Verifying '{env_name}'...") as status:
+        report, error = syncer.verify_lock(lock_file, env_name, incremental, **get_scan_options(refresh, no_cache, jobs))
+    if error:
+        console.print(f"Error: {error}", style="bold red")
+        sys.exit(2)
+
+    if report["signature_error"]:
+        console.print(f"❌ {report['signature_error']}", style="bold red")
+    plan = report["plan"]
+    for name, version in plan["install"].items():
+        console.print(f"❌ {name}=={version} is missing", style="red")
+    for name, (installed_version, locked_version) in plan["upgrade"].items():
+        console.print(f"❌ {name} is {installed_version}, the lock pins {locked_version}", style="red")
+    for name, version in plan["remove"].items():
+        console.print(f"❌ {name}=={version} is not in the lock", style="red")
+    for path in report["modified"]:
+        console.print(f"❌ modified: {path}", style="red")
+    for path in report["missing"]:
+        console.print(f"❌ missing: {path}", style="red")
+
+    summary = f"{report['checked']} files hashed, {report['skipped']} unchanged and skipped."
+    if report["drifted"]:
+        console.print(f"'{env_name}' has drifted from {lock_file}. {summary}", style="bold red")
+        sys.exit(1)
+    console.print(f"✅ '{env_name}' matches {lock_file}. {summary}", style="bold green")
+
 cli.add_command(sync)
 
+@click.group("wheelhouse")
+def wheelhouse_group():
+    """Manages the local wheelhouse used for offline installs."""
+    pass
+
+@wheelhouse_group.command("build")
+@click.argument("env_names", nargs=-1)
+@scan_options
+def wheelhouse_build(env_names, refresh, no_cache, jobs):
+    """
+    Rebuilds wheels from the packages installed in existing environments.
+
+    Uses every discovered environment unless ENV_NAMES are given. Once the
+    wheelhouse exists, `create` and `sync import` also add what they install.
+    """
+    from . import scanner
+    from . import wheelhouse
+    console = Console()
+    with console.status("[bold green]Scanning for all environments...") as status:
+        environments = scanner.discover_environments(os.path.expanduser("~"), fields={"path"}, **get_scan_options(refresh, no_cache, jobs))
+        if env_names:
+            environments = [env for env in environments if env["name"] in env_names]
+        status.update(f"[bold green]Rebuilding wheels from {len(environments)} environments...")
+        built, errors = wheelhouse.collect_wheels([env["path"] for env in environments], jobs=jobs)
+
+    for error in errors:
+        console.print(f"⚠️  {error}", style="yellow")
+    console.print(f"✅ Added {len(built)} wheels to {wheelhouse.get_wheelhouse_dir()}", style="bold green")
+
+cli.add_command(wheelhouse_group)
+
+@click.group()
+def daemon():
+    """Runs a background watcher that keeps the environment registry up to date."""
+    pass
+
+@daemon.command("start")
+@click.argument("roots", nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option("--detach", "-d", is_flag=True, help="Run in the background instead of the foreground.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=None, help="Number of environments to probe in parallel.")
+def daemon_start(roots, detach, jobs):
+    """
+    Scans once, then watches ROOTS (default: your home directory) with inotify.
+
+    While the daemon runs, `list`, `match` and `activate` are answered from
+    its registry instead of scanning.
+    """
+    from . import daemon as envdaemon
+    console = Console()
+    roots = list(roots) or [os.path.expanduser("~")]
+    if detach:
+        console.print(f"Starting envpilot daemon for {', '.join(roots)} in the background.", style="bold green")
+    else:
+        console.print(f"Watching {', '.join(roots)}. Press Ctrl+C to stop.", style="bold green")
+
+    error = envdaemon.run_daemon(roots, detach=detach, jobs=jobs)
+    if error:
+        console.print(f"Error: {error}", style="bold red")
+
+@daemon.command("stop")
+def daemon_stop():
+    """Stops the running daemon."""
+    from . import daemon as envdaemon
+    console = Console()
+    error = envdaemon.stop_daemon()
+    if error:
+        console.print(f"Error: {error}", style="bold red")
+        return
+    console.print("✅ envpilot daemon stopped.", style="bold green")
+
+@daemon.command("status")
+def daemon_status():
+    """Shows whether the daemon is running and what it watches."""
+    from . import daemon as envdaemon
+    console = Console()
+    response = envdaemon.query({"op": "ping"})
+    if response is None:
+        console.print("No envpilot daemon is running.", style="bold yellow")
+        return
+    console.print(f"envpilot daemon running (pid {response['pid']}), tracking {response['environments']} environments in {', '.join(response['roots'])}", style="bold green")
+
+cli.add_command(daemon)
+
 if __name__ == "__main__":
     cli() 
\ No newline at end of file
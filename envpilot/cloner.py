@@ -0,0 +1,374 @@
+import os
+import csv
+import sys
+import shutil
+import subprocess
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+from . import scanner
+from . import wheelhouse
+from . import utils
+
+# ioctl request number for FICLONE on Linux (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+# Packaging tools are never uninstalled when trimming a clone
+KEEP_PACKAGES = {"pip", "setuptools", "wheel"}
+
+# Requirements file options that cannot add packages of their own
+RESOLVED_OPTIONS = (
+    "-i", "--index-url", "--extra-index-url", "--no-index", "-f", "--find-links",
+    "--pre", "--prefer-binary", "--only-binary", "--no-binary", "--trusted-host",
+    "--use-feature", "--require-hashes", "-c ",
+)
+
+# Scripts that embed the environment's own path
+ACTIVATE_SCRIPTS = ("activate", "activate.csh", "activate.fish", "activate.nu", "activate.bat", "Activate.ps1")
+
+def _reflink(src, dst):
+    """Creates `dst` as a copy-on-write clone of `src`. Raises OSError where unsupported."""
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+def clone_file(src, dst, mode):
+    """
+    Clones one regular file using the given `mode` ('reflink', 'hardlink'
+    or 'copy') and returns the mode that worked. A mode that fails is
+    downgraded for this and all following files.
+    """
+    if mode == "reflink":
+        try:
+            _reflink(src, dst)
+            return mode
+        except (OSError, ImportError):
+            mode = "hardlink"
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return mode
+        except OSError:
+            mode = "copy"
+    shutil.copy2(src, dst)
+    return mode
+
+def clone_tree(src, dst, mode="reflink"):
+    """
+    Recreates the directory tree at `src` under `dst`, cloning files with
+    reflinks, hardlinks or plain copies in that order of preference.
+    Symlinks are recreated as symlinks. Returns the mode that was used last.
+    """
+    os.makedirs(dst)
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        for name in list(dirs):
+            source_path = os.path.join(root, name)
+            target_path = os.path.join(target_root, name)
+            if os.path.islink(source_path):
+                os.symlink(os.readlink(source_path), target_path)
+                # os.walk does not descend into symlinked directories anyway
+                dirs.remove(name)
+            else:
+                os.mkdir(target_path)
+                shutil.copystat(source_path, target_path)
+        for name in files:
+            source_path = os.path.join(root, name)
+            target_path = os.path.join(target_root, name)
+            if os.path.islink(source_path):
+                os.symlink(os.readlink(source_path), target_path)
+            else:
+                mode = clone_file(source_path, target_path, mode)
+    return mode
+
+def _rewrite_file(path, replacements):
+    """
+    Applies byte replacements to a file, writing a new file rather than
+    modifying it in place so hardlinked originals are left untouched.
+    Returns True if the file changed.
+    """
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        return False
+    updated = content
+    for old, new in replacements:
+        updated = updated.replace(old, new)
+    if updated == content:
+        return False
+
+    temp_path = path + ".envpilot-tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(updated)
+    shutil.copymode(path, temp_path)
+    os.replace(temp_path, path)
+    return True
+
+def _is_script(path):
+    """Checks whether a file starts with a shebang line."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(2) == b"#!"
+    except OSError:
+        return False
+
+def relocate_environment(env_path, old_path, new_path=None):
+    """
+    Fixes up an environment that was copied from `old_path` to `env_path`:
+    script shebangs, activate scripts and pyvenv.cfg are rewritten to point
+    at the new location, and the activate prompt follows the new name.
+    With `new_path`, the files in `env_path` are rewritten to point there
+    instead, for environments that are moved into place afterwards.
+    """
+    new_path = new_path or env_path
+    old_bytes = os.path.abspath(old_path).encode(sys.getfilesystemencoding())
+    new_bytes = os.path.abspath(new_path).encode(sys.getfilesystemencoding())
+    path_replacements = [(old_bytes, new_bytes)]
+
+    old_name = os.path.basename(old_path).encode(sys.getfilesystemencoding())
+    new_name = os.path.basename(new_path).encode(sys.getfilesystemencoding())
+    activate_replacements = path_replacements + [(b"(" + old_name + b")", b"(" + new_name + b")")]
+
+    scripts_dir = os.path.dirname(scanner.get_python_executable(env_path))
+    try:
+        script_names = os.listdir(scripts_dir)
+    except OSError:
+        script_names = []
+    changed_paths = set()
+    for name in script_names:
+        path = os.path.join(scripts_dir, name)
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        if name in ACTIVATE_SCRIPTS:
+            changed = _rewrite_file(path, activate_replacements)
+        else:
+            changed = _is_script(path) and _rewrite_file(path, path_replacements)
+        if changed:
+            changed_paths.add(os.path.normpath(path))
+    if changed_paths:
+        _update_records(env_path, changed_paths)
+
+    # Python 3.11+ records the creating command, which contains the path
+    cfg_replacements = path_replacements
+    if scanner.read_pyvenv_cfg(env_path).get("prompt") == os.path.basename(old_path):
+        cfg_replacements = cfg_replacements + [(b"prompt = " + old_name, b"prompt = " + new_name)]
+    _rewrite_file(os.path.join(env_path, "pyvenv.cfg"), cfg_replacements)
+
+def _update_records(env_path, changed_paths):
+    """
+    Updates the RECORD hash and size of rewritten files, so that `sync
+    verify` still trusts them. RECORD files are replaced rather than
+    modified, since they may be hardlinked to the source environment's.
+    """
+    for dist_info_path in wheelhouse.list_distributions(env_path):
+        site_packages = os.path.dirname(dist_info_path)
+        record_path = os.path.join(dist_info_path, "RECORD")
+        try:
+            with open(record_path, 'r', encoding='utf-8', newline='') as f:
+                rows = list(csv.reader(f))
+        except OSError:
+            continue
+        updated = False
+        for row in rows:
+            if len(row) < 3 or not row[1]:
+                continue
+            path = os.path.normpath(os.path.join(site_packages, row[0]))
+            if path not in changed_paths:
+                continue
+            try:
+                row[1] = utils.record_hash_file(path, row[1].partition("=")[0])
+                row[2] = str(os.path.getsize(path))
+            except (OSError, ValueError):
+                continue
+            updated = True
+        if not updated:
+            continue
+        temp_path = record_path + ".envpilot-tmp"
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f, lineterminator="\n").writerows(rows)
+        shutil.copymode(record_path, temp_path)
+        os.replace(temp_path, record_path)
+
+def _read_requires(dist_path):
+    """Reads the Requires-Dist entries of a .dist-info or .egg-info distribution."""
+    requires = []
+    if dist_path.endswith(".dist-info"):
+        try:
+            with open(os.path.join(dist_path, "METADATA"), 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if not line.strip():
+                        break
+                    if line.startswith("Requires-Dist:"):
+                        requires.append(line[14:].strip())
+        except OSError:
+            pass
+        return requires
+
+    # egg-info lists requirements in requires.txt, with [extra:marker] sections
+    section = None
+    try:
+        with open(os.path.join(dist_path, "requires.txt"), 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("["):
+                    section = line[1:-1]
+                    continue
+                if section is None:
+                    requires.append(line)
+                else:
+                    extra, _, marker = section.partition(":")
+                    markers = []
+                    if extra:
+                        markers.append(f'extra == "{extra}"')
+                    if marker:
+                        markers.append(f"({marker})")
+                    requires.append(f"{line}; {' and '.join(markers)}")
+    except OSError:
+        pass
+    return requires
+
+def read_dependency_graph(env_path):
+    """
+    Reads every installed distribution's dependencies from site-packages.
+    Returns {canonical_name: [requirement strings]}.
+    """
+    graph = {}
+    for site_packages in scanner.get_site_packages_dirs(env_path):
+        try:
+            entries = list(os.scandir(site_packages))
+        except OSError:
+            continue
+        for entry in entries:
+            if not entry.name.endswith((".dist-info", ".egg-info")):
+                continue
+            name, _ = scanner.read_distribution(entry.path)
+            if name:
+                graph.setdefault(canonicalize_name(name), _read_requires(entry.path))
+    return graph
+
+def _marker_applies(requirement, extras, marker_environment):
+    """Evaluates a requirement's marker, treating unevaluable markers as applying."""
+    if requirement.marker is None:
+        return True
+    try:
+        for extra in extras or {""}:
+            environment = dict(marker_environment, extra=extra)
+            if requirement.marker.evaluate(environment):
+                return True
+        return False
+    except Exception:
+        return True
+
+def dependency_closure(required_packages, graph, python_version=None):
+    """
+    Returns the canonical names of the required packages and everything
+    they depend on, following extras and evaluating environment markers
+    for the environment's Python version.
+    """
+    marker_environment = {}
+    if python_version:
+        marker_environment["python_version"] = ".".join(python_version.split(".")[:2])
+        marker_environment["python_full_version"] = python_version
+
+    needed = set()
+    visited = set()
+    pending = [(req.name, frozenset(req.extras)) for req in required_packages]
+    while pending:
+        name, extras = pending.pop()
+        name = canonicalize_name(name)
+        if (name, extras) in visited:
+            continue
+        visited.add((name, extras))
+        needed.add(name)
+        for requirement_str in graph.get(name, []):
+            try:
+                requirement = Requirement(requirement_str)
+            except Exception:
+                continue
+            if _marker_applies(requirement, extras, marker_environment):
+                pending.append((requirement.name, frozenset(requirement.extras)))
+    return needed
+
+def _run_pip(python_executable, args):
+    """Runs pip inside an environment, raising CalledProcessError on failure."""
+    subprocess.run(
+        [python_executable, "-m", "pip"] + args,
+        check=True,
+        capture_output=True,
+        text=True
+    )
+
+def _is_resolved_option(option):
+    """
+    Checks whether an option line from `matcher.read_requirements` leaves
+    the requirements fully known: index and install options do, while
+    remote -r files, editable installs and bare URLs add unknown packages.
+    """
+    if option.startswith(RESOLVED_OPTIONS):
+        return True
+    # A requirement followed by per-requirement options such as --hash
+    from . import matcher
+    return " --" in option and matcher.parse_requirement_line(option.split(" --", 1)[0]) is not None
+
+def reconcile_environment(env_path, requirements_path, required_packages, offline=False, options=()):
+    """
+    Brings a cloned environment in line with a requirements file: pip
+    installs whatever is missing or mismatched, then every distribution
+    outside the requirements' dependency closure is uninstalled.
+    `options` are the file's non-requirement lines (see
+    `matcher.read_requirements`); if any of them may install packages not
+    listed in `required_packages`, pip always runs and nothing is removed.
+    With `offline`, packages are only installed from the local wheelhouse.
+    Returns (installed, removed) lists of package names.
+    """
+    from . import matcher
+    python_executable = scanner.get_python_executable(env_path)
+    resolved = all(_is_resolved_option(option) for option in options)
+
+    installed_packages = scanner.read_installed_packages(env_path) or {}
+    _, missing, _ = matcher.calculate_match(required_packages, installed_packages)
+    if missing or not resolved:
+        # pip skips requirements that are already satisfied, so only the
+        # difference is downloaded and installed
+        _run_pip(python_executable, ["install", "-r", requirements_path] + wheelhouse.get_pip_install_options(offline))
+
+    after_install = scanner.read_installed_packages(env_path) or {}
+    installed = sorted(
+        name for name, version in after_install.items()
+        if installed_packages.get(name) != version
+    )
+
+    if not resolved:
+        return installed, []
+    graph = read_dependency_graph(env_path)
+    needed = dependency_closure(required_packages, graph, scanner.read_python_version(env_path))
+    removed = sorted(
+        name for name in graph
+        if name not in needed and name not in KEEP_PACKAGES
+    )
+    if removed:
+        _run_pip(python_executable, ["uninstall", "-y"] + removed)
+    return installed, removed
+
+def clone_environment(source_path, env_path, mode="reflink"):
+    """
+    Clones the environment at `source_path` to `env_path` and relocates it.
+    Returns (link_mode, error), where link_mode is the cloning method used.
+    """
+    if os.path.exists(env_path):
+        return None, f"An environment already exists at '{env_path}'."
+    try:
+        mode = clone_tree(source_path, env_path, mode)
+        relocate_environment(env_path, source_path)
+    except OSError as e:
+        shutil.rmtree(env_path, ignore_errors=True)
+        return None, f"Failed to clone '{source_path}': {e}"
+    return mode, None
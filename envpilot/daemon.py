@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import struct
+import ctypes
+import ctypes.util
+import selectors
+from . import metadata
+from . import scanner
+from .daemon_client import CLIENT_TIMEOUT, get_socket_path, query
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Seconds to wait for the filesystem to settle before re-probing, so that a
+# `pip install` touching site-packages many times causes a single probe
+DEBOUNCE_SECONDS = 0.5
+
+# Without enough inotify watches the daemon falls back to periodic rescans
+FALLBACK_RESCAN_SECONDS = 300
+
+def is_supported():
+    """The daemon needs Linux inotify and Unix domain sockets."""
+    return sys.platform.startswith("linux") and hasattr(socket, "AF_UNIX")
+
+class Inotify:
+    """A minimal ctypes binding to the Linux inotify API."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def remove_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Returns the pending events as (wd, mask, name) tuples."""
+        try:
+            data = os.read(self.fd, 1024 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class EnvironmentDaemon:
+    """
+    Keeps a registry of the environments under a set of search roots up to
+    date using inotify, and answers queries about it over a Unix socket.
+
+    Directories visited by the discovery walk are watched for new or removed
+    pyvenv.cfg files and sub-directories. Each environment's root, bin and
+    site-packages directories are watched for changes to its packages.
+    """
+
+    def __init__(self, roots, jobs=None):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.jobs = jobs
+        self.inotify = Inotify()
+        self.watches = {}          # wd -> directory
+        self.watched_paths = {}    # directory -> wd
+        self.environments = {}     # env_path -> record
+        self.dirty_dirs = set()
+        self.dirty_envs = set()
+        self.last_event = None
+        self.degraded = False
+        self.last_full_scan = 0
+        self.running = True
+
+    def _watch(self, path):
+        if self.degraded or path in self.watched_paths:
+            return
+        try:
+            wd = self.inotify.add_watch(path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                # Out of inotify watches (fs.inotify.max_user_watches)
+                print("envpilot daemon: inotify watch limit reached, falling back to periodic rescans", file=sys.stderr)
+                self.degraded = True
+            return
+        self.watches[wd] = path
+        self.watched_paths[path] = wd
+
+    def _watch_environment(self, env_path):
+        for path in [env_path, os.path.dirname(scanner.get_python_executable(env_path))] + scanner.get_site_packages_dirs(env_path):
+            self._watch(path)
+
+    def _root_for(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip(os.path.sep) + os.path.sep):
+                return root
+        return None
+
+    def _owning_environment(self, path):
+        """Returns the known environment that `path` lies in, if any."""
+        for env_path in self.environments:
+            if path == env_path or path.startswith(env_path + os.path.sep):
+                return env_path
+        return None
+
+    def _walk(self, path):
+        """Walks a (new) directory, watching it and returning the environments found."""
+        root = self._root_for(path)
+        if root is None:
+            return []
+        depth = path.count(os.path.sep) - root.rstrip(os.path.sep).count(os.path.sep)
+        max_depth = scanner.MAX_WALK_DEPTH - depth
+        if max_depth < 0:
+            return []
+        return [env_path for env_path, _ in scanner.walk_environments(path, on_directory=self._watch, max_depth=max_depth)]
+
+    def _probe(self, env_paths):
+        """Re-probes environments, dropping those that no longer exist."""
+        env_paths = sorted(set(env_paths))
+        fields = scanner.DEFAULT_FIELDS | {"packages"}
+        records = scanner.probe_environments(env_paths, fields=fields, jobs=self.jobs)
+        found = {record["path"] for record in records}
+        for env_path in env_paths:
+            if env_path not in found:
+                self.environments.pop(env_path, None)
+        for record in records:
+            self.environments[record["path"]] = record
+            self._watch_environment(record["path"])
+
+    def _save_roots(self):
+        """Mirrors the registry into the index so the CLI stays fast while the daemon is down."""
+        index = metadata.load_index()
+        for root in self.roots:
+            index["roots"][root] = {
+                "scanned_at": self.last_full_scan,
+                "environments": sorted(path for path in self.environments if self._root_for(path) == root),
+            }
+        metadata.save_index(index)
+
+    def full_scan(self):
+        env_paths = []
+        for root in self.roots:
+            env_paths.extend(self._walk(root))
+        self.environments = {}
+        self._probe(env_paths)
+        self.last_full_scan = time.time()
+        self._save_roots()
+
+    def handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were lost; only a full scan can recover
+            self.dirty_dirs.update(self.roots)
+            return
+        if mask & IN_IGNORED:
+            path = self.watches.pop(wd, None)
+            if path is not None:
+                self.watched_paths.pop(path, None)
+            return
+
+        directory = self.watches.get(wd)
+        if directory is None:
+            return
+        path = os.path.join(directory, name) if name else directory
+        env_path = self._owning_environment(directory)
+
+        if env_path is not None:
+            self.dirty_envs.add(env_path)
+        elif name == "pyvenv.cfg" or os.path.exists(os.path.join(directory, "pyvenv.cfg")):
+            # A new environment is being created here
+            self.dirty_dirs.add(directory)
+        elif os.path.exists(os.path.join(os.path.dirname(directory), "pyvenv.cfg")):
+            # e.g. bin/python appearing in an environment being created
+            self.dirty_dirs.add(os.path.dirname(directory))
+        elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self.dirty_dirs.add(path)
+        elif mask & IN_ISDIR and mask & (IN_DELETE | IN_MOVED_FROM):
+            prefix = path + os.path.sep
+            self.dirty_envs.update(p for p in self.environments if p == path or p.startswith(prefix))
+        self.last_event = time.monotonic()
+
+    def apply_changes(self):
+        dirty_dirs, self.dirty_dirs = self.dirty_dirs, set()
+        dirty_envs, self.dirty_envs = self.dirty_envs, set()
+        if set(self.roots) & dirty_dirs:
+            self.full_scan()
+            return
+        env_paths = set(dirty_envs)
+        for directory in dirty_dirs:
+            env_paths.update(self._walk(directory))
+        self._probe(env_paths)
+        self._save_roots()
+
+    def handle_request(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "roots": self.roots, "environments": len(self.environments)}
+        if op == "list":
+            root = request.get("root")
+            if root not in self.roots:
+                return {"ok": False, "error": f"'{root}' is not watched by this daemon."}
+            keys = set()
+            for field in request.get("fields") or scanner.DEFAULT_FIELDS:
+                keys.update(scanner.FIELD_KEYS.get(field, ()))
+            keys.update(scanner.FIELD_KEYS["path"])
+            records = [
+                {key: value for key, value in record.items() if key in keys}
+                for path, record in sorted(self.environments.items())
+                if self._root_for(path) == root
+            ]
+            return {"ok": True, "environments": records}
+        if op == "resolve":
+            name = request.get("name")
+            paths = sorted(path for path, record in self.environments.items() if record["name"] == name)
+            return {"ok": True, "paths": paths}
+        if op == "stop":
+            self.running = False
+            return {"ok": True}
+        return {"ok": False, "error": f"Unknown request '{op}'."}
+
+    def _serve_client(self, server):
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        with conn:
+            conn.settimeout(CLIENT_TIMEOUT)
+            try:
+                data = b""
+                while not data.endswith(b"\n"):
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                try:
+                    response = self.handle_request(json.loads(data.decode('utf-8')))
+                except ValueError:
+                    response = {"ok": False, "error": "Malformed request."}
+                conn.sendall(json.dumps(response).encode('utf-8'))
+            except OSError:
+                pass
+
+    def serve(self, socket_path):
+        """Runs the event loop until a `stop` request arrives."""
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            server.bind(socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen(16)
+        server.setblocking(False)
+
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ, "client")
+        selector.register(self.inotify.fd, selectors.EVENT_READ, "inotify")
+        try:
+            while self.running:
+                timeout = None
+                if self.dirty_dirs or self.dirty_envs:
+                    timeout = max(0, self.last_event + DEBOUNCE_SECONDS - time.monotonic())
+                elif self.degraded:
+                    timeout = max(0, self.last_full_scan + FALLBACK_RESCAN_SECONDS - time.time())
+
+                for key, _ in selector.select(timeout):
+                    if key.data == "client":
+                        self._serve_client(server)
+                    else:
+                        for wd, mask, name in self.inotify.read_events():
+                            self.handle_event(wd, mask, name)
+
+                if (self.dirty_dirs or self.dirty_envs) and time.monotonic() - self.last_event >= DEBOUNCE_SECONDS:
+                    self.apply_changes()
+                elif self.degraded and time.time() - self.last_full_scan >= FALLBACK_RESCAN_SECONDS:
+                    self.full_scan()
+        finally:
+            selector.close()
+            server.close()
+            self.inotify.close()
+            try:
+                os.remove(socket_path)
+            except OSError:
+                pass
+
+def _detach():
+    """Forks into the background, detached from the terminal (Unix double fork)."""
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+def run_daemon(roots, detach=False, jobs=None):
+    """
+    Starts the daemon for the given search roots.
+    Returns an error message, or None once the daemon has been stopped.
+    """
+    if not is_supported():
+        return "The envpilot daemon requires Linux (inotify)."
+    if query({"op": "ping"}) is not None:
+        return "An envpilot daemon is already running."
+
+    socket_path = get_socket_path()
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    try:
+        # Left behind by a daemon that did not shut down cleanly
+        os.remove(socket_path)
+    except OSError:
+        pass
+
+    try:
+        daemon = EnvironmentDaemon(roots, jobs=jobs)
+    except OSError as e:
+        return f"Failed to initialise inotify: {e}"
+
+    if detach:
+        _detach()
+    daemon.full_scan()
+    try:
+        daemon.serve(socket_path)
+    except OSError as e:
+        return f"Daemon stopped: {e}"
+    except KeyboardInterrupt:
+        pass
+    return None
+
+def stop_daemon():
+    """Asks the running daemon to exit. Returns an error message or None."""
+    if query({"op": "stop"}) is None:
+        return "No envpilot daemon is running."
+    return None
@@ -0,0 +1,43 @@
+import os
+import json
+from . import metadata
+
+# The client side of the `envpilot daemon` socket protocol. It is kept apart
+# from the daemon so `activate` and `resolve` can ask a running daemon
+# without loading inotify, selectors or the discovery code.
+
+# Clients give up quickly so a wedged daemon never slows the CLI down
+CLIENT_TIMEOUT = 2.0
+
+def get_socket_path():
+    """Returns the Unix socket the daemon listens on."""
+    return os.path.join(metadata.get_cache_dir(), "daemon.sock")
+
+def query(request, timeout=CLIENT_TIMEOUT):
+    """
+    Sends a request to the running daemon and returns its response, or None
+    if no daemon is running or the request could not be answered.
+    """
+    socket_path = get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    import socket
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode('utf-8') + b"\n")
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        response = json.loads(b"".join(chunks).decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(response, dict) or not response.get("ok"):
+        return None
+    return response
@@ -0,0 +1,288 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from . import scanner
+from . import metadata
+from . import utils
+
+def get_store_dir():
+    """Returns the directory of the shared, content-addressed file store."""
+    return os.path.join(os.path.expanduser("~"), ".envpilot-store")
+
+def get_objects_dir(store_dir):
+    return os.path.join(store_dir, "objects")
+
+def get_manifest_path(store_dir, env_path):
+    """Returns the file recording which files of an environment are linked into the store."""
+    return os.path.join(store_dir, "manifests", utils.path_key(env_path) + ".json")
+
+def get_object_name(size, digest, mode):
+    """
+    Names a store object. Hardlinks share their permissions, so the mode is
+    part of the key; the size comes first so it can be read from a listing.
+    """
+    return os.path.join(digest[:2], f"{size}-{digest}-{mode:o}")
+
+def load_manifest(store_dir, env_path):
+    manifest = metadata.read_json(get_manifest_path(store_dir, env_path))
+    if not isinstance(manifest, dict):
+        return {"env_path": env_path, "files": {}}
+    return manifest
+
+def list_store_sizes(store_dir):
+    """Returns the sizes of the objects in the store, read from their names."""
+    sizes = set()
+    objects_dir = get_objects_dir(store_dir)
+    try:
+        buckets = list(os.scandir(objects_dir))
+    except OSError:
+        return sizes
+    for bucket in buckets:
+        try:
+            names = os.listdir(bucket.path)
+        except OSError:
+            continue
+        for name in names:
+            size = name.partition("-")[0]
+            if size.isdigit():
+                sizes.add(int(size))
+    return sizes
+
+def collect_garbage(store_dir):
+    """
+    Deletes store objects that no environment links to any more, e.g. after
+    the environments were removed. Returns the bytes freed.
+    """
+    freed = 0
+    objects_dir = get_objects_dir(store_dir)
+    try:
+        buckets = list(os.scandir(objects_dir))
+    except OSError:
+        return 0
+    for bucket in buckets:
+        try:
+            entries = list(os.scandir(bucket.path))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+                if st.st_nlink == 1:
+                    os.remove(entry.path)
+                    freed += utils.allocated_bytes(st)
+            except OSError:
+                continue
+    return freed
+
+def _iter_site_packages_files(env_path):
+    """Yields (path, relative_path, stat) for the non-empty regular files under site-packages."""
+    for site_packages in scanner.get_site_packages_dirs(env_path):
+        for root, dirs, files in os.walk(site_packages):
+            # Bytecode embeds its own path, so it never matches across environments
+            dirs[:] = [d for d in dirs if d != "__pycache__"]
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path, follow_symlinks=False)
+                except OSError:
+                    continue
+                if st.st_size and os.path.isfile(path) and not os.path.islink(path):
+                    yield path, os.path.relpath(path, env_path), st
+
+def _is_linked_to_store(store_dir, manifest, relative_path, st):
+    """Checks whether a file is still the store object its manifest entry names."""
+    object_name = manifest["files"].get(relative_path)
+    if object_name is None or st.st_nlink < 2:
+        return False
+    try:
+        object_st = os.stat(os.path.join(get_objects_dir(store_dir), object_name))
+    except OSError:
+        return False
+    return (object_st.st_dev, object_st.st_ino) == (st.st_dev, st.st_ino)
+
+def _replace_with_link(object_path, path, st):
+    """
+    Atomically replaces `path` with a hardlink to `object_path`, unless the
+    file changed since it was hashed. Returns True if it was replaced.
+    """
+    temp_path = path + ".envpilot-dedupe"
+    os.link(object_path, temp_path)
+    try:
+        current = os.stat(path, follow_symlinks=False)
+        if (current.st_ino, current.st_size, current.st_mtime_ns) != (st.st_ino, st.st_size, st.st_mtime_ns):
+            os.remove(temp_path)
+            return False
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+def _same_device(store_dir, path):
+    """Checks whether `path` is on the filesystem that holds (or will hold) the store."""
+    probe = store_dir
+    while not os.path.exists(probe):
+        probe = os.path.dirname(probe)
+    try:
+        return os.stat(probe).st_dev == os.stat(path).st_dev
+    except OSError:
+        return False
+
+def dedupe_environments(environments, dry_run=False, jobs=None):
+    """
+    Replaces identical site-packages files across environments with
+    hardlinks to a single copy kept in the store (see `get_store_dir`).
+
+    Environments are processed largest first (by their 'size_mb'). Only
+    files whose size occurs more than once are hashed, on a pool of `jobs`
+    threads. A file is swapped for its store object with an atomic rename,
+    and only if it is unchanged since it was hashed. Every linked file is
+    recorded in a per-environment manifest so `undo_dedupe` can restore
+    private copies.
+
+    Returns a list of {'env', 'linked', 'reclaimed_bytes', 'error'} dicts,
+    one per environment. With `dry_run`, nothing is changed and the
+    savings are estimated.
+    """
+    store_dir = get_store_dir()
+    objects_dir = get_objects_dir(store_dir)
+    environments = sorted(environments, key=lambda env: env.get("size_mb", 0), reverse=True)
+
+    results = []
+    listings = []
+    for env in environments:
+        result = {"env": env, "linked": 0, "reclaimed_bytes": 0, "error": None}
+        results.append(result)
+        if not _same_device(store_dir, env["path"]):
+            result["error"] = f"{env['path']} is on a different filesystem than {store_dir}."
+            continue
+        manifest = load_manifest(store_dir, env["path"])
+        files = [
+            item for item in _iter_site_packages_files(env["path"])
+            if not _is_linked_to_store(store_dir, manifest, item[1], item[2])
+        ]
+        listings.append((result, manifest, files))
+
+    # A file can only have a duplicate if another file has the same size
+    size_counts = Counter(st.st_size for _, _, files in listings for _, _, st in files)
+    store_sizes = list_store_sizes(store_dir)
+    candidates = [
+        (path, st) for _, _, files in listings for path, _, st in files
+        if size_counts[st.st_size] > 1 or st.st_size in store_sizes
+    ]
+    with ThreadPoolExecutor(max_workers=jobs or scanner.get_default_jobs()) as executor:
+        digests = dict(zip((path for path, _ in candidates), executor.map(utils.hash_file, (path for path, _ in candidates))))
+
+    object_inodes = {}
+    # Links to each inode that are still outside the store; its blocks are
+    # only freed once all of them have been replaced
+    remaining_links = {}
+    for result, manifest, files in listings:
+        env_linked = {}
+        try:
+            for path, relative_path, st in files:
+                digest = digests.get(path)
+                if digest is None:
+                    continue
+                object_name = get_object_name(st.st_size, digest, st.st_mode & 0o7777)
+                object_path = os.path.join(objects_dir, object_name)
+                if object_name not in object_inodes:
+                    try:
+                        object_st = os.stat(object_path)
+                        object_inodes[object_name] = (object_st.st_dev, object_st.st_ino)
+                    except OSError:
+                        # First copy seen: it becomes the store object in place
+                        if not dry_run:
+                            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                            os.link(path, object_path)
+                        object_inodes[object_name] = (st.st_dev, st.st_ino)
+                        env_linked[relative_path] = object_name
+                        continue
+                if object_inodes[object_name] == (st.st_dev, st.st_ino):
+                    # Already a link to the object, e.g. in a hardlinked clone
+                    env_linked[relative_path] = object_name
+                    continue
+                if not dry_run and not _replace_with_link(object_path, path, st):
+                    continue
+                env_linked[relative_path] = object_name
+                key = (st.st_dev, st.st_ino)
+                remaining_links[key] = remaining_links.get(key, st.st_nlink) - 1
+                if remaining_links[key] == 0:
+                    result["reclaimed_bytes"] += utils.allocated_bytes(st)
+        except OSError as e:
+            result["error"] = f"Could not dedupe {result['env']['path']}: {e}"
+        result["linked"] = len(env_linked)
+        if env_linked and not dry_run:
+            manifest["files"].update(env_linked)
+            metadata.write_json(get_manifest_path(store_dir, result["env"]["path"]), manifest)
+
+    if not dry_run:
+        changed = [result["env"]["path"] for result in results if result["linked"]]
+        scanner.forget_fields(changed, {"size"})
+    return results
+
+def undo_dedupe(env_paths=None):
+    """
+    Gives deduplicated environments back private copies of their files and
+    drops their manifests, then deletes store objects nothing links to.
+    `env_paths` limits this to some environments; by default all are restored.
+    Returns (restored, errors), where restored maps each environment path
+    to the number of files copied back.
+    """
+    store_dir = get_store_dir()
+    objects_dir = get_objects_dir(store_dir)
+    manifests_dir = os.path.join(store_dir, "manifests")
+    try:
+        manifest_names = sorted(os.listdir(manifests_dir))
+    except OSError:
+        manifest_names = []
+
+    wanted = None if env_paths is None else {os.path.abspath(path) for path in env_paths}
+    restored = {}
+    errors = []
+    for manifest_name in manifest_names:
+        manifest_path = os.path.join(manifests_dir, manifest_name)
+        manifest = metadata.read_json(manifest_path)
+        if not isinstance(manifest, dict):
+            continue
+        env_path = manifest["env_path"]
+        if wanted is not None and env_path not in wanted:
+            continue
+
+        count = 0
+        failed = False
+        for relative_path, object_name in manifest["files"].items():
+            path = os.path.join(env_path, relative_path)
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError:
+                # Removed since, e.g. by pip uninstall
+                continue
+            if not _is_linked_to_store(store_dir, manifest, relative_path, st):
+                continue
+            temp_path = path + ".envpilot-undo"
+            try:
+                with open(os.path.join(objects_dir, object_name), 'rb') as source, open(temp_path, 'wb') as target:
+                    for chunk in iter(lambda: source.read(utils.HASH_CHUNK_SIZE), b""):
+                        target.write(chunk)
+                os.chmod(temp_path, st.st_mode & 0o7777)
+                os.utime(temp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+                os.replace(temp_path, path)
+                count += 1
+            except OSError as e:
+                failed = True
+                errors.append(f"Could not restore {path}: {e}")
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+        restored[env_path] = count
+        if not failed:
+            os.remove(manifest_path)
+
+    scanner.forget_fields(list(restored), {"size"})
+    collect_garbage(store_dir)
+    return restored, errors
@@ -0,0 +1,137 @@
+import os
+from collections import namedtuple
+from . import metadata
+from . import utils
+
+# apparent:  sum of file sizes, each hardlinked file counted once
+# allocated: bytes actually allocated on disk (st_blocks), each file counted once
+# exclusive: allocated bytes that would be freed by deleting the tree, i.e.
+#            excluding files that are also hardlinked from outside it
+DiskUsage = namedtuple("DiskUsage", ["apparent", "allocated", "exclusive"])
+
+def get_size_cache_path(path):
+    """Returns the cache file holding the per-directory totals for `path`."""
+    return os.path.join(metadata.get_cache_dir(), "sizes", utils.path_key(path) + ".json")
+
+def _add_linked_file(linked, st):
+    """Records one sighting of a file that has more than one hardlink."""
+    key = (st.st_dev, st.st_ino)
+    if key in linked:
+        linked[key][0] += 1
+    else:
+        linked[key] = [1, st.st_nlink, st.st_size, utils.allocated_bytes(st)]
+
+def _scan_directory(path, st, linked):
+    """
+    Lists a directory with os.scandir, stat-ing each entry exactly once.
+    Returns the cache node for it, or None if it could not be read.
+    """
+    # The directory's own entry counts towards its totals, as with `du`
+    node = {"m": st.st_mtime_ns, "a": st.st_size, "b": utils.allocated_bytes(st), "l": [], "d": {}}
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return None
+
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                child = _scan_directory(entry.path, entry.stat(follow_symlinks=False), linked)
+                if child is not None:
+                    node["d"][entry.name] = child
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                if st.st_nlink > 1:
+                    node["l"].append(entry.name)
+                    _add_linked_file(linked, st)
+                else:
+                    node["a"] += st.st_size
+                    node["b"] += utils.allocated_bytes(st)
+        except OSError:
+            # Entry vanished or is unreadable; skip it
+            continue
+    return node
+
+def _revalidate_directory(path, node, linked):
+    """
+    Re-checks a cached directory node, returning the up-to-date node and
+    whether anything had to be rescanned.
+
+    A directory whose mtime is unchanged has had no entries added, removed or
+    renamed, so its cached file totals are reused without listing it. Its
+    subdirectories are still stat-ed individually, and hardlinked files are
+    re-stat-ed because their link count can change from outside the tree.
+    """
+    try:
+        st = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None, True
+    if node is None or node.get("m") != st.st_mtime_ns:
+        return _scan_directory(path, st, linked), True
+
+    changed = False
+    for name in node["l"]:
+        try:
+            _add_linked_file(linked, os.stat(os.path.join(path, name), follow_symlinks=False))
+        except OSError:
+            changed = True
+    children = {}
+    for name, child in node["d"].items():
+        child, child_changed = _revalidate_directory(os.path.join(path, name), child, linked)
+        changed = changed or child_changed
+        if child is not None:
+            children[name] = child
+    node["d"] = children
+    return node, changed
+
+def _sum_tree(node):
+    """Sums the single-link file totals of a cached directory tree."""
+    apparent, allocated = node["a"], node["b"]
+    for child in node["d"].values():
+        child_apparent, child_allocated = _sum_tree(child)
+        apparent += child_apparent
+        allocated += child_allocated
+    return apparent, allocated
+
+def forget_disk_usage(paths):
+    """Drops the cached per-directory totals of removed trees."""
+    for path in paths:
+        try:
+            os.remove(get_size_cache_path(path))
+        except OSError:
+            pass
+
+def get_disk_usage(path, use_cache=True, refresh=False):
+    """
+    Measures the disk usage of a directory tree.
+
+    Symlinks are not followed or counted, and files hardlinked several times
+    are counted once, keyed by (st_dev, st_ino). With `use_cache`, the
+    per-directory totals are kept under the envpilot cache directory and only
+    directories whose mtime changed are listed again on the next call.
+    `refresh` ignores the cached totals and rescans the whole tree, then
+    caches the new ones.
+    """
+    cache_path = get_size_cache_path(path)
+    cached = metadata.read_json(cache_path) if use_cache and not refresh else None
+
+    linked = {}
+    tree, changed = _revalidate_directory(path, cached, linked)
+    if tree is None:
+        return DiskUsage(0, 0, 0)
+
+    apparent, allocated = _sum_tree(tree)
+    exclusive = allocated
+    for seen, nlink, size, blocks in linked.values():
+        apparent += size
+        allocated += blocks
+        if seen >= nlink:
+            # Every link to this file lives inside the tree
+            exclusive += blocks
+
+    if use_cache and changed:
+        try:
+            metadata.write_json(cache_path, tree)
+        except OSError:
+            pass
+    return DiskUsage(apparent, allocated, exclusive)
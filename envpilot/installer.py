@@ -0,0 +1,350 @@
+import io
+import os
+import csv
+import sys
+import shutil
+import zipfile
+import tempfile
+import subprocess
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from packaging.tags import sys_tags, compatible_tags
+from packaging.utils import canonicalize_name, parse_wheel_filename, InvalidWheelFilename
+from packaging.version import Version, InvalidVersion
+from . import scanner
+from . import wheelhouse
+from . import utils
+from . import cloner
+
+INSTALLER_NAME = "envpilot"
+
+SCRIPT_TEMPLATE = """#!{python}
+# -*- coding: utf-8 -*-
+import re
+import sys
+from {module} import {import_name}
+if __name__ == "__main__":
+    sys.argv[0] = re.sub(r"(-script\\.pyw|\\.exe)?$", "", sys.argv[0])
+    sys.exit({call}())
+"""
+
+def is_supported():
+    """Direct installs generate POSIX launcher scripts, so Windows always goes through pip."""
+    return sys.platform != "win32"
+
+def get_supported_tags(env_path):
+    """
+    Returns the wheel tags an environment's interpreter accepts. When it runs
+    a different Python version than envpilot, only pure-Python wheels are
+    trusted.
+    """
+    env_version = scanner.read_python_version(env_path)
+    if env_version and tuple(int(part) for part in env_version.split(".")[:2]) == sys.version_info[:2]:
+        return {str(tag) for tag in sys_tags()}
+    if env_version:
+        python_version = tuple(int(part) for part in env_version.split(".")[:2])
+    else:
+        python_version = sys.version_info[:2]
+    return {str(tag) for tag in compatible_tags(python_version, platforms=["any"])}
+
+def index_wheels(wheel_dirs):
+    """Maps (canonical_name, version) to the wheel files found in `wheel_dirs`."""
+    index = {}
+    for wheel_dir in wheel_dirs:
+        try:
+            names = sorted(os.listdir(wheel_dir))
+        except OSError:
+            continue
+        for name in names:
+            if not name.endswith(".whl"):
+                continue
+            try:
+                project, version, _, tags = parse_wheel_filename(name)
+            except (InvalidWheelFilename, InvalidVersion):
+                continue
+            index.setdefault((project, version), []).append((os.path.join(wheel_dir, name), {str(tag) for tag in tags}))
+    return index
+
+def find_wheel(index, name, version, supported_tags):
+    """Returns the path of a compatible wheel for an exact pin, or None."""
+    try:
+        key = (canonicalize_name(name), Version(version))
+    except InvalidVersion:
+        return None
+    for wheel_path, tags in index.get(key, []):
+        if tags & supported_tags:
+            return wheel_path
+    return None
+
+def _safe_join(base, member):
+    """Joins an archive member path to `base`, refusing paths that escape it."""
+    if member.startswith(("/", "\\")) or ".." in member.replace("\\", "/").split("/"):
+        raise ValueError(f"unsafe path in wheel: {member}")
+    return os.path.join(base, *member.split("/"))
+
+def _read_entry_points(data):
+    """Returns [(script_name, 'module:attr')] for the console and GUI scripts of a wheel."""
+    parser = configparser.ConfigParser(interpolation=None, delimiters=("=",))
+    parser.optionxform = str
+    parser.read_string(data.decode("utf-8"))
+    scripts = []
+    for section in ("console_scripts", "gui_scripts"):
+        if parser.has_section(section):
+            scripts.extend((name, parser.get(section, name).split("[")[0].strip()) for name in parser.options(section))
+    return scripts
+
+def _write_file(path, data, mode=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mode:
+        os.chmod(path, mode)
+
+def install_wheel(wheel_path, env_path):
+    """
+    Unpacks a wheel straight into an environment, the way pip would:
+    files go into site-packages (or scripts/data/headers for .data
+    entries), console scripts are generated from entry_points.txt, and
+    INSTALLER and RECORD are written last.
+    Returns (dist_info_path, error).
+    """
+    site_packages_dirs = scanner.get_site_packages_dirs(env_path)
+    if not site_packages_dirs:
+        return None, f"{env_path} has no site-packages directory."
+    site_packages = site_packages_dirs[0]
+    scripts_dir = os.path.dirname(scanner.get_python_executable(env_path))
+    python_executable = scanner.get_python_executable(env_path)
+    project = os.path.basename(wheel_path).split("-")[0]
+
+    records = []
+    def record(path, data):
+        relative_path = os.path.relpath(path, site_packages).replace(os.sep, "/")
+        records.append([relative_path, utils.record_hash(data), str(len(data))])
+
+    try:
+        with zipfile.ZipFile(wheel_path) as wheel:
+            members = [info for info in wheel.infolist() if not info.is_dir()]
+            dist_info_name = next(
+                (info.filename.split("/")[0] for info in members if info.filename.endswith(".dist-info/WHEEL")),
+                None
+            )
+            if dist_info_name is None:
+                return None, f"{os.path.basename(wheel_path)} has no .dist-info/WHEEL."
+            data_dir_name = dist_info_name[:-len(".dist-info")] + ".data"
+            python_version = ".".join((scanner.read_python_version(env_path) or "").split(".")[:2])
+            targets = {
+                "purelib": site_packages,
+                "platlib": site_packages,
+                "scripts": scripts_dir,
+                "headers": os.path.join(env_path, "include", "site", f"python{python_version}", project),
+                "data": env_path,
+            }
+
+            entry_points = []
+            for info in members:
+                name = info.filename
+                if name in (f"{dist_info_name}/RECORD", f"{dist_info_name}/INSTALLER"):
+                    continue
+                data = wheel.read(info)
+                mode = (info.external_attr >> 16) & 0o777
+                if name.startswith(data_dir_name + "/"):
+                    _, scheme, member = name.split("/", 2)
+                    if scheme not in targets:
+                        return None, f"{os.path.basename(wheel_path)} uses an unknown data scheme '{scheme}'."
+                    path = _safe_join(targets[scheme], member)
+                    if scheme == "scripts":
+                        if data.startswith(b"#!python"):
+                            data = b"#!" + python_executable.encode(sys.getfilesystemencoding()) + data[len(b"#!python"):]
+                        mode = 0o755
+                else:
+                    path = _safe_join(site_packages, name)
+                if name == f"{dist_info_name}/entry_points.txt":
+                    entry_points = _read_entry_points(data)
+                _write_file(path, data, mode if mode & 0o111 else None)
+                record(path, data)
+    except (OSError, ValueError, zipfile.BadZipFile, configparser.Error) as e:
+        return None, f"Could not install {os.path.basename(wheel_path)}: {e}"
+
+    for script_name, target in entry_points:
+        module, _, attr = target.partition(":")
+        import_name = attr.split(".")[0]
+        data = SCRIPT_TEMPLATE.format(python=python_executable, module=module.strip(), import_name=import_name, call=attr.strip()).encode("utf-8")
+        path = os.path.join(scripts_dir, script_name)
+        _write_file(path, data, 0o755)
+        record(path, data)
+
+    dist_info_path = os.path.join(site_packages, dist_info_name)
+    installer_data = (INSTALLER_NAME + "\n").encode("utf-8")
+    _write_file(os.path.join(dist_info_path, "INSTALLER"), installer_data)
+    record(os.path.join(dist_info_path, "INSTALLER"), installer_data)
+    records.append([f"{dist_info_name}/RECORD", "", ""])
+    content = io.StringIO()
+    csv.writer(content, lineterminator="\n").writerows(records)
+    _write_file(os.path.join(dist_info_path, "RECORD"), content.getvalue().encode("utf-8"))
+    return dist_info_path, None
+
+def _recorded_paths(dist_info_path):
+    """Returns the absolute paths of the files listed in a distribution's RECORD."""
+    site_packages = os.path.dirname(dist_info_path)
+    try:
+        with open(os.path.join(dist_info_path, "RECORD"), 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+    except OSError:
+        return []
+    return [os.path.normpath(os.path.join(site_packages, row[0])) for row in rows if row and row[0]]
+
+def remove_distribution(dist_info_path, keep=()):
+    """
+    Deletes every file listed in an installed distribution's RECORD, then
+    its dist-info. Paths in `keep` (e.g. files a newer version of the same
+    distribution has just written) are left alone.
+    """
+    site_packages = os.path.dirname(dist_info_path)
+    directories = set()
+    for path in _recorded_paths(dist_info_path):
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        directories.add(os.path.dirname(path))
+        cache_dir = os.path.join(os.path.dirname(path), "__pycache__")
+        if path.endswith(".py") and os.path.isdir(cache_dir):
+            stem = os.path.splitext(os.path.basename(path))[0] + "."
+            for cached in os.listdir(cache_dir):
+                if cached.startswith(stem):
+                    os.remove(os.path.join(cache_dir, cached))
+    shutil.rmtree(dist_info_path, ignore_errors=True)
+    # Drop directories left empty, deepest first
+    for directory in sorted(directories, key=len, reverse=True):
+        for candidate in (os.path.join(directory, "__pycache__"), directory):
+            try:
+                if candidate.startswith(site_packages + os.sep):
+                    os.rmdir(candidate)
+            except OSError:
+                pass
+
+def list_installed(env_path):
+    """Maps the canonical name of every dist-info distribution in an environment to (version, dist_info_path)."""
+    installed = {}
+    for dist_info_path in wheelhouse.list_distributions(env_path):
+        name, version = scanner.read_distribution(dist_info_path)
+        if name:
+            installed[canonicalize_name(name)] = (version, dist_info_path)
+    return installed
+
+def uninstall(env_path, names):
+    """
+    Removes distributions from an environment. dist-info installs are
+    deleted through their RECORD; anything else (e.g. egg-info), and pip,
+    setuptools and wheel, go through pip. Returns an error message or None.
+    """
+    installed = list_installed(env_path)
+    via_pip = []
+    for name in names:
+        current = installed.get(canonicalize_name(name))
+        if current and canonicalize_name(name) not in cloner.KEEP_PACKAGES:
+            remove_distribution(current[1])
+        else:
+            via_pip.append(name)
+    if via_pip:
+        try:
+            subprocess.run(
+                [scanner.get_python_executable(env_path), "-m", "pip", "uninstall", "-y"] + via_pip,
+                check=True,
+                capture_output=True,
+                text=True
+            )
+        except subprocess.CalledProcessError as e:
+            return f"pip could not uninstall {', '.join(via_pip)}: {e.stderr}"
+    return None
+
+def _matches_hash(wheel_path, expected_hash):
+    """Checks a wheel against its 'sha256:<hex>' lock hash; wheels without one always match."""
+    return not expected_hash or "sha256:" + (utils.hash_file(wheel_path) or "") == expected_hash
+
+def _pip_install_pins(env_path, pins, hashes, offline):
+    """
+    Installs {name: version} pins with pip and --no-deps. When every pin
+    has a lock hash, they go through a temporary requirements file with
+    --require-hashes.
+    """
+    command = [scanner.get_python_executable(env_path), "-m", "pip", "install", "--no-deps"]
+    command += wheelhouse.get_pip_install_options(offline)
+    if not hashes or not all(name in hashes for name in pins):
+        subprocess.run(command + [f"{name}=={version}" for name, version in pins.items()], check=True, capture_output=True, text=True)
+        return
+
+    # Hashes can only be given per requirement inside a requirements file
+    fd, requirements_path = tempfile.mkstemp(prefix="envpilot-", suffix=".txt")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for name, version in pins.items():
+                f.write(f"{name}=={version} --hash={hashes[name]}\n")
+        subprocess.run(command + ["--require-hashes", "-r", requirements_path], check=True, capture_output=True, text=True)
+    finally:
+        os.remove(requirements_path)
+
+def install_pinned(env_path, packages, wheel_dirs=None, offline=False, jobs=None, hashes=None):
+    """
+    Installs an exactly pinned {name: version} set without running a resolver.
+
+    Distributions already installed at the pinned version are kept. Every
+    other pin with a compatible wheel in `wheel_dirs` (default: the local
+    wheelhouse) is unpacked directly, on a pool of `jobs` threads, and the
+    version it replaces is removed only once the new one is in place. The
+    remaining pins are handed to pip, with --no-deps since the lock already
+    lists every dependency, and pip replaces older versions itself. pip,
+    setuptools and wheel always go through pip, so the environment never
+    loses the tools pip runs on.
+
+    `hashes` maps names to 'sha256:<hex>' wheel hashes from the lock; local
+    wheels that do not match are skipped and their pins left to pip, which
+    runs with --require-hashes.
+    Returns (direct_installs, pip_installs, error).
+    """
+    hashes = hashes or {}
+    installed = list_installed(env_path)
+    pending = {}
+    for name, version in packages.items():
+        current = installed.get(canonicalize_name(name))
+        if not current or current[0] != version:
+            pending[name] = version
+
+    direct = {}
+    if is_supported():
+        index = index_wheels(wheel_dirs or [wheelhouse.get_wheelhouse_dir()])
+        supported_tags = get_supported_tags(env_path)
+        for name, version in pending.items():
+            if canonicalize_name(name) in cloner.KEEP_PACKAGES:
+                continue
+            wheel_path = find_wheel(index, name, version, supported_tags)
+            if wheel_path and _matches_hash(wheel_path, hashes.get(name)):
+                direct[name] = wheel_path
+
+    def replace(name):
+        dist_info_path, error = install_wheel(direct[name], env_path)
+        if error:
+            return error
+        current = installed.get(canonicalize_name(name))
+        if current and current[1] != dist_info_path:
+            # Files the new version wrote over keep their place
+            remove_distribution(current[1], keep=set(_recorded_paths(dist_info_path)))
+        return None
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=jobs or scanner.get_default_jobs()) as executor:
+        for error in executor.map(replace, direct):
+            if error:
+                errors.append(error)
+    if errors:
+        return sorted(direct), [], "\n".join(errors)
+
+    remaining = {name: version for name, version in pending.items() if name not in direct}
+    if remaining:
+        try:
+            _pip_install_pins(env_path, remaining, hashes, offline)
+        except subprocess.CalledProcessError as e:
+            return sorted(direct), [], f"pip could not install {len(remaining)} packages: {e.stderr}"
+    return sorted(direct), sorted(remaining), None
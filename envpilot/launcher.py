@@ -0,0 +1,42 @@
+import sys
+
+# Commands taking a single argument that are answered without loading
+# click, rich or discovery, for shell hooks and shell startup files
+FAST_COMMANDS = ("activate", "resolve", "hook")
+
+def run_fast_command(command, name):
+    """Runs `activate NAME`, `resolve NAME` or `hook SHELL` and returns the exit code."""
+    from . import resolver
+    if command == "hook":
+        from . import projects
+        script = projects.render_hook(name)
+        if script:
+            sys.stdout.write(script)
+        error = None if script else f"Unsupported shell '{name}'; use one of: {', '.join(projects.SUPPORTED_SHELLS)}."
+    elif command == "activate":
+        error = resolver.launch_shell(name)
+    else:
+        env_path, error = resolver.resolve_environment(name)
+        if env_path:
+            sys.stdout.write(env_path + "\n")
+    if error:
+        sys.stderr.write(f"Error: {error}\n")
+        return 1
+    return 0
+
+def main(argv=None):
+    """
+    Entry point of the `envpilot` command. `activate NAME`, `resolve NAME`
+    and `hook SHELL` take a fast path; everything else, including their
+    --help, goes to the click CLI, which imports what each command needs
+    when it runs.
+    """
+    args = sys.argv[1:] if argv is None else list(argv)
+    if len(args) == 2 and args[0] in FAST_COMMANDS and not args[1].startswith("-"):
+        sys.exit(run_fast_command(args[0], args[1]))
+
+    from .cli import cli
+    cli(args=argv)
+
+if __name__ == "__main__":
+    main()
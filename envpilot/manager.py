@@ -2,18 +2,52 @@ import os
 import subprocess
 import sys
 import venv
-from . import scanner
+from . import metadata
+from . import resolver
+from . import cloner
+from . import wheelhouse
 
-def create_environment(name, requirements_path=None, base_path=None):
-    """
-    Creates a new virtual environment and optionally installs packages.
-    """
+def get_new_environment_path(name, base_path=None):
+    """Returns where a new environment called `name` is created."""
     # Default to the current working directory if no base_path is provided
     if base_path:
         os.makedirs(base_path, exist_ok=True)
-        env_path = os.path.join(base_path, name)
+        return os.path.join(base_path, name)
+    return os.path.join(os.getcwd(), name)
+
+def install_requirements(env_path, requirements_path, offline=False):
+    """
+    Installs a requirements file into an environment with pip, using the
+    local wheelhouse, and adds the new distributions to the wheelhouse
+    once it exists. Raises CalledProcessError if pip fails.
+    """
+    if sys.platform == "win32":
+        pip_executable = os.path.join(env_path, "Scripts", "pip.exe")
     else:
-        env_path = os.path.join(os.getcwd(), name)
+        pip_executable = os.path.join(env_path, "bin", "pip")
+
+    subprocess.run(
+        [pip_executable, "install", "-r", requirements_path] + wheelhouse.get_pip_install_options(offline),
+        check=True,
+        capture_output=True,
+        text=True
+    )
+    if os.path.isdir(wheelhouse.get_wheelhouse_dir()):
+        try:
+            wheelhouse.collect_wheels([env_path])
+        except Exception:
+            # The wheelhouse is only a cache; failing to fill it does not fail the install
+            pass
+
+def create_environment(name, requirements_path=None, base_path=None, offline=False, register=True):
+    """
+    Creates a new virtual environment and optionally installs packages.
+    Packages are also looked up in the local wheelhouse; with `offline`,
+    only there. Once a wheelhouse exists, newly installed distributions
+    are added to it. With `register=False`, the caller registers the
+    environment itself (e.g. once for a batch created on worker threads).
+    """
+    env_path = get_new_environment_path(name, base_path)
 
     if os.path.exists(env_path):
         return None, f"An environment already exists at '{env_path}'."
@@ -22,20 +56,12 @@ def create_environment(name, requirements_path=None, base_path=None):
         # Create the virtual environment
         builder = venv.EnvBuilder(with_pip=True)
         builder.create(env_path)
+        if register:
+            metadata.register_environment(env_path)
 
         # Install packages if a requirements file is provided
         if requirements_path:
-            if sys.platform == "win32":
-                pip_executable = os.path.join(env_path, "Scripts", "pip.exe")
-            else:
-                pip_executable = os.path.join(env_path, "bin", "pip")
-            
-            subprocess.run(
-                [pip_executable, "install", "-r", requirements_path],
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            install_requirements(env_path, requirements_path, offline)
         
         return env_path, None
     except subprocess.CalledProcessError as e:
@@ -45,40 +71,62 @@ def create_environment(name, requirements_path=None, base_path=None):
     except Exception as e:
         return None, f"Failed to create environment: {e}"
 
-def launch_shell(name):
+def create_from_best_match(name, requirements_path, base_path=None, offline=False, **scan_options):
     """
-    Launches a new sub-shell with the specified environment activated.
+    Creates an environment by cloning the existing environment that best
+    matches a requirements file, then installing and uninstalling only the
+    packages that differ.
+
+    Files are cloned with reflinks or hardlinks where the filesystem allows,
+    so the new environment costs roughly the size of the difference. Falls
+    back to a fresh environment when nothing matches at all.
+    Returns (summary, error); summary holds the new 'env_path', the 'source'
+    environment (or None), its 'match_percentage', the 'link_mode' used and
+    the 'installed' and 'removed' package names.
     """
-    env_path = scanner.find_environment_path(name)
+    from . import matcher
+    required_packages, options, error = matcher.read_requirements(requirements_path)
+    if error or not required_packages:
+        return None, error or "Could not parse requirements file or file is empty."
+
+    env_path = get_new_environment_path(name, base_path)
+    if os.path.exists(env_path):
+        return None, f"An environment already exists at '{env_path}'."
 
-    if not env_path:
-        return f"Environment '{name}' not found."
+    matches, error = matcher.find_best_matches(requirements_path, top=1, **scan_options)
+    if error:
+        return None, error
+    if not matches or matches[0]["match_percentage"] == 0:
+        env_path, error = create_environment(name, requirements_path, base_path, offline)
+        summary = {"env_path": env_path, "source": None, "match_percentage": 0.0, "link_mode": None, "installed": [], "removed": []}
+        return (summary if env_path else None), error
 
-    try:
-        if sys.platform == "win32":
-            # For Windows, launch PowerShell with the activation script
-            script_path = os.path.join(env_path, "Scripts", "Activate.ps1")
-            if not os.path.exists(script_path):
-                 return f"Activation script not found at {script_path}"
-            
-            print(f"Launching activated shell for '{name}'. Type 'exit' to leave.")
-            subprocess.run(
-                ["powershell", "-NoExit", "-Command", f"& '{script_path}'"],
-                check=True
-            )
-        else:
-            # For Unix-like systems (Linux, macOS)
-            shell = os.environ.get("SHELL", "/bin/bash")
-            script_path = os.path.join(env_path, "bin", "activate")
-            if not os.path.exists(script_path):
-                return f"Activation script not found at {script_path}"
-            
-            print(f"Launching activated shell for '{name}'. Type 'exit' to leave.")
-            # We use execve to replace the current process with the new shell
-            # This is a common way to give the user a fully interactive sub-shell
-            os.execve(shell, [shell, "--rcfile", script_path], os.environ)
+    best_match = matches[0]
+    link_mode, error = cloner.clone_environment(best_match["env"]["path"], env_path)
+    if error:
+        return None, error
+    metadata.register_environment(env_path)
+    metadata.record_use([best_match["env"]["path"], env_path])
 
+    summary = {
+        "env_path": env_path,
+        "source": best_match["env"]["path"],
+        "match_percentage": best_match["match_percentage"],
+        "link_mode": link_mode,
+        "installed": [],
+        "removed": [],
+    }
+    try:
+        summary["installed"], summary["removed"] = cloner.reconcile_environment(env_path, requirements_path, required_packages, offline, options)
+    except subprocess.CalledProcessError as e:
+        return summary, f"Environment cloned but updating its packages failed: {e.stderr}"
     except Exception as e:
-        return f"Failed to launch shell: {e}"
-    
-    return None # Should not be reached on success for Unix 
\ No newline at end of file
+        return summary, f"Environment cloned but updating its packages failed: {e}"
+    return summary, None
+
+def launch_shell(name):
+    """
+    Launches a new sub-shell with the specified environment activated.
+    See `resolver.launch_shell`, which `activate` calls without loading this module.
+    """
+    return resolver.launch_shell(name)
@@ -1,26 +1,147 @@
 import os
+import re
 import sys
+import json
+import heapq
+from functools import lru_cache
 from packaging.requirements import Requirement
+from packaging.specifiers import SpecifierSet
 from packaging.version import Version, InvalidVersion
+from packaging.utils import canonicalize_name
 from . import scanner
 
+# Parsing results are shared between all requirements files and environments
+# matched in one process, since the same lines and versions recur constantly.
+PARSE_CACHE_SIZE = 65536
+
+# Options naming another requirements file, mapped to their short form
+FILE_OPTIONS = {"-r": "-r", "--requirement": "-r", "-c": "-c", "--constraint": "-c"}
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_requirement_line(line):
+    """Parses one requirements line, returning None if it is not a valid requirement."""
+    try:
+        return Requirement(line)
+    except Exception:
+        return None
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_version(version_str):
+    """Parses a version string, returning None if it is not a valid version."""
+    try:
+        return Version(version_str)
+    except InvalidVersion:
+        return None
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_specifier(specifier_str):
+    return SpecifierSet(specifier_str)
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def specifier_contains(specifier_str, version_str):
+    """
+    Checks an installed version string against a specifier string.
+    Returns None if the version cannot be parsed.
+    """
+    version = parse_version(version_str)
+    if version is None:
+        return None
+    return _parse_specifier(specifier_str).contains(version, prereleases=True)
+
+def normalize_requirements(required_packages):
+    """
+    Turns parsed requirements into a sorted list of canonical strings, so
+    that files differing only in order, case, spacing or comments agree.
+    """
+    normalized = set()
+    for req in required_packages:
+        text = canonicalize_name(req.name)
+        if req.extras:
+            text += "[" + ",".join(sorted(canonicalize_name(extra) for extra in req.extras)) + "]"
+        if req.url:
+            text += " @ " + req.url
+        elif req.specifier:
+            text += ",".join(sorted(str(spec) for spec in req.specifier))
+        if req.marker:
+            text += "; " + str(req.marker)
+        normalized.add(text)
+    return sorted(normalized)
+
+def _split_file_option(line):
+    """Splits '-r FILE', '-rFILE' or '--requirement=FILE' into ('-r', FILE); returns (None, None) for other lines."""
+    for option, flag in FILE_OPTIONS.items():
+        if not line.startswith(option):
+            continue
+        value = line[len(option):]
+        if option.startswith("--") and value[:1] not in ("=", " ", "\t"):
+            continue
+        return flag, value.lstrip("= \t")
+    return None, None
+
+def read_requirements(requirements_path, _seen=None):
+    """
+    Reads a requirements file for keying, the way pip will install it:
+    nested -r files are merged in, -c files are read as constraints, and
+    every other line that is not a plain requirement (--index-url, -e,
+    --hash, ...) is kept verbatim, so none of them can be silently ignored.
+    Returns (required_packages, options, error).
+    """
+    requirements_path = os.path.abspath(requirements_path)
+    seen = set(_seen or ())
+    if requirements_path in seen:
+        return [], [], None
+    seen.add(requirements_path)
+    try:
+        with open(requirements_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError as e:
+        return None, None, f"Could not read {requirements_path}: {e}"
+
+    required_packages = []
+    options = []
+    # As pip does: join continuation lines, then drop comments
+    for line in text.replace("\\\n", "").splitlines():
+        line = re.sub(r"(^|\s+)#.*$", "", line).strip()
+        if not line:
+            continue
+        flag, nested_path = _split_file_option(line)
+        if flag and "://" in nested_path:
+            # pip fetches remote files; only their URL can be keyed
+            options.append(f"{flag} {nested_path}")
+        elif flag:
+            nested_path = os.path.join(os.path.dirname(requirements_path), os.path.expanduser(nested_path))
+            nested_packages, nested_options, error = read_requirements(nested_path, seen)
+            if error:
+                return None, None, error
+            if flag == "-r":
+                required_packages.extend(nested_packages)
+                options.extend(nested_options)
+            else:
+                options.append("-c " + json.dumps([normalize_requirements(nested_packages), sorted(nested_options)]))
+            continue
+        req = parse_requirement_line(line)
+        if req is None and " --" in line:
+            # Per-requirement options such as --hash follow the requirement;
+            # the whole line is kept as an option too, as they change the install
+            req = parse_requirement_line(line.split(" --", 1)[0].strip())
+            if req is not None:
+                required_packages.append(req)
+            options.append(" ".join(line.split()))
+        elif req is not None:
+            required_packages.append(req)
+        else:
+            options.append(" ".join(line.split()))
+    return required_packages, options, None
+
 def parse_requirements(file_path):
-    """Parses a requirements.txt file into a list of Requirement objects."""
-    if not os.path.exists(file_path):
+    """
+    Parses a requirements.txt file into a list of Requirement objects,
+    including those of nested -r files (see `read_requirements`).
+    """
+    required_packages, _, error = read_requirements(file_path)
+    if error:
         return []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    reqs = []
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('#'):
-            try:
-                reqs.append(Requirement(line))
-            except Exception:
-                # Ignore invalid requirement lines for now
-                pass
-    return reqs
+    return required_packages
 
 def calculate_match(required_packages, installed_packages):
     """
@@ -59,46 +180,239 @@ def calculate_match(required_packages, installed_packages):
 
     return (match_percentage, missing_packages_specs, extra_packages_count)
 
-def find_best_matches(requirements_path, env_name=None):
+def build_package_index(environments):
     """
-    Finds and ranks environments based on a requirements file.
-    If env_name is provided, only that environment is checked.
+    Builds an inverted index from package name to the environments that have it.
+    Returns {name: [(env_position, version), ...]}, where env_position indexes
+    into `environments` and each environment record carries a 'packages' map.
     """
-    required_packages = parse_requirements(requirements_path)
-    if not required_packages:
-        return None, "Could not parse requirements file or file is empty."
+    package_index = {}
+    for position, env in enumerate(environments):
+        for name, version in env["packages"].items():
+            package_index.setdefault(name.lower(), []).append((position, version))
+    return package_index
 
-    search_path = os.path.expanduser("~")
-    all_environments = scanner.discover_environments(search_path)
-    
-    environments_to_check = []
-    if env_name:
-        found_env = next((env for env in all_environments if env['name'] == env_name), None)
-        if not found_env:
-            return None, f"Environment '{env_name}' not found."
-        environments_to_check.append(found_env)
-    else:
-        environments_to_check = all_environments
+def _missing_packages(requirement_info, installed_packages):
+    """
+    Lists an environment's missing or mismatched requirements in requirements-file order.
+    `requirement_info` holds (name, lower_name, specifier_str, requirement_str) per requirement.
+    """
+    installed_map = {name.lower(): version for name, version in installed_packages.items()}
+    missing = []
+    for name, lower_name, specifier_str, requirement_str in requirement_info:
+        installed_version_str = installed_map.get(lower_name)
+        if installed_version_str is None:
+            missing.append(requirement_str)
+        elif specifier_contains(specifier_str, installed_version_str) is False:
+            installed_version = parse_version(installed_version_str)
+            missing.append(f"{name} (found {installed_version}, need {specifier_str})")
+    return missing
 
-    matches = []
-    for env in environments_to_check:
-        installed_packages = scanner.get_installed_packages(env["python_executable"])
-        # No need to check environments with no packages installed.
-        if not installed_packages and not required_packages:
-            continue
+def _get_numpy():
+    """Imports NumPy on first use, returning None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
 
-        match_percentage, missing, extra = calculate_match(required_packages, installed_packages)
-        
+def _score_python(required_packages, environments, package_index):
+    """Scores all environments with plain Python loops over the inverted index."""
+    matched = [0] * len(environments)
+    for req in required_packages:
+        specifier_str = str(req.specifier)
+        for env_position, installed_version_str in package_index.get(req.name.lower(), ()):
+            # If version is not parsable (e.g., from a VCS url), we can't check specifiers.
+            # A simple check for existence is the best we can do.
+            if specifier_contains(specifier_str, installed_version_str) is not False:
+                matched[env_position] += 1
+
+    # Count the installed packages that are also required, to derive the extras
+    installed_required = [0] * len(environments)
+    for name in {req.name.lower() for req in required_packages}:
+        for env_position, _ in package_index.get(name, ()):
+            installed_required[env_position] += 1
+
+    percentages, extras, scores = [], [], []
+    for env_position, env in enumerate(environments):
+        match_percentage = (matched[env_position] / len(required_packages)) * 100
+        extra = len(env["packages"]) - installed_required[env_position]
+        percentages.append(match_percentage)
+        extras.append(extra)
         # Scoring: higher percentage is better, fewer extra packages is a tie-breaker.
-        score = match_percentage - (extra * 0.1)
+        scores.append(match_percentage - (extra * 0.1))
+    return percentages, extras, scores
 
+# The most recent package index converted to NumPy arrays, as (package_index, arrays).
+# Batch matching scores many requirements files against the same index.
+_vector_index_cache = [None]
+
+def _get_vector_index(np, package_index):
+    """
+    Converts each posting list of the inverted index into arrays of environment
+    positions and version codes (indices into that package's distinct versions).
+    """
+    cached = _vector_index_cache[0]
+    if cached is not None and cached[0] is package_index:
+        return cached[1]
+    arrays = {}
+    for name, postings in package_index.items():
+        distinct_versions = {}
+        codes = [distinct_versions.setdefault(version, len(distinct_versions)) for _, version in postings]
+        arrays[name] = (
+            np.array([position for position, _ in postings], dtype=np.intp),
+            np.array(codes, dtype=np.intp),
+            list(distinct_versions),
+        )
+    _vector_index_cache[0] = (package_index, arrays)
+    return arrays
+
+def _score_numpy(np, required_packages, environments, package_index):
+    """
+    Scores all environments at once with boolean matrix operations.
+
+    Each specifier is evaluated once per distinct installed version of its
+    package; the results are scattered into an environments x requirements
+    'satisfied' matrix whose row sums give the matched counts.
+    """
+    vector_index = _get_vector_index(np, package_index)
+    satisfied = np.zeros((len(environments), len(required_packages)), dtype=bool)
+    for column, req in enumerate(required_packages):
+        entry = vector_index.get(req.name.lower())
+        if entry is None:
+            continue
+        env_positions, codes, distinct_versions = entry
+        specifier_str = str(req.specifier)
+        version_ok = np.array([specifier_contains(specifier_str, version) is not False for version in distinct_versions], dtype=bool)
+        satisfied[env_positions, column] = version_ok[codes]
+
+    installed_required = np.zeros(len(environments), dtype=np.int64)
+    for name in {req.name.lower() for req in required_packages}:
+        entry = vector_index.get(name)
+        if entry is not None:
+            installed_required[entry[0]] += 1
+
+    package_counts = np.array([len(env["packages"]) for env in environments], dtype=np.int64)
+    # Same operation order as the Python engine, so results are bit-for-bit equal
+    percentages = (satisfied.sum(axis=1) / len(required_packages)) * 100
+    extras = package_counts - installed_required
+    scores = percentages - (extras * 0.1)
+    return percentages.tolist(), extras.tolist(), scores.tolist()
+
+# Below this many environment x requirement pairs NumPy's overhead isn't worth it
+VECTORIZE_THRESHOLD = 20000
+
+def score_environments(required_packages, environments, package_index=None, engine="auto"):
+    """
+    Computes (match_percentages, extra_counts, scores) for every environment.
+
+    `engine` is 'python', 'numpy' or 'auto', which uses NumPy for large
+    inputs when it is installed. Both engines give identical results. The
+    NumPy engine converts the index to arrays on first use (about the cost
+    of one Python pass) and is much faster for every later call.
+    """
+    if package_index is None:
+        package_index = build_package_index(environments)
+    if not required_packages:
+        extras = [len(env["packages"]) for env in environments]
+        return [100.0] * len(environments), extras, [100.0 - (extra * 0.1) for extra in extras]
+
+    np = None
+    if engine == "numpy" or (engine == "auto" and len(environments) * len(required_packages) >= VECTORIZE_THRESHOLD):
+        np = _get_numpy()
+        if np is None and engine == "numpy":
+            raise ImportError("The 'numpy' scoring engine requires NumPy (pip install envpilot[fast]).")
+    if np is not None:
+        return _score_numpy(np, required_packages, environments, package_index)
+    return _score_python(required_packages, environments, package_index)
+
+def rank_environments(required_packages, environments, package_index=None, top=None, engine="auto"):
+    """
+    Scores every environment against the requirements in a single pass.
+
+    Instead of checking each environment against each requirement, every
+    requirement looks up the environments that have the package in the
+    inverted index, so the work grows with the requirements and the postings
+    rather than with environments x requirements. Results match
+    `calculate_match` and are ordered best first; `top` limits how many
+    are returned (and how many missing-package lists are built).
+    """
+    percentages, extras, scores = score_environments(required_packages, environments, package_index, engine)
+
+    positions = range(len(environments))
+    if top is None:
+        ranked = sorted(positions, key=lambda p: scores[p], reverse=True)
+    else:
+        ranked = heapq.nlargest(top, positions, key=lambda p: scores[p])
+
+    # Stringify each requirement once rather than once per environment
+    requirement_info = [(req.name, req.name.lower(), str(req.specifier), str(req)) for req in required_packages]
+    matches = []
+    for env_position in ranked:
+        env = environments[env_position]
         matches.append({
             "env": env,
-            "match_percentage": match_percentage,
-            "missing_packages": missing,
-            "extra_packages_count": extra,
-            "score": score,
+            "match_percentage": percentages[env_position],
+            "missing_packages": _missing_packages(requirement_info, env["packages"]),
+            "extra_packages_count": extras[env_position],
+            "score": scores[env_position],
         })
-            
-    matches.sort(key=lambda x: x['score'], reverse=True)
-    return matches, None 
\ No newline at end of file
+    return matches
+
+def load_environments_for_matching(env_name=None, **scan_options):
+    """
+    Loads the environments to match against, with their installed packages.
+    If env_name is provided, only that environment is loaded.
+    Returns (environments, error).
+    """
+    search_path = os.path.expanduser("~")
+    if not env_name:
+        return scanner.discover_environments(search_path, fields={"packages"}, **scan_options), None
+
+    # Only resolve names here; just the chosen environment gets probed
+    all_environments = scanner.discover_environments(search_path, fields={"path"}, **scan_options)
+    found_env = next((env for env in all_environments if env['name'] == env_name), None)
+    if not found_env:
+        return None, f"Environment '{env_name}' not found."
+    use_cache = scan_options.get("use_cache", True)
+    refresh = scan_options.get("refresh", False)
+    env = scanner.get_environment(found_env["path"], {"packages"}, use_cache=use_cache, refresh=refresh)
+    if env is None:
+        # Removed or broken since discovery listed it
+        return None, f"Environment '{env_name}' not found."
+    return [env], None
+
+def match_requirement_files(requirements_paths, environments, top=None):
+    """
+    Ranks the same set of environments against several requirements files.
+
+    The inverted package index is built once and requirement, version and
+    specifier parsing is memoized across files. Yields
+    (requirements_path, matches, error) for each file as soon as it is scored.
+    """
+    package_index = build_package_index(environments)
+    # The NumPy engine pays a one-off conversion of the index, which only
+    # pays off when several files are scored against it
+    engine = "auto" if len(requirements_paths) > 1 else "python"
+    for requirements_path in requirements_paths:
+        required_packages = parse_requirements(requirements_path)
+        if not required_packages:
+            yield requirements_path, None, "Could not parse requirements file or file is empty."
+            continue
+        yield requirements_path, rank_environments(required_packages, environments, package_index, top, engine), None
+
+def find_best_matches(requirements_path, env_name=None, top=None, **scan_options):
+    """
+    Finds and ranks environments based on a requirements file.
+    If env_name is provided, only that environment is checked.
+    `top` limits the result to the N best matches.
+    Extra keyword arguments are passed on to `scanner.discover_environments`.
+    """
+    required_packages = parse_requirements(requirements_path)
+    if not required_packages:
+        return None, "Could not parse requirements file or file is empty."
+
+    environments, error = load_environments_for_matching(env_name, **scan_options)
+    if error:
+        return None, error
+    return rank_environments(required_packages, environments, top=top), None
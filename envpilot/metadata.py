@@ -0,0 +1,233 @@
+import os
+import json
+import time
+
+INDEX_VERSION = 2
+
+# Seconds to wait for another process updating the registry before writing
+# anyway, and between attempts; updates hold the lock for milliseconds
+REGISTRY_LOCK_TIMEOUT = 10
+REGISTRY_LOCK_POLL = 0.01
+
+def get_cache_dir():
+    """Returns the directory where envpilot keeps its on-disk caches."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "envpilot")
+
+def read_json(path, default=None):
+    """Reads a JSON file, returning `default` if it is missing or unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def write_text(path, text):
+    """
+    Atomically writes `text` to `path`.
+    The content is written to a temporary file in the same directory and then
+    renamed over the target, so concurrent readers never see a partial file.
+    """
+    # Imported here: `activate` and `resolve` read metadata but rarely write it
+    import tempfile
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def write_json(path, data):
+    """Atomically writes `data` as JSON to `path`; see `write_text`."""
+    write_text(path, json.dumps(data))
+
+def get_index_path():
+    """Returns the path of the environment index file."""
+    return os.path.join(get_cache_dir(), "index.json")
+
+def load_index():
+    """
+    Loads the environment index.
+    The index maps each environment path to its pyvenv.cfg path, the mtimes
+    recorded when it was last probed and the probed record. It also remembers
+    which environments were found under each scanned search root.
+    """
+    index = read_json(get_index_path())
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return {"version": INDEX_VERSION, "roots": {}, "environments": {}}
+    index.setdefault("roots", {})
+    index.setdefault("environments", {})
+    return index
+
+def save_index(index):
+    """Writes the environment index back to disk, ignoring write failures."""
+    try:
+        write_json(get_index_path(), index)
+    except OSError:
+        # A read-only or full cache directory should never break a command.
+        pass
+
+def get_registry_path():
+    """Returns the path of the name -> environment path registry."""
+    return os.path.join(get_cache_dir(), "registry.json")
+
+def load_registry():
+    """Loads the registry as a dictionary mapping names to lists of environment paths."""
+    registry = read_json(get_registry_path())
+    if not isinstance(registry, dict):
+        return {}
+    return registry
+
+def save_registry(registry):
+    """Writes the registry back to disk, ignoring write failures."""
+    try:
+        write_json(get_registry_path(), registry)
+    except OSError:
+        pass
+
+def update_registry(update):
+    """
+    Loads the registry, applies `update(registry)` and saves it if that
+    returns True. Runs under a file lock, so concurrent processes (e.g.
+    parallel `create` and `ensure` jobs) never overwrite each other's entries.
+    """
+    # Imported here: `activate` and `resolve` only read the registry
+    from . import utils
+    try:
+        lock_file = utils.acquire_lock(get_registry_path() + ".lock", REGISTRY_LOCK_TIMEOUT, REGISTRY_LOCK_POLL)
+    except OSError:
+        # e.g. a read-only cache directory, where saving fails quietly as well
+        lock_file = None
+    try:
+        registry = load_registry()
+        if update(registry):
+            save_registry(registry)
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+
+def register_environments(env_paths):
+    """Records environments in the registry under their folder names."""
+    env_paths = [os.path.abspath(env_path) for env_path in env_paths]
+
+    def add(registry):
+        changed = False
+        for env_path in env_paths:
+            paths = registry.setdefault(os.path.basename(env_path), [])
+            if env_path not in paths:
+                paths.append(env_path)
+                changed = True
+        return changed
+    if env_paths:
+        update_registry(add)
+
+def register_environment(env_path):
+    """Records a single environment in the registry."""
+    register_environments([env_path])
+
+def unregister_environments(env_paths):
+    """Removes environments from the registry."""
+    env_paths = [os.path.abspath(env_path) for env_path in env_paths]
+
+    def remove(registry):
+        changed = False
+        for env_path in env_paths:
+            name = os.path.basename(env_path)
+            if env_path in registry.get(name, []):
+                registry[name].remove(env_path)
+                if not registry[name]:
+                    del registry[name]
+                changed = True
+        return changed
+    if env_paths:
+        update_registry(remove)
+
+def lookup_environment(name):
+    """
+    Returns every registered environment path with the given name.
+    Entries are checked lazily: paths that no longer hold a pyvenv.cfg are
+    dropped from the registry as they are encountered.
+    """
+    paths = load_registry().get(name, [])
+    valid = [path for path in paths if os.path.exists(os.path.join(path, "pyvenv.cfg"))]
+    if len(valid) != len(paths):
+        def prune(registry):
+            kept = [path for path in registry.get(name, []) if os.path.exists(os.path.join(path, "pyvenv.cfg"))]
+            if kept:
+                registry[name] = kept
+            else:
+                registry.pop(name, None)
+            return True
+        update_registry(prune)
+    return valid
+
+def get_usage_path():
+    """Returns the path of the file recording when environments were last used and which are pinned."""
+    return os.path.join(get_cache_dir(), "usage.json")
+
+def load_usage():
+    """
+    Loads the usage record: 'last_used' maps environment paths to the time
+    envpilot last saw them used, 'pinned' lists environments that are never
+    evicted by `clean --budget`.
+    """
+    usage = read_json(get_usage_path())
+    if not isinstance(usage, dict):
+        return {"last_used": {}, "pinned": []}
+    usage.setdefault("last_used", {})
+    usage.setdefault("pinned", [])
+    return usage
+
+def save_usage(usage):
+    """Writes the usage record back to disk, ignoring write failures."""
+    try:
+        write_json(get_usage_path(), usage)
+    except OSError:
+        pass
+
+def record_use(env_paths, timestamp=None):
+    """Marks environments as used now (or at `timestamp`)."""
+    if not env_paths:
+        return
+    timestamp = timestamp or time.time()
+    usage = load_usage()
+    for env_path in env_paths:
+        usage["last_used"][os.path.abspath(env_path)] = timestamp
+    save_usage(usage)
+
+def set_pinned(env_paths, pinned=True):
+    """Pins environments against eviction, or unpins them. Returns the paths whose state changed."""
+    usage = load_usage()
+    changed = []
+    for env_path in env_paths:
+        env_path = os.path.abspath(env_path)
+        if pinned and env_path not in usage["pinned"]:
+            usage["pinned"].append(env_path)
+            changed.append(env_path)
+        elif not pinned and env_path in usage["pinned"]:
+            usage["pinned"].remove(env_path)
+            changed.append(env_path)
+    if changed:
+        save_usage(usage)
+    return changed
+
+def forget_usage(env_paths):
+    """Drops removed environments from the usage record."""
+    usage = load_usage()
+    changed = False
+    for env_path in env_paths:
+        env_path = os.path.abspath(env_path)
+        if usage["last_used"].pop(env_path, None) is not None:
+            changed = True
+        if env_path in usage["pinned"]:
+            usage["pinned"].remove(env_path)
+            changed = True
+    if changed:
+        save_usage(usage)
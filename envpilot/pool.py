@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import platform
+import subprocess
+import venv
+from . import scanner
+from . import metadata
+from . import cloner
+from . import manager
+from . import utils
+from . import matcher
+
+# Hex digits of the requirements hash used as an environment's folder name
+POOL_KEY_LENGTH = 16
+
+# File inside a pool environment describing what it was built from
+POOL_INFO_FILE = ".envpilot-pool.json"
+
+def get_pool_dir():
+    """Returns the directory holding the environments built by `ensure`."""
+    return os.path.join(os.path.expanduser("~"), ".envpilot-pool")
+
+def get_pool_key(required_packages, options=()):
+    """
+    Hashes normalized requirements and the file's other option lines
+    together with the interpreter the pool builds with, since the same
+    requirements resolve differently per Python version and platform.
+    """
+    key_data = {
+        "requirements": matcher.normalize_requirements(required_packages),
+        "python": [sys.implementation.name, "%d.%d" % sys.version_info[:2]],
+        "platform": [sys.platform, platform.machine()],
+    }
+    if options:
+        # Only set when present, so plain requirement files keep their keys
+        key_data["options"] = sorted(set(options))
+    encoded = json.dumps(key_data, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:POOL_KEY_LENGTH]
+
+def is_ready(env_path):
+    """
+    Checks whether a pool environment can be handed out. Its info file is
+    written last, before the build is renamed into place.
+    """
+    return os.path.isfile(os.path.join(env_path, POOL_INFO_FILE))
+
+def _build_environment(build_path, env_path, requirements_path, required_packages, options, offline):
+    """Builds a pool environment at `build_path` that is ready to be renamed to `env_path`."""
+    builder = venv.EnvBuilder(with_pip=True, prompt=os.path.basename(env_path))
+    builder.create(build_path)
+    manager.install_requirements(build_path, requirements_path, offline)
+    cloner.relocate_environment(build_path, build_path, env_path)
+    with open(os.path.join(build_path, POOL_INFO_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"requirements": matcher.normalize_requirements(required_packages), "options": sorted(set(options)), "created": time.time()}, f)
+
+def ensure_environment(requirements_path, offline=False, timeout=None):
+    """
+    Returns a pool environment with a requirements file installed, building
+    it only if no environment for the same normalized requirements and
+    options (see `matcher.read_requirements`) exists.
+
+    Concurrent callers for the same requirements serialize on a file lock:
+    the first one builds while the others wait and then reuse its result.
+    Builds happen in a scratch directory that is renamed into place only
+    when complete, so a half-built environment is never handed out and a
+    crashed build leaves nothing behind under the final name.
+    Returns (env_path, built, error).
+    """
+    required_packages, options, error = matcher.read_requirements(requirements_path)
+    if error:
+        return None, False, error
+    if not required_packages and not options:
+        return None, False, "Could not parse requirements file or file is empty."
+
+    pool_dir = get_pool_dir()
+    key = get_pool_key(required_packages, options)
+    env_path = os.path.join(pool_dir, key)
+    if is_ready(env_path):
+        metadata.record_use([env_path])
+        return env_path, False, None
+
+    lock_file = utils.acquire_lock(os.path.join(pool_dir, ".locks", key + ".lock"), timeout)
+    if lock_file is None:
+        return None, False, f"Timed out waiting for another build of {env_path}."
+    try:
+        # Another job may have finished the build while we waited
+        if is_ready(env_path):
+            metadata.record_use([env_path])
+            return env_path, False, None
+
+        building_dir = os.path.join(pool_dir, scanner.POOL_BUILD_DIR_NAME)
+        os.makedirs(building_dir, exist_ok=True)
+        # Holding the lock, any earlier build of this key is a leftover from a crash
+        for name in os.listdir(building_dir):
+            if name.startswith(key + "-"):
+                shutil.rmtree(os.path.join(building_dir, name), ignore_errors=True)
+        if os.path.exists(env_path):
+            shutil.rmtree(env_path, ignore_errors=True)
+
+        build_path = os.path.join(building_dir, f"{key}-{os.getpid()}")
+        try:
+            _build_environment(build_path, env_path, requirements_path, required_packages, options, offline)
+            os.rename(build_path, env_path)
+        except subprocess.CalledProcessError as e:
+            shutil.rmtree(build_path, ignore_errors=True)
+            return None, False, f"Package installation failed: {e.stderr}"
+        except Exception as e:
+            shutil.rmtree(build_path, ignore_errors=True)
+            return None, False, f"Failed to build {env_path}: {e}"
+    finally:
+        lock_file.close()
+
+    metadata.register_environment(env_path)
+    metadata.record_use([env_path])
+    return env_path, True, None
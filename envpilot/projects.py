@@ -0,0 +1,150 @@
+import os
+from . import metadata
+
+# File inside an environment naming the project directory it belongs to,
+# as written by virtualenvwrapper's `setvirtualenvproject`
+PROJECT_FILE = ".project"
+
+# The hook runs before every prompt, so it never starts a process: it reads
+# the project map with shell builtins, and only when the directory changed.
+# Entries are sorted longest project first, so the innermost project wins.
+# Only environments the hook activated itself are ever deactivated.
+HOOK_FUNCTION = r'''_envpilot_hook() {
+    [ "$PWD" = "${_ENVPILOT_PWD-}" ] && return
+    _ENVPILOT_PWD=$PWD
+    local project env target=
+    if [ -r {map_path} ]; then
+        while IFS=$'\t' read -r project env; do
+            case "$PWD/" in
+                "$project"/*) target=$env; break ;;
+            esac
+        done < {map_path}
+    fi
+    if [ -n "$target" ]; then
+        [ "${VIRTUAL_ENV-}" = "$target" ] && return
+        if [ -n "${_ENVPILOT_ACTIVE-}" ] && [ "${VIRTUAL_ENV-}" = "$_ENVPILOT_ACTIVE" ]; then
+            deactivate
+        fi
+        if [ -z "${VIRTUAL_ENV-}" ] && [ -f "$target/bin/activate" ]; then
+            . "$target/bin/activate"
+            _ENVPILOT_ACTIVE=$target
+        fi
+    elif [ -n "${_ENVPILOT_ACTIVE-}" ]; then
+        if [ "${VIRTUAL_ENV-}" = "$_ENVPILOT_ACTIVE" ]; then
+            deactivate
+        fi
+        unset _ENVPILOT_ACTIVE
+    fi
+}
+'''
+
+HOOK_INSTALL = {
+    "bash": r'''case ";${PROMPT_COMMAND-};" in
+    *";_envpilot_hook;"*) ;;
+    *) PROMPT_COMMAND="_envpilot_hook${PROMPT_COMMAND:+;$PROMPT_COMMAND}" ;;
+esac
+''',
+    "zsh": r'''autoload -Uz add-zsh-hook
+add-zsh-hook chpwd _envpilot_hook
+_envpilot_hook
+''',
+}
+SUPPORTED_SHELLS = tuple(HOOK_INSTALL)
+
+def get_project_map_path():
+    """Returns the tab-separated project directory -> environment map read by the shell hook."""
+    return os.path.join(metadata.get_cache_dir(), "projects.tsv")
+
+def read_project_link(env_path):
+    """Returns the project directory an environment's .project file names, or None."""
+    try:
+        with open(os.path.join(env_path, PROJECT_FILE), 'r', encoding='utf-8') as f:
+            project_dir = f.readline().strip()
+    except OSError:
+        return None
+    return os.path.abspath(os.path.expanduser(project_dir)) if project_dir else None
+
+def load_project_map():
+    """Loads the project map as {project_dir: env_path}."""
+    mapping = {}
+    try:
+        with open(get_project_map_path(), 'r', encoding='utf-8') as f:
+            for line in f:
+                project_dir, _, env_path = line.rstrip("\n").partition("\t")
+                if env_path:
+                    mapping[project_dir] = env_path
+    except OSError:
+        pass
+    return mapping
+
+def save_project_map(mapping):
+    """Writes the project map, longest project directory first."""
+    lines = [
+        f"{project_dir}\t{env_path}\n"
+        for project_dir, env_path in sorted(mapping.items(), key=lambda item: (-len(item[0]), item[0]))
+        # The shell reads one entry per line, split at the tab
+        if not any(c in project_dir + env_path for c in "\t\n")
+    ]
+    metadata.write_text(get_project_map_path(), "".join(lines))
+
+def link_project(env_path, project_dir):
+    """
+    Links an environment to a project directory: writes the environment's
+    .project file and points the project map at it. A project has one
+    environment and an environment one project, so older links of either
+    are replaced.
+    """
+    env_path = os.path.abspath(env_path)
+    project_dir = os.path.abspath(project_dir)
+    with open(os.path.join(env_path, PROJECT_FILE), 'w', encoding='utf-8') as f:
+        f.write(project_dir + "\n")
+    mapping = {project: env for project, env in load_project_map().items() if env != env_path}
+    mapping[project_dir] = env_path
+    save_project_map(mapping)
+
+def unlink_project(env_path):
+    """Removes an environment's project link. Returns the project directory it was linked to, or None."""
+    env_path = os.path.abspath(env_path)
+    project_dir = read_project_link(env_path)
+    try:
+        os.remove(os.path.join(env_path, PROJECT_FILE))
+    except OSError:
+        pass
+    forget_environments([env_path])
+    return project_dir
+
+def forget_environments(env_paths):
+    """Drops removed or unlinked environments from the project map."""
+    env_paths = {os.path.abspath(env_path) for env_path in env_paths}
+    mapping = load_project_map()
+    kept = {project: env for project, env in mapping.items() if env not in env_paths}
+    if len(kept) != len(mapping):
+        save_project_map(kept)
+
+def rebuild_project_map(env_paths):
+    """
+    Rebuilds the project map from the .project files of `env_paths`, e.g.
+    to pick up links made by other tools. Returns the new mapping.
+    """
+    mapping = {}
+    for env_path in sorted(env_paths):
+        project_dir = read_project_link(env_path)
+        if project_dir:
+            mapping[project_dir] = os.path.abspath(env_path)
+    save_project_map(mapping)
+    return mapping
+
+def find_project_environment(directory):
+    """Returns the environment of the innermost linked project containing `directory`, or None."""
+    directory = os.path.abspath(directory) + os.sep
+    for project_dir, env_path in sorted(load_project_map().items(), key=lambda item: -len(item[0])):
+        if directory.startswith(project_dir.rstrip(os.sep) + os.sep):
+            return env_path
+    return None
+
+def render_hook(shell):
+    """Returns the hook script to `eval` in `shell`, or None if the shell is not supported."""
+    import shlex
+    if shell not in HOOK_INSTALL:
+        return None
+    return HOOK_FUNCTION.replace("{map_path}", shlex.quote(get_project_map_path())) + HOOK_INSTALL[shell]
@@ -0,0 +1,89 @@
+import os
+import sys
+from . import metadata
+
+# This module backs `activate` and `resolve`, which shell hooks may run on
+# every prompt; it must stay cheap to import. Discovery is loaded only when
+# a name cannot be resolved from a running daemon or the registry.
+
+def find_known_environment_paths(name):
+    """
+    Finds environments matching `name` without scanning: a path relative
+    to the current directory, a running `envpilot daemon`, the registry and
+    the old default creation directory, in that order.
+    """
+    # 1. Check if the name is a path to an env in the current directory
+    potential_path = os.path.join(os.getcwd(), name)
+    if os.path.exists(os.path.join(potential_path, "pyvenv.cfg")):
+        return [os.path.abspath(potential_path)]
+
+    # 2. Ask the daemon, whose view of the watched roots is always current
+    from . import daemon_client
+    response = daemon_client.query({"op": "resolve", "name": name})
+    if response is not None and response.get("paths"):
+        return response["paths"]
+
+    # 3. Check the registry kept up to date by create/import/clean
+    candidates = metadata.lookup_environment(name)
+
+    # 4. Check the old default creation directory
+    legacy_path = os.path.join(os.path.expanduser("~"), ".envpilot-envs", name)
+    if os.path.exists(os.path.join(legacy_path, "pyvenv.cfg")) and legacy_path not in candidates:
+        candidates.append(legacy_path)
+    return candidates
+
+def resolve_environment(name):
+    """
+    Resolves `name` to a single environment path, falling back to discovery.
+    Returns (env_path, error); an ambiguous name is an error listing the candidates.
+    """
+    env_paths = find_known_environment_paths(name)
+    if not env_paths:
+        from . import scanner
+        env_paths = scanner.find_environment_paths(name)
+
+    if not env_paths:
+        return None, f"Environment '{name}' not found."
+    if len(env_paths) > 1:
+        candidates = "\n".join(f"  - {path}" for path in env_paths)
+        return None, f"Environment name '{name}' is ambiguous; activate one of these by path:\n{candidates}"
+    return env_paths[0], None
+
+def launch_shell(name):
+    """
+    Launches a new sub-shell with the specified environment activated.
+    """
+    env_path, error = resolve_environment(name)
+    if error:
+        return error
+    metadata.record_use([env_path])
+
+    try:
+        if sys.platform == "win32":
+            import subprocess
+            # For Windows, launch PowerShell with the activation script
+            script_path = os.path.join(env_path, "Scripts", "Activate.ps1")
+            if not os.path.exists(script_path):
+                 return f"Activation script not found at {script_path}"
+
+            print(f"Launching activated shell for '{name}'. Type 'exit' to leave.")
+            subprocess.run(
+                ["powershell", "-NoExit", "-Command", f"& '{script_path}'"],
+                check=True
+            )
+        else:
+            # For Unix-like systems (Linux, macOS)
+            shell = os.environ.get("SHELL", "/bin/bash")
+            script_path = os.path.join(env_path, "bin", "activate")
+            if not os.path.exists(script_path):
+                return f"Activation script not found at {script_path}"
+
+            print(f"Launching activated shell for '{name}'. Type 'exit' to leave.")
+            # We use execve to replace the current process with the new shell
+            # This is a common way to give the user a fully interactive sub-shell
+            os.execve(shell, [shell, "--rcfile", script_path], os.environ)
+
+    except Exception as e:
+        return f"Failed to launch shell: {e}"
+
+    return None # Should not be reached on success for Unix
@@ -1,22 +1,46 @@
 import os
+import stat
 import subprocess
 import configparser
 import sys
+import glob
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from . import metadata
+from . import diskusage
+from . import resolver
+from . import utils
+
+# Seconds a probe may spend waiting on an interpreter or pip before giving up
+PROBE_TIMEOUT = 30
+
+# Fields a caller can ask discovery for, and the record keys each one fills in.
+# 'path' is always present and costs nothing beyond the walk.
+FIELD_KEYS = {
+    "path": ("name", "path", "python_executable"),
+    "version": ("python_version",),
+    "size": ("size_mb", "disk_mb", "reclaimable_mb"),
+    "package_count": ("package_count",),
+    "packages": ("packages",),
+}
+DEFAULT_FIELDS = frozenset({"path", "version", "size", "package_count"})
+
+# Where `envpilot clean` moves environments before deleting them
+TRASH_DIR_NAME = '.envpilot-trash'
+# Where `envpilot ensure` builds pool environments before renaming them into place
+POOL_BUILD_DIR_NAME = '.envpilot-building'
+
+# More specific exclusion list to avoid skipping dot-folders like '.venv'
+EXCLUDED_DIRS = {'.git', '.svn', '.hg', '$Recycle.Bin', 'node_modules', '.vscode', '.idea', '__pycache__', TRASH_DIR_NAME, POOL_BUILD_DIR_NAME}
+
+# How many levels below the search path the walk descends
+MAX_WALK_DEPTH = 5
 
 def get_folder_size(path):
-    """Calculates the total size of a directory."""
-    total_size = 0
-    try:
-        for dirpath, dirnames, filenames in os.walk(path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                if not os.path.islink(fp):
-                    total_size += os.path.getsize(fp)
-    except OSError:
-        return 0
-    return total_size
+    """Calculates the total size of a directory, counting hardlinked files once."""
+    return diskusage.get_disk_usage(path).apparent
 
-def get_python_version(python_executable):
+def get_python_version(python_executable, timeout=None):
     """Gets the Python version from a Python executable."""
     if not os.path.exists(python_executable):
         return "N/A"
@@ -26,34 +50,18 @@ def get_python_version(python_executable):
             capture_output=True,
             text=True,
             check=True,
-            encoding='utf-8'
+            encoding='utf-8',
+            timeout=timeout
         )
         return result.stdout.strip().split(" ")[-1]
-    except (subprocess.CalledProcessError, FileNotFoundError, IndexError):
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError, IndexError):
         return "N/A"
 
 def get_package_count(python_executable):
     """Gets the number of installed packages."""
-    if not os.path.exists(python_executable):
-        return 0
-    try:
-        pip_path = os.path.join(os.path.dirname(python_executable), 'pip')
-        if sys.platform == "win32":
-            pip_path += ".exe"
+    return len(get_installed_packages(python_executable))
 
-        result = subprocess.run(
-            [pip_path, "list"],
-            capture_output=True,
-            text=True,
-            check=True,
-            encoding='utf-8'
-        )
-        lines = result.stdout.strip().split('\n')
-        return max(0, len(lines) - 2)  # Subtract header lines
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return 0
-
-def get_installed_packages(python_executable):
+def get_installed_packages(python_executable, timeout=None):
     """Gets a dictionary of installed packages and their versions."""
     if not os.path.exists(python_executable):
         return {}
@@ -67,7 +75,8 @@ def get_installed_packages(python_executable):
             capture_output=True,
             text=True,
             check=True,
-            encoding='utf-8'
+            encoding='utf-8',
+            timeout=timeout
         )
         lines = result.stdout.strip().split('\n')[2:]  # Skip header
         packages = {}
@@ -79,80 +88,561 @@ def get_installed_packages(python_executable):
                 # Handle cases where the line might not split into two parts
                 continue
         return packages
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return {}
+
+def get_python_executable(env_path):
+    """Returns the path of the interpreter inside an environment."""
+    if sys.platform == "win32":
+        return os.path.join(env_path, "Scripts", "python.exe")
+    return os.path.join(env_path, "bin", "python")
+
+def get_site_packages_dirs(env_path):
+    """Returns the site-packages directories that exist inside an environment."""
+    if sys.platform == "win32":
+        candidates = [os.path.join(env_path, "Lib", "site-packages")]
+    else:
+        candidates = glob.glob(os.path.join(env_path, "lib", "python*", "site-packages"))
+    return sorted(path for path in candidates if os.path.isdir(path))
+
+def read_pyvenv_cfg(env_path):
+    """Parses an environment's pyvenv.cfg into a dictionary of lower-cased keys."""
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    try:
+        with open(os.path.join(env_path, "pyvenv.cfg"), 'r', encoding='utf-8') as f:
+            # pyvenv.cfg has no section header, so provide one for configparser
+            parser.read_string("[pyvenv]\n" + f.read())
+    except (OSError, UnicodeDecodeError, configparser.Error):
         return {}
+    return dict(parser.items("pyvenv"))
+
+def read_python_version(env_path):
+    """
+    Reads the Python version recorded in pyvenv.cfg.
+    `venv` writes `version`, while virtualenv and uv write `version_info`.
+    Returns None if neither key is present.
+    """
+    config = read_pyvenv_cfg(env_path)
+    version = config.get("version") or config.get("version_info")
+    if not version:
+        return None
+    # virtualenv records e.g. '3.11.7.final.0'
+    return ".".join(version.split(".")[:3])
+
+def _read_metadata_headers(metadata_path):
+    """Reads the Name and Version headers from a METADATA or PKG-INFO file."""
+    name = version = None
+    try:
+        with open(metadata_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.strip():
+                    # Headers end at the first blank line; the description follows
+                    break
+                if line.startswith("Name:"):
+                    name = line[5:].strip()
+                elif line.startswith("Version:"):
+                    version = line[8:].strip()
+                if name and version:
+                    break
+    except OSError:
+        return None, None
+    return name, version
+
+def read_distribution(entry_path):
+    """Returns (name, version) for a .dist-info or .egg-info entry."""
+    if entry_path.endswith(".dist-info"):
+        metadata_path = os.path.join(entry_path, "METADATA")
+    elif os.path.isdir(entry_path):
+        metadata_path = os.path.join(entry_path, "PKG-INFO")
+    else:
+        # Old-style setuptools installs write a single PKG-INFO file named *.egg-info
+        metadata_path = entry_path
+    name, version = _read_metadata_headers(metadata_path)
+    if name and version:
+        return name, version
+
+    # Fall back to the directory name, e.g. 'requests-2.31.0.dist-info'
+    stem = os.path.splitext(os.path.basename(entry_path))[0]
+    name, _, version = stem.partition("-")
+    version = version.split("-")[0]
+    if name and version:
+        return name, version
+    return None, None
+
+def _find_egg_link_distributions(egg_link_path):
+    """Yields the .egg-info directories an .egg-link (develop install) points at."""
+    try:
+        with open(egg_link_path, 'r', encoding='utf-8') as f:
+            project_dir = f.readline().strip()
+    except OSError:
+        return []
+    if not os.path.isabs(project_dir):
+        project_dir = os.path.join(os.path.dirname(egg_link_path), project_dir)
+    return glob.glob(os.path.join(project_dir, "*.egg-info"))
+
+def read_installed_packages(env_path):
+    """
+    Lists installed packages by reading dist-info and egg-info metadata
+    from the environment's site-packages, without starting any process.
+    Returns None if the environment has no site-packages directory.
+    """
+    site_packages_dirs = get_site_packages_dirs(env_path)
+    if not site_packages_dirs:
+        return None
+
+    packages = {}
+    for site_packages in site_packages_dirs:
+        try:
+            entries = list(os.scandir(site_packages))
+        except OSError:
+            return None
+        for entry in entries:
+            if entry.name.endswith((".dist-info", ".egg-info")):
+                dist_paths = [entry.path]
+            elif entry.name.endswith(".egg-link"):
+                dist_paths = _find_egg_link_distributions(entry.path)
+            else:
+                continue
+            for dist_path in dist_paths:
+                name, version = read_distribution(dist_path)
+                if name:
+                    packages.setdefault(name.lower(), version)
+    return packages
+
+def probe_python_version(env_path, python_executable, timeout=None):
+    """Gets an environment's Python version, running the interpreter only if pyvenv.cfg lacks it."""
+    return read_python_version(env_path) or get_python_version(python_executable, timeout)
+
+def probe_installed_packages(env_path, python_executable, timeout=None):
+    """
+    Gets an environment's installed packages from its metadata on disk.
+    Falls back to `pip list` when site-packages cannot be read, or when the
+    environment also sees the system site-packages.
+    """
+    config = read_pyvenv_cfg(env_path)
+    if config.get("include-system-site-packages", "false").lower() != "true":
+        packages = read_installed_packages(env_path)
+        if packages is not None:
+            return packages
+    return get_installed_packages(python_executable, timeout)
+
+def get_environment_mtimes(env_path):
+    """
+    Collects the mtimes used to decide whether a cached environment record is stale.
+    Installing or removing packages touches site-packages, and recreating the
+    environment touches its root directory and pyvenv.cfg.
+    """
+    paths = [env_path, os.path.join(env_path, "pyvenv.cfg")] + get_site_packages_dirs(env_path)
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[os.path.relpath(path, env_path)] = os.stat(path).st_mtime
+        except OSError:
+            continue
+    return mtimes
+
+def get_missing_fields(record, fields):
+    """Returns the subset of `fields` that `record` does not hold yet."""
+    return {field for field in fields if any(key not in record for key in FIELD_KEYS[field])}
+
+def probe_environment(env_path, python_executable, timeout=None, use_cache=True, fields=DEFAULT_FIELDS, record=None, refresh=False):
+    """
+    Collects the metadata shown for a single environment.
+    Only the requested `fields` are computed; fields already present in
+    `record` (e.g. from the index) are kept rather than probed again.
+    `refresh` also bypasses the cached directory sizes.
+    """
+    record = dict(record or {})
+    record.update({
+        "name": os.path.basename(env_path),
+        "path": env_path,
+        "python_executable": python_executable,
+    })
+    missing = get_missing_fields(record, fields)
+    # Probes may run the interpreter; that must not count as a use of the environment
+    interpreter_st = _lstat(python_executable)
+
+    if "version" in missing:
+        record["python_version"] = probe_python_version(env_path, python_executable, timeout)
+    if "size" in missing:
+        usage = diskusage.get_disk_usage(env_path, use_cache=use_cache, refresh=refresh)
+        record["size_mb"] = usage.apparent / (1024 * 1024)
+        record["disk_mb"] = usage.allocated / (1024 * 1024)
+        record["reclaimable_mb"] = usage.exclusive / (1024 * 1024)
+    if "packages" in missing or "package_count" in missing:
+        packages = probe_installed_packages(env_path, python_executable, timeout)
+        record["package_count"] = len(packages)
+        if "packages" in fields:
+            record["packages"] = packages
+    _restore_atime(python_executable, interpreter_st)
+    return record
+
+def _lstat(path):
+    try:
+        return os.lstat(path)
+    except OSError:
+        return None
+
+def interpreter_exists(python_executable):
+    """
+    Checks that an environment's interpreter exists. Resolving a symlinked
+    interpreter updates the link's access time, which `clean --budget`
+    reads as the last use, so it is put back afterwards.
+    """
+    st = _lstat(python_executable)
+    if st is None:
+        return False
+    exists = os.path.exists(python_executable)
+    _restore_atime(python_executable, st)
+    return exists
+
+def _restore_atime(path, st):
+    """Resets a file's access time to what `st` recorded, if it changed."""
+    if st is None:
+        return
+    current = _lstat(path)
+    if current is None or current.st_atime_ns == st.st_atime_ns:
+        return
+    # A venv's interpreter is usually a symlink; its target is shared with other environments
+    is_link = stat.S_ISLNK(st.st_mode)
+    if is_link and os.utime not in os.supports_follow_symlinks:
+        return
+    try:
+        os.utime(path, ns=(st.st_atime_ns, current.st_mtime_ns), follow_symlinks=not is_link)
+    except OSError:
+        pass
+
+def get_walk_cache_path(search_path):
+    """Returns the cache of directory listings from the last walk of `search_path`."""
+    return os.path.join(metadata.get_cache_dir(), "walks", utils.path_key(search_path) + ".json")
+
+def _list_directory(path):
+    """Returns (sorted subdirectory names, whether pyvenv.cfg is present), or None if unreadable."""
+    subdirs = []
+    has_cfg = False
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # Like os.walk, symlinked directories are not followed
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in EXCLUDED_DIRS:
+                        subdirs.append(entry.name)
+                elif entry.name == "pyvenv.cfg":
+                    has_cfg = True
+    except OSError:
+        return None
+    return sorted(subdirs), has_cfg
+
+def walk_environments(search_path, on_directory=None, max_depth=MAX_WALK_DEPTH, listings=None):
+    """
+    Walks `search_path` and yields (env_path, python_executable) for every
+    virtual environment found, without probing it.
+    `on_directory`, if given, is called with every directory the walk visits.
+
+    `listings`, if given, maps directories to [mtime_ns, subdirs, has_cfg]
+    from an earlier walk: only directories whose mtime changed are listed
+    again. Once the walk completes it holds the listings of this walk.
+    """
+    if os.path.basename(search_path.rstrip(os.path.sep)) in EXCLUDED_DIRS:
+        return
 
-def discover_environments(search_path):
-    """Discovers Python virtual environments by looking for pyvenv.cfg files."""
-    environments = []
     # Limit walk depth to avoid excessively long scans in deep directories
     search_path_depth = search_path.rstrip(os.path.sep).count(os.path.sep)
-    
-    # More specific exclusion list to avoid skipping dot-folders like '.venv'
-    excluded_dirs = {'.git', '.svn', '.hg', '$Recycle.Bin', 'node_modules', '.vscode', '.idea', '__pycache__'}
-
-    for root, dirs, files in os.walk(search_path, topdown=True):
-        # Prune search space
-        dirs[:] = [d for d in dirs if d not in excluded_dirs]
-        
-        if root.count(os.path.sep) > search_path_depth + 5:
-            dirs[:] = []
+
+    visited = {} if listings is not None else None
+    pending = [search_path]
+    while pending:
+        root = pending.pop()
+        if root.count(os.path.sep) > search_path_depth + max_depth:
             continue
 
-        if "pyvenv.cfg" in files:
+        if on_directory is not None:
+            on_directory(root)
+
+        listing = None
+        if visited is not None:
+            # Adding or removing an entry changes its directory's mtime
+            st = _lstat(root)
+            if st is None:
+                continue
+            cached = listings.get(root)
+            if cached is not None and cached[0] == st.st_mtime_ns:
+                listing = cached[1], cached[2]
+        if listing is None:
+            listing = _list_directory(root)
+            if listing is None:
+                continue
+        subdirs, has_cfg = listing
+        if visited is not None:
+            visited[root] = [st.st_mtime_ns, subdirs, has_cfg]
+
+        if has_cfg:
             env_path = root
-            
+
             # Heuristic to avoid detecting environments inside other environments
             if "site-packages" in env_path or ".tox" in env_path:
-                dirs[:] = []
                 continue
 
-            if sys.platform == "win32":
-                python_executable = os.path.join(env_path, "Scripts", "python.exe")
-            else:
-                python_executable = os.path.join(env_path, "bin", "python")
+            python_executable = get_python_executable(env_path)
 
-            if not os.path.exists(python_executable):
-                dirs[:] = []
+            if not interpreter_exists(python_executable):
                 continue
 
-            version = get_python_version(python_executable)
-            size = get_folder_size(env_path)
-            package_count = get_package_count(python_executable)
-
-            environments.append({
-                "name": os.path.basename(env_path),
-                "python_version": version,
-                "package_count": package_count,
-                "size_mb": size / (1024 * 1024),
-                "path": env_path,
-                "python_executable": python_executable,
-            })
-            
+            yield env_path, python_executable
+
             # Don't descend further into the environment directory
-            dirs[:] = []
-            
-    return environments
+            continue
+
+        # Visit subdirectories in name order, depth first like os.walk
+        pending.extend(os.path.join(root, name) for name in reversed(subdirs))
+
+    if listings is not None:
+        listings.clear()
+        listings.update(visited)
+
+def _load_cached_record(index, env_path, refresh):
+    """
+    Returns the cached record for `env_path` if its mtimes are unchanged,
+    otherwise None. Entries whose environment has disappeared are dropped.
+    """
+    entry = index["environments"].get(env_path)
+    if entry is None:
+        return None
+    if not os.path.exists(entry["cfg_path"]) or not interpreter_exists(entry["record"]["python_executable"]):
+        del index["environments"][env_path]
+        return None
+    if refresh or entry["mtimes"] != get_environment_mtimes(env_path):
+        return None
+    return entry["record"]
+
+def _store_record(index, env_path, record):
+    index["environments"][env_path] = {
+        "cfg_path": os.path.join(env_path, "pyvenv.cfg"),
+        "mtimes": get_environment_mtimes(env_path),
+        "record": record,
+    }
+
+def forget_fields(env_paths, fields):
+    """
+    Drops `fields` from the indexed records of `env_paths`, so they are
+    probed again on next use. For changes the mtime checks cannot see,
+    such as files being swapped for hardlinks deep inside site-packages.
+    """
+    if not env_paths:
+        return
+    index = metadata.load_index()
+    keys = {key for field in fields for key in FIELD_KEYS[field]}
+    for env_path in env_paths:
+        entry = index["environments"].get(env_path)
+        if entry is not None:
+            for key in keys:
+                entry["record"].pop(key, None)
+    metadata.save_index(index)
+
+def get_default_jobs():
+    """Returns the default number of environments probed concurrently."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+def _iter_probed(candidates, index, refresh, jobs, timeout, fields, use_cache):
+    """
+    Yields (position, env_path, record) for each (env_path, python_executable)
+    candidate as soon as its record is available, reusing fresh index entries
+    and probing the rest on a thread pool.
+    """
+    fields = set(fields) | {"path"}
+    jobs = jobs or get_default_jobs()
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+
+    def finish(future):
+        order, env_path = pending.pop(future)
+        record = future.result()
+        if index is not None:
+            _store_record(index, env_path, record)
+        return order, env_path, record
+
+    try:
+        for order, (env_path, python_executable) in enumerate(candidates):
+            record = None
+            if index is not None:
+                record = _load_cached_record(index, env_path, refresh)
+            if record is None or get_missing_fields(record, fields):
+                if executor is not None:
+                    future = executor.submit(probe_environment, env_path, python_executable, timeout, use_cache, fields, record, refresh)
+                    pending[future] = (order, env_path)
+                    record = None
+                else:
+                    record = probe_environment(env_path, python_executable, timeout, use_cache, fields, record, refresh)
+                    if index is not None:
+                        _store_record(index, env_path, record)
+            if record is not None:
+                yield order, env_path, record
+
+            # Hand out finished probes without waiting for the walk to end
+            for future in [f for f in pending if f.done()]:
+                yield finish(future)
+
+        for future in as_completed(list(pending)):
+            yield finish(future)
+    finally:
+        if executor is not None:
+            # Stop queued probes if the consumer stopped early
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+def _iter_discovered(search_path, use_cache, refresh, jobs, timeout, fields):
+    """
+    Yields (walk_position, record) for each environment as soon as it is
+    available. The index is only written back once the scan has completed.
+    """
+    search_path = os.path.abspath(search_path)
+
+    index = metadata.load_index() if use_cache else None
+    listings = None
+    if index is not None:
+        # Re-lists only the directories changed since the last walk, so new
+        # environments are found without rescanning the whole tree
+        listings = {} if refresh else metadata.read_json(get_walk_cache_path(search_path), {})
+        if not isinstance(listings, dict):
+            listings = {}
+    candidates = walk_environments(search_path, listings=listings)
+
+    found = []
+    for order, env_path, record in _iter_probed(candidates, index, refresh, jobs, timeout, fields, use_cache):
+        found.append((order, env_path))
+        yield order, record
+
+    if index is not None:
+        found.sort()
+        index["roots"][search_path] = {
+            "scanned_at": time.time(),
+            "environments": [env_path for _, env_path in found],
+        }
+        metadata.save_index(index)
+        try:
+            metadata.write_json(get_walk_cache_path(search_path), listings)
+        except OSError:
+            pass
+        metadata.register_environments(env_path for _, env_path in found)
+
+def _query_daemon(search_path, fields):
+    """Asks a running `envpilot daemon` for the environments under `search_path`, or returns None."""
+    # Imported here to avoid a circular import; the daemon builds on this module
+    from . import daemon
+    response = daemon.query({"op": "list", "root": os.path.abspath(search_path), "fields": sorted(fields)})
+    if response is None:
+        return None
+    return response["environments"]
+
+def probe_environments(env_paths, fields=DEFAULT_FIELDS, use_cache=True, refresh=False, jobs=None, timeout=PROBE_TIMEOUT):
+    """
+    Probes a known set of environments concurrently, reusing and updating
+    their index entries. Paths that are no longer environments are skipped.
+    """
+    candidates = []
+    for env_path in env_paths:
+        python_executable = get_python_executable(env_path)
+        if os.path.exists(os.path.join(env_path, "pyvenv.cfg")) and interpreter_exists(python_executable):
+            candidates.append((env_path, python_executable))
+
+    index = metadata.load_index() if use_cache else None
+    results = list(_iter_probed(candidates, index, refresh, jobs, timeout, fields, use_cache))
+    if index is not None:
+        metadata.save_index(index)
+    results.sort(key=lambda item: item[0])
+    return [record for _, _, record in results]
+
+def iter_environments(search_path, use_cache=True, refresh=False, jobs=None, timeout=PROBE_TIMEOUT, fields=DEFAULT_FIELDS):
+    """
+    Yields environment records as soon as each one has been found and probed.
+
+    Records come in completion order, so cached environments are yielded
+    immediately. Closing the generator early stops any probes still queued.
+    See `discover_environments` for the meaning of the arguments.
+    """
+    if use_cache and not refresh:
+        records = _query_daemon(search_path, fields)
+        if records is not None:
+            for record in records:
+                yield record
+            return
+    for _, record in _iter_discovered(search_path, use_cache, refresh, jobs, timeout, fields):
+        yield record
+
+def discover_environments(search_path, use_cache=True, refresh=False, jobs=None, timeout=PROBE_TIMEOUT, fields=DEFAULT_FIELDS):
+    """
+    Discovers Python virtual environments by looking for pyvenv.cfg files.
+
+    Results are kept in the on-disk index (see `metadata`). When `search_path`
+    has been scanned before, only directories whose mtime changed are listed
+    again and just the environments whose mtimes changed are probed again.
+    `refresh` forces a full walk and re-probe; `use_cache=False` neither
+    reads nor writes the index.
+
+    Environments are probed on a pool of `jobs` threads while the directory
+    walk carries on; `jobs=1` probes inline. Any interpreter or pip process a
+    probe has to start is killed after `timeout` seconds.
+
+    `fields` selects which metadata to compute (see FIELD_KEYS). Asking for
+    {'path'} only walks the tree; 'packages' adds the installed package map.
+    Records may carry more fields than requested if the index already has them.
+
+    When an `envpilot daemon` is watching `search_path`, its registry is used
+    instead of scanning (unless `refresh` or `use_cache=False` is given).
+    """
+    if use_cache and not refresh:
+        records = _query_daemon(search_path, fields)
+        if records is not None:
+            return records
+    results = list(_iter_discovered(search_path, use_cache, refresh, jobs, timeout, fields))
+    # Keep the walk order regardless of which probes finished first
+    results.sort(key=lambda item: item[0])
+    return [record for _, record in results]
+
+def get_environment(env_path, fields=DEFAULT_FIELDS, use_cache=True, refresh=False, timeout=PROBE_TIMEOUT):
+    """
+    Probes a single environment on demand, reusing and updating its index entry.
+    Returns None if `env_path` is not a usable environment.
+    """
+    env_path = os.path.abspath(env_path)
+    python_executable = get_python_executable(env_path)
+    if not os.path.exists(os.path.join(env_path, "pyvenv.cfg")) or not interpreter_exists(python_executable):
+        return None
+
+    fields = set(fields) | {"path"}
+    index = metadata.load_index() if use_cache else None
+    record = _load_cached_record(index, env_path, refresh) if index is not None else None
+    if record is not None and not get_missing_fields(record, fields):
+        return record
+
+    record = probe_environment(env_path, python_executable, timeout, use_cache, fields, record, refresh)
+    if index is not None:
+        _store_record(index, env_path, record)
+        metadata.save_index(index)
+    return record
+
+def find_environment_paths(name):
+    """
+    Finds every environment matching `name`, checking common locations first for speed.
+    More than one path is returned when several environments share the name.
+    """
+    candidates = resolver.find_known_environment_paths(name)
+    if candidates:
+        return candidates
+
+    # Not in any of the usual places: fall back to the incremental (or, on first use, full) scan
+    all_envs = discover_environments(os.path.expanduser("~"), fields={"path"})
+    candidates = [env["path"] for env in all_envs if env['name'] == name]
+    metadata.register_environments(candidates)
+    return candidates
 
 def find_environment_path(name):
     """
     Finds the path of an environment by name, checking common locations first for speed.
+    Returns the first candidate if the name is ambiguous; see `find_environment_paths`.
     """
-    # 1. Check if the name is a path to an env in the current directory
-    potential_path = os.path.join(os.getcwd(), name)
-    if os.path.exists(os.path.join(potential_path, "pyvenv.cfg")):
-        return potential_path
-
-    # 2. Check the old default creation directory
-    legacy_path = os.path.join(os.path.expanduser("~"), ".envpilot-envs", name)
-    if os.path.exists(os.path.join(legacy_path, "pyvenv.cfg")):
-        return legacy_path
-
-    # 3. If not found, fall back to the slow, full scan
-    all_envs = discover_environments(os.path.expanduser("~"))
-    found_env = next((env for env in all_envs if env['name'] == name), None)
-    
-    if found_env:
-        return found_env["path"]
-        
-    return None 
\ No newline at end of file
+    paths = find_environment_paths(name)
+    if paths:
+        return paths[0]
+    return None
@@ -3,58 +3,96 @@ import json
 import hashlib
 import platform
 import sys
+import fnmatch
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from packaging.utils import canonicalize_name
 from . import scanner
+from . import metadata
+from . import cloner
+from . import wheelhouse
 
-def get_environment_details(env_name_or_path):
+def find_environment_record(env_name_or_path, fields, **scan_options):
     """
-    Gathers detailed information about a specific environment.
+    Resolves an environment given by path or by name and probes `fields` for it.
+    Names are resolved with `scanner.find_environment_path`; `use_cache` and
+    `refresh` in the keyword arguments apply to the probe.
+    Returns None if it cannot be found.
     """
-    # Find the environment
-    search_path = os.path.expanduser("~")
-    all_envs = scanner.discover_environments(search_path)
-    
-    target_env = None
+    use_cache = scan_options.get("use_cache", True)
+    refresh = scan_options.get("refresh", False)
     # Check if the input is a direct path
     if os.path.isdir(env_name_or_path):
-        env_path = os.path.abspath(env_name_or_path)
-        target_env = next((env for env in all_envs if os.path.abspath(env['path']) == env_path), None)
-    else: # Assume it's a name
-        target_env = next((env for env in all_envs if env['name'] == env_name_or_path), None)
+        return scanner.get_environment(env_name_or_path, fields, use_cache=use_cache, refresh=refresh)
+    # Assume it's a name; the registry resolves it without probing anything
+    env_path = scanner.find_environment_path(env_name_or_path)
+    if env_path:
+        return scanner.get_environment(env_path, fields, use_cache=use_cache, refresh=refresh)
+    return None
+
+def get_environment_details(env_name_or_path, **scan_options):
+    """
+    Gathers detailed information about a specific environment.
+    Extra keyword arguments are passed on to `scanner.discover_environments`.
+    """
+    target_env = find_environment_record(env_name_or_path, {"version", "packages"}, **scan_options)
 
     if not target_env:
         return None, f"Environment '{env_name_or_path}' not found."
 
-    python_executable = target_env["python_executable"]
-    installed_packages = scanner.get_installed_packages(python_executable)
+    return build_details(target_env), None
 
-    details = {
+def build_details(env):
+    """Builds the lock file 'environment' section for a probed environment record."""
+    return {
         "metadata": {
             "source_host": platform.node(),
             "platform": sys.platform,
             "architecture": platform.machine(),
-            "python_version": target_env["python_version"],
+            "python_version": env["python_version"],
             "export_timestamp": datetime.utcnow().isoformat() + "Z",
         },
-        "packages": installed_packages
+        "packages": env["packages"]
     }
-    return details, None
 
+def sign_details(details):
+    """
+    Returns the integrity hash stored next to an 'environment' section: the
+    SHA-256 of its `json.dumps(details, sort_keys=True)` form. The JSON is
+    hashed chunk by chunk as it is encoded rather than built as one string.
+    """
+    digest = hashlib.sha256()
+    for chunk in json.JSONEncoder(sort_keys=True).iterencode(details):
+        digest.update(chunk.encode('utf-8'))
+    return digest.hexdigest()
 
-def export_environment(env_name, output_path):
+def verify_signature(lock_data):
+    """Checks a lock's signature against its 'environment' section. Returns an error message or None."""
+    signature = lock_data.get("signature")
+    details = lock_data.get("environment")
+    if not signature or not isinstance(details, dict):
+        return "Lock file is not signed."
+    if sign_details(details) != signature:
+        return "Lock file signature does not match its contents; it was modified after export."
+    return None
+
+def export_environment(env_name, output_path, with_hashes=False, **scan_options):
     """
     Exports the environment's details to a JSON lock file.
+    With `with_hashes`, a 'hashes' map of the per-package archive hashes pip
+    recorded is included (see `wheelhouse.get_package_hashes`) and covered
+    by the signature.
     """
-    details, error = get_environment_details(env_name)
+    details, error = get_environment_details(env_name, **scan_options)
     if error:
         return None, error
+    if with_hashes:
+        env_path = find_environment_record(env_name, {"path"}, **scan_options)["path"]
+        details["hashes"] = wheelhouse.get_package_hashes(env_path)
 
     # Create a hash for integrity checking
-    details_str = json.dumps(details, sort_keys=True)
-    hash_signature = hashlib.sha256(details_str.encode('utf-8')).hexdigest()
-    
     lock_file_content = {
-        "signature": hash_signature,
+        "signature": sign_details(details),
         "environment": details
     }
     
@@ -65,37 +103,249 @@ def export_environment(env_name, output_path):
     except IOError as e:
         return None, f"Failed to write to {output_path}: {e}"
 
-def import_environment(lock_file_path, new_env_name):
-    """
-    Creates a new environment from a lock file.
-    """
+def read_lock_file(lock_file_path):
+    """Reads a lock file. Returns (lock_data, error)."""
     try:
         with open(lock_file_path, 'r', encoding='utf-8') as f:
-            lock_data = json.load(f)
+            return json.load(f), None
     except (IOError, json.JSONDecodeError) as e:
         return None, f"Failed to read or parse lock file {lock_file_path}: {e}"
 
-    # TODO: We could add a signature check here for integrity
+def import_environment(lock_file_path, new_env_name, offline=False, wheel_dirs=None, jobs=None, verify=True):
+    """
+    Creates a new environment from a lock file.
+    Pinned packages with a wheel in `wheel_dirs` (default: the local
+    wheelhouse) are unpacked directly and in parallel; pip only installs the
+    rest. With `offline`, pip is limited to the local wheelhouse too.
+    The lock's signature is checked first unless `verify` is False, and
+    per-package hashes, when present, are enforced.
+    """
+    lock_data, error = read_lock_file(lock_file_path)
+    if error:
+        return None, error
+
+    if verify:
+        error = verify_signature(lock_data)
+        if error:
+            return None, error
     
     packages = lock_data.get("environment", {}).get("packages", {})
     if not packages:
         return None, "Lock file contains no packages to install."
 
-    # Create a temporary requirements file from the lock file packages
-    temp_req_path = "temp_requirements_from_lock.txt"
-    with open(temp_req_path, "w", encoding='utf-8') as f:
-        for package, version in packages.items():
-            f.write(f"{package}=={version}\n")
-    
+    hashes = lock_data["environment"].get("hashes")
+    return create_from_packages(new_env_name, packages, None, offline, wheel_dirs, jobs, hashes)
+
+def create_from_packages(new_env_name, packages, base_path=None, offline=False, wheel_dirs=None, jobs=None, hashes=None, register=True):
+    """
+    Creates an environment and installs an exactly pinned {name: version} set into it.
+    See `manager.create_environment` for `register`.
+    """
     # Use the existing manager to create the environment
     # We need to import manager here to avoid circular dependency
     from . import manager
-    env_path, error = manager.create_environment(new_env_name, temp_req_path)
-    
-    # Clean up the temporary file
-    os.remove(temp_req_path)
-    
+    from . import installer
+    env_path, error = manager.create_environment(new_env_name, base_path=base_path, register=register)
+    if error:
+        return env_path, f"Environment creation from lock file failed. {error}"
+
+    _, _, error = installer.install_pinned(env_path, packages, wheel_dirs, offline, jobs, hashes)
     if error:
         return env_path, f"Environment creation from lock file failed. {error}"
         
-    return env_path, None 
\ No newline at end of file
+    return env_path, None
+
+BUNDLE_VERSION = 1
+
+def build_bundle(environments):
+    """
+    Packs several environments into one bundle.
+
+    Every distinct (name, version) pin is stored once in 'pins'; each
+    environment lists the indices of its pins, keeps its own metadata and
+    original path, and is signed exactly like a single-environment lock,
+    so `expand_bundle_environment` can turn it back into one.
+    """
+    pin_positions = {}
+    entries = {}
+    for env in environments:
+        details = build_details(env)
+        key = env["name"]
+        suffix = 2
+        while key in entries:
+            key = f"{env['name']}~{suffix}"
+            suffix += 1
+        pins = sorted(pin_positions.setdefault(pin, len(pin_positions)) for pin in details["packages"].items())
+        entries[key] = {
+            "path": env["path"],
+            "signature": sign_details(details),
+            "metadata": details["metadata"],
+            "packages": pins,
+        }
+    return {
+        "bundle_version": BUNDLE_VERSION,
+        "pins": [list(pin) for pin in pin_positions],
+        "environments": entries,
+    }
+
+def expand_bundle_environment(bundle, key):
+    """Rebuilds the single-environment lock for one bundle entry."""
+    entry = bundle["environments"][key]
+    pins = bundle["pins"]
+    return {
+        "signature": entry["signature"],
+        "environment": {
+            "metadata": entry["metadata"],
+            "packages": dict(pins[position] for position in entry["packages"]),
+        },
+    }
+
+def export_bundle(output_path, pattern=None, **scan_options):
+    """
+    Exports every discovered environment, or those whose name or path
+    matches the glob `pattern`, to a single bundle file. Package sets are
+    collected by the parallel discovery (see `scanner.discover_environments`).
+    Returns (exported_names, error).
+    """
+    environments = scanner.discover_environments(os.path.expanduser("~"), fields={"path", "version", "packages"}, **scan_options)
+    if pattern:
+        environments = [
+            env for env in environments
+            if fnmatch.fnmatch(env["name"], pattern) or fnmatch.fnmatch(env["path"], pattern)
+        ]
+    if not environments:
+        return None, "No environments to export."
+
+    bundle = build_bundle(environments)
+    try:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(bundle, f, indent=2)
+    except IOError as e:
+        return None, f"Failed to write to {output_path}: {e}"
+    return list(bundle["environments"]), None
+
+def import_bundle(bundle_path, names=None, base_path=None, offline=False, wheel_dirs=None, jobs=None, verify=True):
+    """
+    Recreates the environments of a bundle concurrently, one thread each.
+    Each is created at its original path, or under `base_path` if given;
+    `names` limits which bundle entries are restored. Each entry's
+    signature is checked unless `verify` is False.
+    Returns (results, error), where results lists (name, env_path, error).
+    """
+    bundle, error = read_lock_file(bundle_path)
+    if error:
+        return None, error
+    if bundle.get("bundle_version") != BUNDLE_VERSION:
+        return None, f"{bundle_path} is not an envpilot bundle."
+
+    keys = [key for key in bundle["environments"] if not names or key in names]
+    if not keys:
+        return None, "None of the requested environments are in the bundle."
+
+    def restore(key):
+        lock = expand_bundle_environment(bundle, key)
+        error = verify_signature(lock) if verify else None
+        if error:
+            return key, None, error
+        original_path = bundle["environments"][key]["path"]
+        if base_path:
+            # Bundle keys of environments sharing a name carry a ~N suffix
+            name, target_base = key.replace("~", "-"), base_path
+        else:
+            name, target_base = os.path.basename(original_path), os.path.dirname(original_path)
+        env_path, error = create_from_packages(name, lock["environment"]["packages"], target_base, offline, wheel_dirs, jobs, register=False)
+        return key, env_path, error
+
+    with ThreadPoolExecutor(max_workers=min(len(keys), jobs or scanner.get_default_jobs())) as executor:
+        results = list(executor.map(restore, keys))
+    # Registered here rather than by each worker, in one registry update
+    metadata.register_environments(env_path for _, env_path, _ in results if env_path)
+    return results, None
+
+def plan_lock_apply(locked_packages, installed_packages):
+    """
+    Diffs a lock's {name: version} map against an environment's installed
+    packages. Returns {'install': {name: version}, 'upgrade': {name:
+    (installed_version, locked_version)}, 'remove': {name: version}}.
+    pip, setuptools and wheel are never removed.
+    """
+    installed = {canonicalize_name(name): (name, version) for name, version in installed_packages.items()}
+    locked = {canonicalize_name(name): (name, version) for name, version in locked_packages.items()}
+
+    plan = {"install": {}, "upgrade": {}, "remove": {}}
+    for key, (name, version) in sorted(locked.items()):
+        if key not in installed:
+            plan["install"][name] = version
+        elif installed[key][1] != version:
+            plan["upgrade"][name] = (installed[key][1], version)
+    for key, (name, version) in sorted(installed.items()):
+        if key not in locked and key not in cloner.KEEP_PACKAGES:
+            plan["remove"][name] = version
+    return plan
+
+def apply_lock(lock_file_path, env_name_or_path, dry_run=False, offline=False, wheel_dirs=None, verify=True, **scan_options):
+    """
+    Brings an existing environment in line with a lock file, touching only
+    the packages that differ: new pins are installed, changed pins are
+    replaced and packages missing from the lock are removed. Changes to
+    pip, setuptools and wheel are left to pip (see `installer.install_pinned`).
+    With `dry_run`, only the plan is computed.
+    Returns (plan, error).
+    """
+    lock_data, error = read_lock_file(lock_file_path)
+    if error:
+        return None, error
+    if verify:
+        error = verify_signature(lock_data)
+        if error:
+            return None, error
+    locked_packages = lock_data.get("environment", {}).get("packages", {})
+    if not locked_packages:
+        return None, "Lock file contains no packages to install."
+
+    target_env = find_environment_record(env_name_or_path, {"packages"}, **scan_options)
+    if not target_env:
+        return None, f"Environment '{env_name_or_path}' not found."
+
+    plan = plan_lock_apply(locked_packages, target_env["packages"])
+    if dry_run:
+        return plan, None
+
+    from . import installer
+    if plan["remove"]:
+        error = installer.uninstall(target_env["path"], list(plan["remove"]))
+        if error:
+            return plan, error
+    changed = dict(plan["install"])
+    changed.update({name: versions[1] for name, versions in plan["upgrade"].items()})
+    if changed:
+        _, _, error = installer.install_pinned(target_env["path"], changed, wheel_dirs, offline, scan_options.get("jobs"), lock_data["environment"].get("hashes"))
+        if error:
+            return plan, error
+    return plan, None
+
+def verify_lock(lock_file_path, env_name_or_path, incremental=False, **scan_options):
+    """
+    Checks that an environment still matches a lock file: the lock's
+    signature, the installed package versions, and every installed file
+    against its RECORD hash (see `verifier.verify_environment`).
+    Returns (report, error); the report holds 'signature_error', the
+    package 'plan' from `plan_lock_apply`, the file check results and
+    'drifted', which is True if anything differs.
+    """
+    from . import verifier
+    lock_data, error = read_lock_file(lock_file_path)
+    if error:
+        return None, error
+    target_env = find_environment_record(env_name_or_path, {"packages"}, **scan_options)
+    if not target_env:
+        return None, f"Environment '{env_name_or_path}' not found."
+
+    report = verifier.verify_environment(target_env["path"], incremental, scan_options.get("jobs"))
+    report["signature_error"] = verify_signature(lock_data)
+    report["plan"] = plan_lock_apply(lock_data.get("environment", {}).get("packages", {}), target_env["packages"])
+    report["drifted"] = bool(
+        report["signature_error"] or report["modified"] or report["missing"]
+        or any(report["plan"].values())
+    )
+    return report, None
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import base64
+import hashlib
+
+# Read size used when hashing or copying large files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Seconds between attempts to take a lock another process holds
+LOCK_POLL_SECONDS = 0.2
+
+def path_key(path):
+    """Returns the name under which per-path cache files are stored: the SHA-1 of the absolute path."""
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+
+def allocated_bytes(st):
+    """Returns the bytes allocated for a file, falling back to its size where st_blocks is unavailable."""
+    blocks = getattr(st, "st_blocks", None)
+    if blocks is None:
+        return st.st_size
+    return blocks * 512
+
+def _file_digest(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file, or None if it cannot be read."""
+    try:
+        return _file_digest(path, "sha256").hexdigest()
+    except OSError:
+        return None
+
+def _encode_record_hash(algorithm, digest):
+    return f"{algorithm}=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+def record_hash(data, algorithm="sha256"):
+    """Hashes bytes into the '<algorithm>=<urlsafe base64>' form used in RECORD files."""
+    return _encode_record_hash(algorithm, hashlib.new(algorithm, data).digest())
+
+def record_hash_file(path, algorithm="sha256"):
+    """
+    Hashes a file in chunks into RECORD form. Raises OSError if it cannot
+    be read and ValueError for an unknown algorithm.
+    """
+    return _encode_record_hash(algorithm, _file_digest(path, algorithm).digest())
+
+def _try_lock(lock_file):
+    if sys.platform == "win32":
+        import msvcrt
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+def acquire_lock(lock_path, timeout=None, poll=LOCK_POLL_SECONDS):
+    """
+    Opens and exclusively locks `lock_path`, waiting up to `timeout` seconds
+    (forever by default) for other holders, retrying every `poll` seconds. The lock is released when the
+    returned file is closed, including when the holding process dies.
+    Returns the open file, or None on timeout.
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    lock_file = open(lock_path, 'a+')
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            _try_lock(lock_file)
+            return lock_file
+        except OSError:
+            if deadline is not None and time.monotonic() >= deadline:
+                lock_file.close()
+                return None
+            time.sleep(poll)
@@ -0,0 +1,77 @@
+import os
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from . import scanner
+from . import metadata
+from . import wheelhouse
+from . import utils
+
+def get_verify_cache_path(env_path):
+    """Returns the cache of files that last matched their RECORD hash."""
+    return os.path.join(metadata.get_cache_dir(), "verify", utils.path_key(env_path) + ".json")
+
+def iter_recorded_files(env_path):
+    """Yields (path, expected_hash) for every hashed RECORD entry of an environment."""
+    for dist_info_path in wheelhouse.list_distributions(env_path):
+        site_packages = os.path.dirname(dist_info_path)
+        try:
+            with open(os.path.join(dist_info_path, "RECORD"), 'r', encoding='utf-8', newline='') as f:
+                rows = list(csv.reader(f))
+        except OSError:
+            continue
+        for row in rows:
+            if len(row) > 1 and row[0] and row[1]:
+                yield os.path.normpath(os.path.join(site_packages, row[0])), row[1]
+
+def _check_file(path, expected_hash, cached):
+    """
+    Compares one file with its RECORD hash. Returns (status, cache_entry),
+    where status is 'ok', 'cached', 'modified' or 'missing'.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing", None
+    entry = [st.st_size, st.st_mtime_ns, expected_hash]
+    if cached == entry:
+        return "cached", entry
+    algorithm = expected_hash.partition("=")[0]
+    try:
+        actual_hash = utils.record_hash_file(path, algorithm)
+    except (OSError, ValueError):
+        return "modified", None
+    if actual_hash != expected_hash:
+        return "modified", None
+    return "ok", entry
+
+def verify_environment(env_path, incremental=False, jobs=None):
+    """
+    Checks every file an environment's distributions recorded against its
+    RECORD hash, on a pool of `jobs` threads.
+
+    Files that match are remembered with their size and mtime; with
+    `incremental`, files whose size and mtime are unchanged since then
+    are not hashed again.
+    Returns {'checked', 'skipped', 'modified', 'missing'}, with the
+    offending paths in the last two.
+    """
+    cache_path = get_verify_cache_path(env_path)
+    cache = metadata.read_json(cache_path, {}) if incremental else {}
+    files = list(iter_recorded_files(env_path))
+
+    with ThreadPoolExecutor(max_workers=jobs or scanner.get_default_jobs()) as executor:
+        results = list(executor.map(lambda item: _check_file(item[0], item[1], cache.get(item[0])), files))
+
+    report = {"checked": 0, "skipped": 0, "modified": [], "missing": []}
+    verified = {}
+    for (path, _), (status, entry) in zip(files, results):
+        if status in ("modified", "missing"):
+            report[status].append(path)
+            continue
+        report["skipped" if status == "cached" else "checked"] += 1
+        verified[path] = entry
+    try:
+        metadata.write_json(cache_path, verified)
+    except OSError:
+        pass
+    return report
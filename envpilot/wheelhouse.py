@@ -0,0 +1,241 @@
+import io
+import os
+import re
+import csv
+import zipfile
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from . import scanner
+from . import metadata
+from . import utils
+
+# Files pip writes at install time; they are not part of a wheel
+INSTALL_ONLY_FILES = {"INSTALLER", "REQUESTED", "direct_url.json", "RECORD"}
+
+def get_wheelhouse_dir():
+    """Returns the local wheelhouse directory used for offline installs."""
+    return os.path.join(metadata.get_cache_dir(), "wheelhouse")
+
+def get_pip_install_options(offline=False):
+    """
+    Returns the extra `pip install` arguments that use the wheelhouse.
+    Offline installs only look there; otherwise it is an extra source,
+    if it exists.
+    """
+    wheelhouse_dir = get_wheelhouse_dir()
+    if offline:
+        return ["--no-index", "--find-links", wheelhouse_dir]
+    if os.path.isdir(wheelhouse_dir):
+        return ["--find-links", wheelhouse_dir]
+    return []
+
+def _escape(component):
+    """Escapes a name or version for use in a wheel filename."""
+    return re.sub(r"[^\w\d.]+", "_", component, flags=re.UNICODE)
+
+def _read_wheel_tags(dist_info_path):
+    """Returns the compressed tag triple ('py3-none-any') from a WHEEL file, or None."""
+    tags = []
+    try:
+        with open(os.path.join(dist_info_path, "WHEEL"), 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith("Tag:"):
+                    tags.append(line[4:].strip().split("-"))
+    except OSError:
+        return None
+    if not tags:
+        return None
+    # e.g. py2-none-any + py3-none-any -> py2.py3-none-any
+    parts = []
+    for position in range(3):
+        values = []
+        for tag in tags:
+            if tag[position] not in values:
+                values.append(tag[position])
+        parts.append(".".join(values))
+    return "-".join(parts)
+
+def _read_entry_point_scripts(dist_info_path):
+    """Returns the names of the console and GUI scripts pip generates for a distribution."""
+    parser = configparser.ConfigParser(interpolation=None, delimiters=("=",))
+    parser.optionxform = str
+    try:
+        parser.read(os.path.join(dist_info_path, "entry_points.txt"), encoding='utf-8')
+    except configparser.Error:
+        return set()
+    names = set()
+    for section in ("console_scripts", "gui_scripts"):
+        if parser.has_section(section):
+            names.update(parser.options(section))
+    return names
+
+def _is_editable(dist_info_path):
+    direct_url = metadata.read_json(os.path.join(dist_info_path, "direct_url.json"), {})
+    return isinstance(direct_url, dict) and direct_url.get("dir_info", {}).get("editable", False)
+
+def _archive_path(relative_path, data_dir, entry_scripts):
+    """
+    Maps a RECORD path (relative to site-packages) to its place in the wheel.
+    Returns None for files that must not be packed.
+    """
+    parts = relative_path.replace("\\", "/").split("/")
+    if "__pycache__" in parts or relative_path.endswith(".pyc"):
+        return None
+    if parts[0] != "..":
+        return "/".join(parts)
+
+    # Outside site-packages: climb to the environment prefix (lib/pythonX.Y/site-packages)
+    while parts and parts[0] == "..":
+        parts.pop(0)
+    if not parts:
+        return None
+    if parts[0] in ("bin", "Scripts"):
+        name = parts[-1]
+        if name in entry_scripts or os.path.splitext(name)[0] in entry_scripts:
+            # Regenerated by the installer from entry_points.txt
+            return None
+        return f"{data_dir}/scripts/{'/'.join(parts[1:])}"
+    if parts[0] == "include":
+        # Installed as include/site/pythonX.Y/<name>/<header>
+        return f"{data_dir}/headers/{'/'.join(parts[4:] or parts[-1:])}"
+    return f"{data_dir}/data/{'/'.join(parts)}"
+
+def build_wheel(dist_info_path, output_dir):
+    """
+    Repacks an installed distribution into a wheel from its RECORD file.
+
+    Every recorded file is checked against its RECORD hash, so a package
+    that was modified after installation is never packed. Bytecode, install
+    markers and generated entry-point scripts are left out, and script
+    shebangs are restored to the portable '#!python' form.
+    Returns (wheel_path, error); an existing wheel is reused.
+    """
+    name, version = scanner.read_distribution(dist_info_path)
+    if not name or not dist_info_path.endswith(".dist-info"):
+        return None, f"{dist_info_path} is not a dist-info directory."
+    if _is_editable(dist_info_path):
+        return None, f"{name} is an editable install."
+    tags = _read_wheel_tags(dist_info_path)
+    if tags is None:
+        return None, f"{name} has no WHEEL tags."
+
+    wheel_name = f"{_escape(name)}-{_escape(version)}-{tags}.whl"
+    wheel_path = os.path.join(output_dir, wheel_name)
+    if os.path.exists(wheel_path):
+        return wheel_path, None
+
+    site_packages = os.path.dirname(dist_info_path)
+    dist_info_name = os.path.basename(dist_info_path)
+    data_dir = f"{_escape(name)}-{_escape(version)}.data"
+    entry_scripts = _read_entry_point_scripts(dist_info_path)
+    try:
+        with open(os.path.join(dist_info_path, "RECORD"), 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+    except OSError as e:
+        return None, f"Could not read the RECORD of {name}: {e}"
+
+    os.makedirs(output_dir, exist_ok=True)
+    temp_path = wheel_path + ".part"
+    records = []
+    try:
+        with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as wheel:
+            for row in rows:
+                if not row or not row[0]:
+                    continue
+                relative_path, expected_hash = row[0], row[1] if len(row) > 1 else ""
+                if relative_path.startswith(dist_info_name + "/") and relative_path.split("/", 1)[1] in INSTALL_ONLY_FILES:
+                    continue
+                archive_path = _archive_path(relative_path, data_dir, entry_scripts)
+                if archive_path is None:
+                    continue
+                file_path = os.path.normpath(os.path.join(site_packages, relative_path))
+                with open(file_path, 'rb') as source:
+                    data = source.read()
+                if expected_hash and utils.record_hash(data) != expected_hash:
+                    raise ValueError(f"{relative_path} does not match its RECORD hash")
+                if archive_path.startswith(data_dir + "/scripts/") and data.startswith(b"#!") and b"python" in data.split(b"\n", 1)[0]:
+                    data = b"#!python" + data[data.index(b"\n"):]
+                info = zipfile.ZipInfo(archive_path, date_time=(1980, 1, 1, 0, 0, 0))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = (os.stat(file_path).st_mode & 0o777) << 16
+                wheel.writestr(info, data)
+                records.append([archive_path, utils.record_hash(data), str(len(data))])
+
+            records.append([f"{dist_info_name}/RECORD", "", ""])
+            record = io.StringIO()
+            csv.writer(record, lineterminator="\n").writerows(records)
+            wheel.writestr(zipfile.ZipInfo(f"{dist_info_name}/RECORD", date_time=(1980, 1, 1, 0, 0, 0)), record.getvalue())
+        os.replace(temp_path, wheel_path)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return None, f"Could not rebuild a wheel for {name}: {e}"
+    return wheel_path, None
+
+def list_distributions(env_path):
+    """Returns the .dist-info directories installed in an environment."""
+    dist_infos = []
+    for site_packages in scanner.get_site_packages_dirs(env_path):
+        try:
+            entries = sorted(os.scandir(site_packages), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        dist_infos.extend(entry.path for entry in entries if entry.name.endswith(".dist-info"))
+    return dist_infos
+
+def collect_wheels(env_paths, jobs=None, output_dir=None):
+    """
+    Adds a wheel for every distribution installed in `env_paths` to the
+    wheelhouse, rebuilding them on a pool of `jobs` threads. Distributions
+    that already have a wheel there are skipped.
+    Returns (built_wheel_paths, errors).
+    """
+    output_dir = output_dir or get_wheelhouse_dir()
+    existing = set(os.listdir(output_dir)) if os.path.isdir(output_dir) else set()
+
+    # Several environments usually share the same distribution versions; the
+    # same version built for another Python or platform is a separate wheel
+    pending = {}
+    for env_path in env_paths:
+        for dist_info_path in list_distributions(env_path):
+            key = (os.path.basename(dist_info_path).lower(), _read_wheel_tags(dist_info_path))
+            pending.setdefault(key, dist_info_path)
+
+    with ThreadPoolExecutor(max_workers=jobs or scanner.get_default_jobs()) as executor:
+        results = list(executor.map(lambda path: build_wheel(path, output_dir), pending.values()))
+
+    built = []
+    errors = []
+    for wheel_path, error in results:
+        if error:
+            errors.append(error)
+        elif os.path.basename(wheel_path) not in existing:
+            built.append(wheel_path)
+    return built, errors
+
+def _archive_hash(dist_info_path):
+    """Returns the 'sha256:<hex>' of the archive a distribution was installed from, if pip recorded it."""
+    direct_url = metadata.read_json(os.path.join(dist_info_path, "direct_url.json"), {})
+    archive_info = direct_url.get("archive_info", {}) if isinstance(direct_url, dict) else {}
+    sha256 = archive_info.get("hashes", {}).get("sha256")
+    if sha256:
+        return "sha256:" + sha256
+    return None
+
+def get_package_hashes(env_path):
+    """
+    Returns {name: 'sha256:<hex>'} hashes for an environment's distributions,
+    keyed like `scanner.read_installed_packages`. Only distributions whose
+    archive hash pip recorded at install time are included: a wheel rebuilt
+    from RECORD never matches the original archive byte for byte, so its
+    hash could not be verified anywhere else.
+    """
+    hashes = {}
+    for dist_info_path in list_distributions(env_path):
+        name, _ = scanner.read_distribution(dist_info_path)
+        archive_hash = _archive_hash(dist_info_path)
+        if name and archive_hash:
+            hashes[name.lower()] = archive_hash
+    return hashes